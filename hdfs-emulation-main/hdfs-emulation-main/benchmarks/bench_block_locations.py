@@ -0,0 +1,64 @@
+# Measures the namenode time and response size of get_block_locations on one
+# large file, for the whole file as open used to request it and for the
+# READ_PREFETCH_SIZE window open now requests, at the start and end of the file.
+#   python3 benchmarks/bench_block_locations.py [number of blocks]
+
+import asyncio
+import json
+import os
+import sys
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from edfs.block_manager import BlockManager
+from edfs.config import *
+from edfs.datanode_info import DataNodeManager
+from edfs.edfs_namenode import EDFSNameNode
+from edfs.inode import Inode
+from edfs.inode_manager import InodeManager
+
+REPEAT = 20
+
+
+def create_namenode(num_blocks):
+    namenode = EDFSNameNode.__new__(EDFSNameNode)
+    namenode.bm = BlockManager(None)
+    namenode.im = InodeManager(None, namenode.bm)
+    namenode.dnm = DataNodeManager()
+    datanodes = [namenode.dnm.register(LOCAL_HOST, port, name) for port, name in [(DATANODE_A_PORT, "A"), (DATANODE_B_PORT, "B"), (DATANODE_C_PORT, "C")]]
+    root = Inode(INODE_ID_START, DIR_TYPE, ROOT_DIR_NAME)
+    namenode.im.add_inode(root)
+    inode = namenode.im.create_file(root, "big.dat")
+    for i in range(num_blocks):
+        blk = namenode.bm.allocate_block_for(inode.get_id(), DEFAULT_BLOCK_SZIE)
+        namenode.im.add_block_to(inode.get_id(), blk.get_id())
+        for datanode_info in datanodes[:REPLICATION_FACTOR]:
+            blk.add_loc(datanode_info.get_id())
+    return namenode
+
+
+async def bench(namenode, request):
+    start = time.perf_counter()
+    for _ in range(REPEAT):
+        response = await namenode.get_block_locations(request)
+    elapsed = (time.perf_counter() - start) / REPEAT
+    return elapsed, len(json.dumps(response))
+
+
+async def main():
+    num_blocks = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    namenode = create_namenode(num_blocks)
+    file_length = num_blocks * DEFAULT_BLOCK_SZIE
+    print(f'{num_blocks} blocks, window of {READ_PREFETCH_SIZE} bytes')
+    for label, request in [
+        ("whole file", {"path": "/big.dat"}),
+        ("window at start", {"path": "/big.dat", "offset": 0, "length": READ_PREFETCH_SIZE}),
+        ("window at end", {"path": "/big.dat", "offset": file_length - READ_PREFETCH_SIZE, "length": READ_PREFETCH_SIZE}),
+    ]:
+        elapsed, size = await bench(namenode, request)
+        print(f'{label:>16}: {elapsed * 1e3:9.3f} ms, {size:>10} bytes')
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
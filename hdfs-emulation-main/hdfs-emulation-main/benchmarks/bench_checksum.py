@@ -0,0 +1,49 @@
+# Measures the cost of per-chunk checksums on a block, computed and verified in
+# one batch per buffer as the write and read paths do, against one CRC32 over
+# the whole buffer (the floor) and a plain copy of it.
+#   python3 benchmarks/bench_checksum.py [block size in MiB]
+
+import os
+import sys
+import time
+import zlib
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from edfs.config import *
+from edfs.data_checksum import DataChecksum
+
+REPEAT = 5
+PACKET_SIZE = 64 * 1024
+
+
+def timed(fn):
+    best = None
+    for _ in range(REPEAT):
+        start = time.perf_counter()
+        fn()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main():
+    block_size = (int(sys.argv[1]) if len(sys.argv) > 1 else 64) * 1024 * 1024
+    data = os.urandom(block_size)
+    checksums = DataChecksum.compute(data)
+    view = memoryview(data)
+
+    results = [
+        ("copy", timed(lambda: bytearray(data))),
+        ("crc32 whole buffer", timed(lambda: zlib.crc32(data))),
+        ("compute, whole block", timed(lambda: DataChecksum.compute(data))),
+        ("verify, whole block", timed(lambda: DataChecksum.verify(data, checksums))),
+        (f'compute, {PACKET_SIZE // 1024} KiB packets', timed(lambda: [DataChecksum.compute(view[i: i + PACKET_SIZE]) for i in range(0, block_size, PACKET_SIZE)])),
+    ]
+    print(f'{block_size // (1024 * 1024)} MiB block, {BYTES_PER_CHECKSUM} bytes per checksum')
+    for label, elapsed in results:
+        print(f'{label:>26} {block_size / elapsed / (1024 * 1024):10.0f} MiB/s')
+
+
+if __name__ == "__main__":
+    main()
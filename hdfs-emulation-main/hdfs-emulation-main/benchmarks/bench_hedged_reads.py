@@ -0,0 +1,92 @@
+# Measures the latency of reading a one block file against a namenode and three
+# datanodes on localhost, each in its own process, while datanode A delays a given
+# fraction of its read requests, with the given hedged read threshold (0 disables),
+# for one client reading repeatedly and for a new client per read, which picks a
+# replica at random as it has no measurements yet.
+#   python3 benchmarks/bench_hedged_reads.py [slow fraction] [delay in ms] [hedge threshold in ms]
+
+import asyncio
+import multiprocessing
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# the threshold has to be set before the modules copy it from the config
+import edfs.config
+if len(sys.argv) > 3:
+    edfs.config.HEDGED_READ_THRESHOLD = float(sys.argv[3]) / 1000
+
+from edfs.config import *
+from edfs.edfs_client import EDFSClient
+from edfs.replica_scorer import ReplicaScorer
+from cluster import start_cluster, stop_cluster
+
+READS = 500
+
+
+# datanode A delays a fraction of the read requests it gets
+def delay_reads(datanode, slow_fraction, delay):
+    handle_request = datanode.handle_request
+
+    async def delay_read(reader, writer, request):
+        if request.get("cmd") == CLI_DATANODE_CMD_READ and random.random() < slow_fraction:
+            await asyncio.sleep(delay)
+        await handle_request(reader, writer, request)
+
+    datanode.handle_request = delay_read
+
+
+async def bench(new_client):
+    sys.stdout = open(os.devnull, "w")
+    client = await EDFSClient.create()
+    elapsed = []
+    for _ in range(READS):
+        if new_client:
+            client.dfs.replica_scorer = ReplicaScorer()
+        start = time.perf_counter()
+        in_stream = await client.dfs.open("/bench.dat")
+        while (await in_stream.read(bytearray([]))) > 0:
+            continue
+        in_stream.close()
+        elapsed.append(time.perf_counter() - start)
+    client.close()
+    sys.stdout = sys.__stdout__
+    elapsed.sort()
+    return elapsed[len(elapsed) // 2], elapsed[len(elapsed) * 99 // 100]
+
+
+async def put():
+    with open("local.dat", "wb") as f:
+        f.write(os.urandom(DEFAULT_BLOCK_SZIE))
+
+    sys.stdout = open(os.devnull, "w")
+    client = await EDFSClient.create()
+    await client.put("local.dat", "/bench.dat")
+    client.close()
+    sys.stdout = sys.__stdout__
+
+
+def main():
+    slow_fraction = float(sys.argv[1]) if len(sys.argv) > 1 else 0.1
+    delay = (float(sys.argv[2]) if len(sys.argv) > 2 else 200) / 1000
+    processes = start_cluster({"A": lambda datanode: delay_reads(datanode, slow_fraction, delay)})
+
+    try:
+        asyncio.run(put())
+        print(f'A delays {slow_fraction:.0%} of reads by {delay * 1e3:.0f} ms, hedge after {HEDGED_READ_THRESHOLD * 1e3:.0f} ms')
+        for label, new_client in [("one client", False), ("client per read", True)]:
+            p50, p99 = asyncio.run(bench(new_client))
+            print(f'{label:>16}: p50 {p50 * 1e3:.1f} ms, p99 {p99 * 1e3:.1f} ms')
+    finally:
+        stop_cluster(processes)
+
+
+if __name__ == "__main__":
+    multiprocessing.set_start_method("fork")
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        os.chdir(tmp_dir)
+        main()
@@ -0,0 +1,56 @@
+# Measures per-operation cost of directory lookup, create and delete as the
+# directory grows. With hash-indexed children all three should stay flat.
+#   python3 benchmarks/bench_inode_dir.py
+
+import os
+import sys
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from edfs.block_manager import BlockManager
+from edfs.config import *
+from edfs.inode_manager import InodeManager
+
+SIZES = [1000, 10000, 100000, 300000]
+NUM_OPS = 2000
+
+
+def empty_fsimage():
+    return {"inodes": [{"id": INODE_ID_START, "type": DIR_TYPE, "name": ROOT_DIR_NAME}], "directories": [], "freeBlocks": []}
+
+
+def bench(size):
+    fsimage = empty_fsimage()
+    bm = BlockManager(fsimage)
+    im = InodeManager(fsimage, bm)
+    big_dir = im.create_dir(im.root_inode, "big")
+    for i in range(size):
+        im.create_file(big_dir, f'f{i}')
+
+    start = time.perf_counter()
+    for i in range(NUM_OPS):
+        im.get_inode_from_path(f'/big/f{(i * 7919) % size}')
+    lookup = (time.perf_counter() - start) / NUM_OPS
+
+    start = time.perf_counter()
+    new_inodes = [im.create_file(big_dir, f'new{i}') for i in range(NUM_OPS)]
+    create = (time.perf_counter() - start) / NUM_OPS
+
+    start = time.perf_counter()
+    for inode in new_inodes:
+        im.rm(inode)
+    delete = (time.perf_counter() - start) / NUM_OPS
+
+    return lookup, create, delete
+
+
+def main():
+    print(f'{"entries":>10} {"lookup (us)":>12} {"create (us)":>12} {"delete (us)":>12}')
+    for size in SIZES:
+        lookup, create, delete = bench(size)
+        print(f'{size:>10} {lookup * 1e6:>12.2f} {create * 1e6:>12.2f} {delete * 1e6:>12.2f}')
+
+
+if __name__ == "__main__":
+    main()
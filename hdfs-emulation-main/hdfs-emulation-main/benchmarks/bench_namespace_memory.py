@@ -0,0 +1,95 @@
+# Reports heap bytes per inode and per block for a namespace of small files,
+# using the previous dict-based objects (DirEnt lists with '.' and '..'
+# entries, plain lists of block ids and locations) as the baseline.
+#   python3 benchmarks/bench_namespace_memory.py [number of files]
+
+import os
+import sys
+import tracemalloc
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from edfs.block import Block
+from edfs.config import *
+from edfs.inode import Inode
+
+FILES_PER_DIR = 1000
+BLOCKS_PER_FILE = 2
+REPLICAS = [1, 2, 3]
+
+
+class LegacyInode:
+    def __init__(self, id, type, name, replication=0, preferredBlockSize=0, blocks=None):
+        self.id = id
+        self.type = type
+        self.name = name
+        self.replication = replication
+        self.preferredBlockSize = preferredBlockSize
+        self.blocks = blocks if blocks is not None else []
+        self.dir_entries = [LegacyDirEnt(self, ".")]
+
+    def add_child(self, inode):
+        self.dir_entries.append(LegacyDirEnt(inode, inode.name))
+        inode.dir_entries.append(LegacyDirEnt(self, ".."))
+
+
+class LegacyDirEnt:
+    def __init__(self, inode, name):
+        self.inode = inode
+        self.name = name
+
+
+class LegacyBlock:
+    def __init__(self, block_id, inode_id, num_bytes, locations=None):
+        self.id = block_id
+        self.inode_id = inode_id
+        self.num_bytes = num_bytes
+        self.locs = locations if locations != None else []
+
+
+def build(inode_cls, block_cls, num_files):
+    next_block_id = BLOCK_ID_START
+    root = inode_cls(INODE_ID_START, DIR_TYPE, ROOT_DIR_NAME)
+    inodes, blocks = [root], []
+    for i in range(num_files):
+        if i % FILES_PER_DIR == 0:
+            directory = inode_cls(INODE_ID_START + len(inodes), DIR_TYPE, f'dir{i // FILES_PER_DIR}')
+            root.add_child(directory)
+            inodes.append(directory)
+        block_ids = []
+        for _ in range(BLOCKS_PER_FILE):
+            next_block_id += 1
+            blocks.append(block_cls(next_block_id, INODE_ID_START + len(inodes), DEFAULT_BLOCK_SZIE, list(REPLICAS)))
+            block_ids.append(next_block_id)
+        # names repeat across directories, as with part-NNNNN files
+        name = "".join(["part-", f'{i % FILES_PER_DIR:05d}'])
+        inode = inode_cls(INODE_ID_START + len(inodes), FILE_TYPE, name, REPLICATION_FACTOR, DEFAULT_BLOCK_SZIE, block_ids)
+        directory.add_child(inode)
+        inodes.append(inode)
+    return inodes, blocks
+
+
+def measure(inode_cls, block_cls, num_files):
+    tracemalloc.start()
+    inodes, blocks = build(inode_cls, block_cls, num_files)
+    inode_bytes = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    tracemalloc.start()
+    block_only = [block_cls(BLOCK_ID_START + i, INODE_ID_START, DEFAULT_BLOCK_SZIE, list(REPLICAS)) for i in range(len(blocks))]
+    block_bytes = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    return len(inodes), (inode_bytes - block_bytes) / len(inodes), block_bytes / len(block_only)
+
+
+def main():
+    num_files = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    print(f'{"":>10} {"inodes":>10} {"bytes/inode":>12} {"bytes/block":>12}')
+    for label, inode_cls, block_cls in [("before", LegacyInode, LegacyBlock), ("after", Inode, Block)]:
+        num_inodes, per_inode, per_block = measure(inode_cls, block_cls, num_files)
+        print(f'{label:>10} {num_inodes:>10} {per_inode:>12.1f} {per_block:>12.1f}')
+
+
+if __name__ == "__main__":
+    main()
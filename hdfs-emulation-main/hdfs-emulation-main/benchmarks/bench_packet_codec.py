@@ -0,0 +1,58 @@
+# Measures the CPU cost of encoding and decoding one write-pipeline packet and
+# its ack, comparing the old JSON-with-text-payload packets with the binary
+# header and raw payload.
+#   python3 benchmarks/bench_packet_codec.py
+
+import json
+import os
+import sys
+import time
+import zlib
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from edfs.config import *
+from edfs.dfs_packet import DFSPacket
+from edfs.utils import PacketUtils
+
+NUM_PACKETS = 100000
+NEXT_DATANODES = [{"ip": LOCAL_HOST, "port": DATANODE_B_PORT, "name": "B"}, {"ip": LOCAL_HOST, "port": DATANODE_C_PORT, "name": "C"}]
+
+
+def bench_json(data):
+    text = data.decode()
+    start = time.perf_counter()
+    for seqno in range(NUM_PACKETS):
+        buf = {"seqno": seqno, "data": text, "is_last_packet_in_block": False, "block_id": BLOCK_ID_START, "next_datanodes": NEXT_DATANODES}
+        packet = PacketUtils.encode(json.dumps(buf).encode())
+        decoded = json.loads(PacketUtils.decode(packet).decode())
+        decoded.get("data")
+        ack = PacketUtils.encode(json.dumps({"type": "ack", "seqno": seqno}).encode())
+        json.loads(PacketUtils.decode(ack).decode()).get("seqno")
+    return (time.perf_counter() - start) / NUM_PACKETS
+
+
+def bench_binary(data):
+    start = time.perf_counter()
+    for seqno in range(NUM_PACKETS):
+        packet = DFSPacket(data, False)
+        packet.seqno = seqno
+        header = packet.get_header()
+        _, _, data_len, _, checksum = DFSPacket.HEADER.unpack(header)
+        zlib.crc32(data) == checksum
+        ack = DFSPacket.ACK.pack(seqno, ACK_SUCCESS)
+        DFSPacket.ACK.unpack(ack)
+    return (time.perf_counter() - start) / NUM_PACKETS
+
+
+def main():
+    data = b"abcdefghij\n" * (DEFAULT_PACKET_DATA_SIZE // 11) + b"x" * (DEFAULT_PACKET_DATA_SIZE % 11)
+    json_time = bench_json(data)
+    binary_time = bench_binary(data)
+    print(f'{DEFAULT_PACKET_DATA_SIZE} byte packets')
+    print(f'json   {json_time * 1e6:8.2f} us/packet')
+    print(f'binary {binary_time * 1e6:8.2f} us/packet (including crc32)')
+
+
+if __name__ == "__main__":
+    main()
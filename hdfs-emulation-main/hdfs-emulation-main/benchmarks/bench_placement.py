@@ -0,0 +1,77 @@
+# Measures the namenode cost of choosing the targets of a new block for growing
+# cluster sizes, and how evenly blocks spread when one datanode is busy and one
+# is nearly full, with the random and the weighted placement policies.
+#   python3 benchmarks/bench_placement.py
+
+import os
+import sys
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import edfs.block_placement_policy as block_placement_policy
+from edfs.block_placement_policy import BlockPlacementPolicy
+from edfs.config import *
+from edfs.datanode_info import DataNodeManager
+
+NUM_CHOICES = 20000
+NUM_RACKS = 20
+CAPACITY = 1 << 40
+
+
+def create_cluster(policy_name, num_datanodes):
+    dnm = DataNodeManager()
+    block_placement_policy.DATANODE_RACKS = {f'dn{i}': f'/rack{i % NUM_RACKS}' for i in range(num_datanodes)}
+    policy = BlockPlacementPolicy.create(policy_name, dnm)
+    for i in range(num_datanodes):
+        datanode_info = dnm.register(f'10.0.{i // 256}.{i % 256}', DATANODE_A_PORT, f'dn{i}')
+        datanode_info.update_heartbeat(CAPACITY, 0, CAPACITY, 0)
+        policy.update_datanode(datanode_info)
+    return dnm, policy
+
+
+def bench_choose(policy_name, num_datanodes):
+    dnm, policy = create_cluster(policy_name, num_datanodes)
+    start = time.perf_counter()
+    for _ in range(NUM_CHOICES):
+        policy.choose_targets(REPLICATION_FACTOR, "10.0.0.1")
+    return (time.perf_counter() - start) / NUM_CHOICES
+
+
+# share of the blocks placed on the busy and on the nearly full datanode
+def bench_spread(policy_name, num_datanodes):
+    dnm, policy = create_cluster(policy_name, num_datanodes)
+    datanodes = dnm.get_all_datanodes()
+    busy, full = datanodes[0], datanodes[1]
+    busy.update_heartbeat(CAPACITY, 0, CAPACITY, 20)
+    full.update_heartbeat(CAPACITY, CAPACITY - CAPACITY // 100, CAPACITY // 100, 0)
+    for datanode_info in datanodes:
+        policy.update_datanode(datanode_info)
+
+    counts = {busy.get_id(): 0, full.get_id(): 0}
+    for _ in range(NUM_CHOICES):
+        for datanode_info in policy.choose_targets(1):
+            if datanode_info.get_id() in counts:
+                counts[datanode_info.get_id()] += 1
+            # the block is written at once, so it no longer counts as scheduled
+            datanode_info.decr_blocks_scheduled()
+            policy.update_datanode(datanode_info)
+    return counts[busy.get_id()] / NUM_CHOICES, counts[full.get_id()] / NUM_CHOICES
+
+
+def main():
+    print(f'{"datanodes":>10} {"random us":>10} {"weighted us":>12}')
+    for num_datanodes in [10, 100, 1000, 10000]:
+        random_time = bench_choose("random", num_datanodes)
+        weighted_time = bench_choose("weighted", num_datanodes)
+        print(f'{num_datanodes:>10} {random_time * 1e6:>10.2f} {weighted_time * 1e6:>12.2f}')
+
+    num_datanodes = 10
+    print(f'\nshare of new blocks on {num_datanodes} datanodes, fair share {1 / num_datanodes:.3f}')
+    for policy_name in ["random", "weighted"]:
+        busy_share, full_share = bench_spread(policy_name, num_datanodes)
+        print(f'{policy_name:>8}: busy datanode {busy_share:.3f}, 99% full datanode {full_share:.3f}')
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+# Measures reading the footer and a few column chunks of a file, the access
+# pattern of columnar file readers, against a namenode and three datanodes on
+# localhost, each in its own process: by scanning the file from the start, by
+# seeking before each read, and with concurrent preads.
+#   python3 benchmarks/bench_pread.py [file size in KiB] [block size in KiB] [chunks] [chunk size in KiB]
+
+import asyncio
+import multiprocessing
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# the block size has to be set before the modules copy it from the config
+import edfs.config
+if len(sys.argv) > 2:
+    edfs.config.DEFAULT_BLOCK_SZIE = int(sys.argv[2]) * 1024
+    edfs.config.READ_PREFETCH_SIZE = 10 * edfs.config.DEFAULT_BLOCK_SZIE
+
+from edfs.config import *
+from edfs.edfs_client import EDFSClient
+from cluster import start_cluster, stop_cluster
+
+REPEAT = 3
+FOOTER_SIZE = 64 * 1024
+
+
+async def read_range(in_stream, offset, length):
+    in_stream.seek(offset)
+    buf = bytearray([])
+    while len(buf) < length and (await in_stream.read(buf)) > 0:
+        continue
+    return bytes(buf[:length])
+
+
+async def scan(in_stream, ranges):
+    buf = bytearray([])
+    while (await in_stream.read(buf)) > 0:
+        continue
+    return [bytes(buf[offset: offset + length]) for offset, length in ranges]
+
+
+async def seek_and_read(in_stream, ranges):
+    return [await read_range(in_stream, offset, length) for offset, length in ranges]
+
+
+async def pread(in_stream, ranges):
+    return await asyncio.gather(*[in_stream.pread(offset, length) for offset, length in ranges])
+
+
+async def bench(size, ranges):
+    with open("local.dat", "wb") as f:
+        f.write(os.urandom(size))
+    with open("local.dat", "rb") as f:
+        data = f.read()
+
+    sys.stdout = open(os.devnull, "w")
+    client = await EDFSClient.create()
+    await client.put("local.dat", "/bench.dat")
+    results = []
+    for label, read in [("scan", scan), ("seek and read", seek_and_read), ("pread", pread)]:
+        elapsed = []
+        for _ in range(REPEAT):
+            in_stream = await client.dfs.open("/bench.dat")
+            start = time.perf_counter()
+            chunks = await read(in_stream, ranges)
+            elapsed.append(time.perf_counter() - start)
+            in_stream.close()
+            if chunks != [data[offset: offset + length] for offset, length in ranges]:
+                raise IOError(f'{label} read different bytes than were written')
+        results.append((label, min(elapsed)))
+    client.close()
+    sys.stdout = sys.__stdout__
+    return results
+
+
+def main():
+    size = (int(sys.argv[1]) if len(sys.argv) > 1 else 16384) * 1024
+    num_chunks = int(sys.argv[3]) if len(sys.argv) > 3 else 8
+    chunk_size = (int(sys.argv[4]) if len(sys.argv) > 4 else 128) * 1024
+    ranges = [(size - FOOTER_SIZE, FOOTER_SIZE)] + [(random.randrange(size - FOOTER_SIZE - chunk_size), chunk_size) for _ in range(num_chunks)]
+
+    processes = start_cluster()
+
+    try:
+        print(f'footer and {num_chunks} chunks of {chunk_size // 1024} KiB of a {size // 1024} KiB file in blocks of {DEFAULT_BLOCK_SZIE} bytes')
+        for label, elapsed in asyncio.run(bench(size, ranges)):
+            print(f'{label:>14}: {elapsed * 1e3:.1f} ms')
+    finally:
+        stop_cluster(processes)
+
+
+if __name__ == "__main__":
+    multiprocessing.set_start_method("fork")
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        os.chdir(tmp_dir)
+        main()
@@ -0,0 +1,67 @@
+# Measures get throughput against a namenode and three datanodes on localhost,
+# each in its own process as they are deployed, for a file written once and read
+# back with the given number of blocks fetched ahead.
+#   python3 benchmarks/bench_read_ahead.py [file size in KiB] [block size in KiB] [read-ahead blocks]
+
+import asyncio
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# the block size and read-ahead have to be set before the modules copy them from the config
+import edfs.config
+if len(sys.argv) > 2:
+    edfs.config.DEFAULT_BLOCK_SZIE = int(sys.argv[2]) * 1024
+    edfs.config.READ_PREFETCH_SIZE = 10 * edfs.config.DEFAULT_BLOCK_SZIE
+if len(sys.argv) > 3:
+    edfs.config.READ_AHEAD_BLOCKS = int(sys.argv[3])
+
+from edfs.config import *
+from edfs.edfs_client import EDFSClient
+from cluster import start_cluster, stop_cluster
+
+REPEAT = 3
+
+
+async def bench(size):
+    with open("local.dat", "wb") as f:
+        f.write(os.urandom(size))
+
+    sys.stdout = open(os.devnull, "w")
+    client = await EDFSClient.create()
+    await client.put("local.dat", "/bench.dat")
+    client.close()
+    elapsed = []
+    for i in range(REPEAT):
+        client = await EDFSClient.create()
+        start = time.perf_counter()
+        await client.get("/bench.dat", f'bench{i}.dat')
+        elapsed.append(time.perf_counter() - start)
+        client.close()
+    sys.stdout = sys.__stdout__
+    with open("local.dat", "rb") as f, open("bench0.dat", "rb") as g:
+        if f.read() != g.read():
+            raise IOError("the file read back differs from the file written")
+    return min(elapsed)
+
+
+def main():
+    size = (int(sys.argv[1]) if len(sys.argv) > 1 else 1024) * 1024
+    processes = start_cluster()
+
+    try:
+        best = asyncio.run(bench(size))
+        print(f'{size // 1024} KiB in blocks of {DEFAULT_BLOCK_SZIE} bytes, {READ_AHEAD_BLOCKS} blocks ahead: {best * 1e3:.1f} ms, {size / best / 1024 / 1024:.2f} MiB/s')
+    finally:
+        stop_cluster(processes)
+
+
+if __name__ == "__main__":
+    multiprocessing.set_start_method("fork")
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        os.chdir(tmp_dir)
+        main()
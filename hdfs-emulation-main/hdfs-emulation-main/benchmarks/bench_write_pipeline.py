@@ -0,0 +1,60 @@
+# Measures put throughput against a namenode and three datanodes on localhost,
+# each in its own process as they are deployed, keeping their metadata and
+# blocks in a temporary directory.
+#   python3 benchmarks/bench_write_pipeline.py [file size in KiB] [block size in KiB] [put parallelism]
+
+import asyncio
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# the block size and parallelism have to be set before the modules copy them from the config
+import edfs.config
+if len(sys.argv) > 2:
+    edfs.config.DEFAULT_BLOCK_SZIE = int(sys.argv[2]) * 1024
+if len(sys.argv) > 3:
+    edfs.config.PUT_PARALLELISM = int(sys.argv[3])
+
+from edfs.config import *
+from edfs.edfs_client import EDFSClient
+from cluster import start_cluster, stop_cluster
+
+REPEAT = 3
+
+
+async def bench(size):
+    with open("local.dat", "wb") as f:
+        f.write(os.urandom(size))
+
+    sys.stdout = open(os.devnull, "w")
+    elapsed = []
+    for i in range(REPEAT):
+        client = await EDFSClient.create()
+        start = time.perf_counter()
+        await client.put("local.dat", f'/bench{i}.dat')
+        elapsed.append(time.perf_counter() - start)
+        client.close()
+    sys.stdout = sys.__stdout__
+    return min(elapsed)
+
+
+def main():
+    size = (int(sys.argv[1]) if len(sys.argv) > 1 else 1024) * 1024
+    processes = start_cluster()
+
+    try:
+        best = asyncio.run(bench(size))
+        print(f'{size // 1024} KiB in blocks of {DEFAULT_BLOCK_SZIE} bytes, {PUT_PARALLELISM} at once: {best * 1e3:.1f} ms, {size / best / 1024 / 1024:.2f} MiB/s')
+    finally:
+        stop_cluster(processes)
+
+
+if __name__ == "__main__":
+    multiprocessing.set_start_method("fork")
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        os.chdir(tmp_dir)
+        main()
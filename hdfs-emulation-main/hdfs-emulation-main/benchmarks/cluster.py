@@ -0,0 +1,55 @@
+# Runs a namenode and three datanodes on localhost for the benchmarks, each in its
+# own process as they are deployed, with their output discarded. The processes are
+# forked, so import this after changing edfs.config for the nodes to see the change.
+
+import asyncio
+import multiprocessing
+import os
+import sys
+import time
+
+from edfs.config import *
+from edfs.edfs_datanode import EDFSDataNode
+from edfs.edfs_namenode import EDFSNameNode
+
+DATANODES = [(DATANODE_A_PORT, "A"), (DATANODE_B_PORT, "B"), (DATANODE_C_PORT, "C")]
+
+
+async def run_namenode():
+    namenode = EDFSNameNode()
+    await namenode.start()
+    server = await asyncio.start_server(namenode.handle_client, LOCAL_HOST, NAMENODE_PORT)
+    async with server:
+        await server.serve_forever()
+
+
+# setup is called with the datanode before it registers, to change how it behaves
+async def run_datanode(port, name, setup=None):
+    datanode = await EDFSDataNode.create_instance(LOCAL_HOST, port, name)
+    if setup:
+        setup(datanode)
+    await datanode.register()
+    await datanode.serve()
+
+
+def serve(main, *args):
+    sys.stdout = open(os.devnull, "w")
+    asyncio.run(main(*args))
+
+
+# start the namenode, then the datanodes with the setups given by name, and
+# return their processes
+def start_cluster(datanode_setups={}):
+    processes = [multiprocessing.Process(target=serve, args=(run_namenode,), daemon=True)]
+    processes[0].start()
+    time.sleep(1)
+    for port, name in DATANODES:
+        processes.append(multiprocessing.Process(target=serve, args=(run_datanode, port, name, datanode_setups.get(name)), daemon=True))
+        processes[-1].start()
+    time.sleep(1)
+    return processes
+
+
+def stop_cluster(processes):
+    for process in processes:
+        process.terminate()
@@ -1,12 +1,16 @@
+from array import array
 from edfs.config import *
 
 
 class Block:
+    __slots__ = ("id", "inode_id", "num_bytes", "locs")
+
     def __init__(self, block_id, inode_id, num_bytes, locations=None):
         self.id = block_id
         self.inode_id = inode_id
         self.num_bytes = num_bytes
-        self.locs = locations if locations != None else []
+        # ids of the datanodes holding a replica
+        self.locs = array('i', locations if locations != None else [])
 
     def get_id(self):
         return self.id
@@ -17,6 +21,9 @@ class Block:
     def get_num_bytes(self):
         return self.num_bytes
 
+    def set_num_bytes(self, num_bytes):
+        self.num_bytes = num_bytes
+
     def get_locs(self):
         return self.locs
 
@@ -26,6 +33,10 @@ class Block:
     def add_loc(self, datanonde_id):
         self.locs.append(datanonde_id)
 
+    def remove_loc(self, datanode_id):
+        if datanode_id in self.locs:
+            self.locs.remove(datanode_id)
+
 
 class LocatedBlock:
     def __init__(self, block_id, blk_locs_info):
@@ -14,9 +14,25 @@ class BlockManager:
 
     def __init__(self, fsimage):
         self.id_to_block = {}
+        # datanode id -> ids of the blocks it holds a live replica of
+        self.datanode_blocks = {}
         self.last_block_id = BLOCK_ID_START
         self.free_block_ids = deque([])
-        self.build_blocks(fsimage)
+        # block id -> ids of the datanodes holding a corrupt replica of it
+        self.corrupt_replicas = {}
+        # block id -> ids of the datanodes that still have to delete a replica of
+        # it; the id is only recycled once all of them have confirmed
+        self.pending_deletes = {}
+        # datanode id -> block ids to send to it for deletion
+        self.invalidate_queues = {}
+        # blocks whose replicas changed, checked against their replication by the
+        # replication monitor
+        self.replication_checks = set()
+        # block id -> [time scheduled, source datanode id, target datanode ids] of a
+        # transfer, checked again if it does not complete in time
+        self.pending_replications = {}
+        if fsimage is not None:
+            self.build_blocks(fsimage)
 
     def build_blocks(self, fsimage):
         inodes = fsimage.get("inodes")
@@ -27,27 +43,125 @@ class BlockManager:
             for block in blocks:
                 blk = Block(block.get("id"), inode_id, block.get("numBytes"), [])
                 self.register_block(blk)
-        free_blocks = fsimage.get("freeBlocks")
-        self.free_block_ids += free_blocks
+        self.add_free_block_ids(fsimage.get("freeBlocks"))
         print(f'DBG: free block ids: {self.get_free_block_ids()}')
 
     def register_block(self, block):
         self.id_to_block[block.get_id()] = block
         self.last_block_id = max(self.last_block_id, block.get_id())
 
+    def add_free_block_ids(self, block_ids):
+        self.free_block_ids += block_ids
+
     def get_block_by_id(self, id):
         return self.id_to_block.get(id)
 
+    def add_loc(self, block, datanode_id):
+        block.add_loc(datanode_id)
+        self.datanode_blocks.setdefault(datanode_id, set()).add(block.get_id())
+
+    def remove_loc(self, block, datanode_id):
+        if datanode_id in block.get_locs():
+            block.remove_loc(datanode_id)
+            self.datanode_blocks[datanode_id].discard(block.get_id())
+
     def add_block_loc(self, id, datanode_id):
+        block = self.get_block_by_id(id)
+        if not block or datanode_id in block.get_locs():
+            return
+        # corrupt replicas, and excess ones the datanode has not deleted yet
+        if datanode_id in self.corrupt_replicas.get(id, ()) or datanode_id in self.pending_deletes.get(id, ()):
+            return
+        self.add_loc(block, datanode_id)
+        pending = self.pending_replications.get(id)
+        if pending is not None:
+            pending[2].discard(datanode_id)
+            if not pending[2]:
+                del self.pending_replications[id]
+        self.replication_checks.add(id)
+
+    def mark_corrupt(self, id, datanode_id):
         block = self.get_block_by_id(id)
         if not block:
             return
-        block.add_loc(datanode_id)
+        self.remove_loc(block, datanode_id)
+        self.corrupt_replicas.setdefault(id, set()).add(datanode_id)
+        self.replication_checks.add(id)
+
+    # corrupt replicas are kept until the block has enough live replicas again,
+    # they may be all that is left of it until then
+    def invalidate_corrupt_replicas(self, id):
+        for datanode_id in self.corrupt_replicas.get(id, ()):
+            if datanode_id not in self.pending_deletes.get(id, ()):
+                self.add_invalidate(id, datanode_id)
+
+    def get_num_corrupt_replicas(self):
+        return sum(len(datanode_ids) for datanode_ids in self.corrupt_replicas.values())
+
+    # replicas of unknown blocks are left over from deleted files
+    def process_block_report(self, datanode_id, block_ids):
+        for block_id in block_ids:
+            if block_id in self.id_to_block:
+                self.add_block_loc(block_id, datanode_id)
+            else:
+                self.add_invalidate(block_id, datanode_id)
+                self.last_block_id = max(self.last_block_id, block_id)
+
+    # a full report replaces what is known about the datanode's replicas
+    def process_full_block_report(self, datanode_id, block_ids):
+        self.process_block_report(datanode_id, block_ids)
+        for block_id in self.datanode_blocks.get(datanode_id, set()).difference(block_ids):
+            self.remove_loc(self.id_to_block[block_id], datanode_id)
+            self.replication_checks.add(block_id)
+
+    # replicas on a dead datanode are lost, it reports them again if it comes back
+    def remove_datanode(self, datanode_id):
+        for block_id in self.datanode_blocks.pop(datanode_id, ()):
+            self.id_to_block[block_id].remove_loc(datanode_id)
+            self.replication_checks.add(block_id)
+        for block_id, datanode_ids in self.corrupt_replicas.items():
+            datanode_ids.discard(datanode_id)
+        self.invalidate_queues.pop(datanode_id, None)
+        # the datanode may still hold these replicas, so their ids are never recycled
+        for block_id, datanode_ids in list(self.pending_deletes.items()):
+            datanode_ids.discard(datanode_id)
+            if not datanode_ids:
+                del self.pending_deletes[block_id]
+
+    def get_replication_checks(self):
+        checks = self.replication_checks
+        self.replication_checks = set()
+        return checks
+
+    def add_pending_replication(self, block_id, timestamp, source_id, target_ids):
+        self.pending_replications[block_id] = [timestamp, source_id, set(target_ids)]
+
+    def get_pending_replications(self):
+        return self.pending_replications
+
+    def requeue_pending_replications(self, before):
+        for block_id, (timestamp, _, _) in list(self.pending_replications.items()):
+            if timestamp < before:
+                del self.pending_replications[block_id]
+                self.replication_checks.add(block_id)
+
+    # the datanode drops the replica once it gets the invalidation, the block id
+    # stays in use
+    def remove_excess_replica(self, block_id, datanode_id):
+        block = self.get_block_by_id(block_id)
+        self.remove_loc(block, datanode_id)
+        self.add_invalidate(block_id, datanode_id)
 
     def allocate_block_for(self, inode_id, num_bytes):
-        if self.free_block_ids:
+        block_id = None
+        while self.free_block_ids:
             block_id = self.free_block_ids.popleft()
-        else:
+            # skip ids reused by a replayed edit, or with a stale replica reported
+            # after they were freed (those come back once deleted)
+            if block_id not in self.pending_deletes and block_id not in self.id_to_block:
+                break
+            block_id = None
+        if block_id is None:
             self.last_block_id += 1
             block_id = self.last_block_id
         blk = Block(block_id, inode_id, num_bytes, [])
@@ -57,8 +171,46 @@ class BlockManager:
     def delete_block(self, block_id):
         if block_id not in self.id_to_block:
             return
-        del self.id_to_block[block_id]
-        self.free_block_ids.append(block_id)
+        block = self.id_to_block.pop(block_id)
+        self.replication_checks.discard(block_id)
+        self.pending_replications.pop(block_id, None)
+        for datanode_id in block.get_locs():
+            self.datanode_blocks[datanode_id].discard(block_id)
+        datanode_ids = set(block.get_locs()) | self.corrupt_replicas.pop(block_id, set())
+        # replicas already being deleted free the id once their deletion is confirmed
+        if not datanode_ids and block_id not in self.pending_deletes:
+            self.free_block_ids.append(block_id)
+        for datanode_id in datanode_ids:
+            self.add_invalidate(block_id, datanode_id)
+
+    def add_invalidate(self, block_id, datanode_id):
+        self.pending_deletes.setdefault(block_id, set()).add(datanode_id)
+        self.invalidate_queues.setdefault(datanode_id, deque([])).append(block_id)
+
+    def get_invalidate_batch(self, datanode_id, num):
+        queue = self.invalidate_queues.get(datanode_id)
+        if not queue:
+            return []
+        return [queue.popleft() for _ in range(min(num, len(queue)))]
+
+    def confirm_deleted(self, datanode_id, block_ids):
+        for block_id in block_ids:
+            datanode_ids = self.pending_deletes.get(block_id)
+            if datanode_ids is None:
+                continue
+            datanode_ids.discard(datanode_id)
+            corrupt = self.corrupt_replicas.get(block_id)
+            if corrupt:
+                corrupt.discard(datanode_id)
+                if not corrupt:
+                    del self.corrupt_replicas[block_id]
+            if not datanode_ids:
+                del self.pending_deletes[block_id]
+                if block_id not in self.id_to_block:
+                    self.free_block_ids.append(block_id)
+
+    def get_num_pending_deletes(self):
+        return len(self.pending_deletes)
 
     def get_free_block_ids(self):
         return sorted(list(self.free_block_ids))
@@ -0,0 +1,222 @@
+import random
+
+from collections import Counter
+
+from edfs.config import *
+
+
+class BlockPlacementPolicy:
+    @staticmethod
+    def create(name, datanode_manager):
+        if name == "random":
+            return RandomPlacementPolicy(datanode_manager)
+        return WeightedPlacementPolicy(datanode_manager)
+
+    def __init__(self, datanode_manager):
+        self.dnm = datanode_manager
+
+    @staticmethod
+    def get_rack(datanode_info):
+        return DATANODE_RACKS.get(datanode_info.get_name(), DEFAULT_RACK)
+
+    # called whenever a datanode registers, heartbeats, dies or gets a block scheduled
+    def update_datanode(self, datanode_info):
+        pass
+
+    # up to num live datanodes for new replicas of a block whose existing replicas
+    # are on the datanodes in chosen, none of them in chosen or excluded; fewer are
+    # returned if not enough datanodes qualify
+    def choose_targets(self, num, writer_ip=None, chosen=(), excluded=()):
+        raise NotImplementedError
+
+    # the replica to drop from an over-replicated block, taken from a rack holding
+    # more than one replica if there is one so the block stays on as many racks,
+    # and from the datanode with the least space left
+    def choose_replica_to_delete(self, replicas):
+        racks = Counter(self.get_rack(datanode_info) for datanode_info in replicas)
+        candidates = [datanode_info for datanode_info in replicas if racks[self.get_rack(datanode_info)] > 1] or replicas
+        return min(candidates, key=lambda datanode_info: datanode_info.get_remaining())
+
+
+class RandomPlacementPolicy(BlockPlacementPolicy):
+    def choose_targets(self, num, writer_ip=None, chosen=(), excluded=()):
+        excluded = set(excluded) | set(datanode_info.get_id() for datanode_info in chosen)
+        candidates = [datanode_info for datanode_info in self.dnm.get_live_datanodes() if datanode_info.get_id() not in excluded]
+        targets = random.sample(candidates, min(num, len(candidates)))
+        for datanode_info in targets:
+            datanode_info.incr_blocks_scheduled()
+        return targets
+
+
+# Binary indexed tree over non-negative integer weights, supports appending,
+# updating a weight and finding the slot a point in [0, total) falls into in O(log n)
+class FenwickTree:
+    def __init__(self):
+        self.weights = []
+        self.tree = [0]
+
+    def __len__(self):
+        return len(self.weights)
+
+    def prefix_sum(self, i):
+        s = 0
+        while i > 0:
+            s += self.tree[i]
+            i -= i & -i
+        return s
+
+    def total(self):
+        return self.prefix_sum(len(self.weights))
+
+    def get(self, idx):
+        return self.weights[idx]
+
+    def append(self, weight):
+        self.weights.append(weight)
+        i = len(self.weights)
+        self.tree.append(weight + self.prefix_sum(i - 1) - self.prefix_sum(i - (i & -i)))
+        return i - 1
+
+    def set(self, idx, weight):
+        delta = weight - self.weights[idx]
+        if delta == 0:
+            return
+        self.weights[idx] = weight
+        i = idx + 1
+        while i < len(self.tree):
+            self.tree[i] += delta
+            i += i & -i
+
+    def find(self, value):
+        pos = 0
+        step = 1 << (len(self.weights).bit_length())
+        while step:
+            nxt = pos + step
+            if nxt < len(self.tree) and self.tree[nxt] <= value:
+                pos = nxt
+                value -= self.tree[nxt]
+            step >>= 1
+        return pos
+
+    def sample(self):
+        total = self.total()
+        if total <= 0:
+            return None
+        return self.find(random.randrange(total))
+
+
+# Picks datanodes at random with a probability proportional to their remaining
+# space divided by their load (active transfers plus blocks scheduled on them),
+# so full or busy datanodes get fewer new blocks. Like HDFS, the first replica
+# goes to the writer's datanode if it runs on one, the second to another rack
+# and the third to the rack of the second. Weights are kept in one tree per rack
+# plus a tree over the rack totals, choosing a target costs O(log n).
+class WeightedPlacementPolicy(BlockPlacementPolicy):
+    def __init__(self, datanode_manager):
+        super().__init__(datanode_manager)
+        self.racks = []
+        self.rack_idx = {}
+        self.rack_tree = FenwickTree()
+        # datanode id -> (rack index, index in the rack tree)
+        self.slots = {}
+        self.ip_to_datanodes = {}
+
+    @staticmethod
+    def get_weight(datanode_info):
+        if not datanode_info.is_alive() or datanode_info.get_remaining() < DEFAULT_BLOCK_SZIE:
+            return 0
+        load = datanode_info.get_active_transfers() + datanode_info.get_blocks_scheduled()
+        return datanode_info.get_remaining() // (1 + load)
+
+    def update_datanode(self, datanode_info):
+        self.set_weight(datanode_info, self.get_weight(datanode_info))
+
+    def set_weight(self, datanode_info, weight):
+        slot = self.slots.get(datanode_info.get_id())
+        if slot is None:
+            rack = self.get_rack(datanode_info)
+            if rack not in self.rack_idx:
+                self.rack_idx[rack] = self.rack_tree.append(0)
+                self.racks.append((FenwickTree(), []))
+            r = self.rack_idx[rack]
+            tree, datanodes = self.racks[r]
+            datanodes.append(datanode_info)
+            slot = self.slots[datanode_info.get_id()] = (r, tree.append(0))
+            self.ip_to_datanodes.setdefault(datanode_info.get_ip(), []).append(datanode_info)
+
+        r, idx = slot
+        tree = self.racks[r][0]
+        self.rack_tree.set(r, self.rack_tree.get(r) + weight - tree.get(idx))
+        tree.set(idx, weight)
+
+    def get_datanode_weight(self, datanode_info):
+        slot = self.slots.get(datanode_info.get_id())
+        if slot is None:
+            return 0
+        return self.racks[slot[0]][0].get(slot[1])
+
+    def choose_in_rack(self, r):
+        tree, datanodes = self.racks[r]
+        idx = tree.sample()
+        return None if idx is None else datanodes[idx]
+
+    def choose_any(self):
+        r = self.rack_tree.sample()
+        return None if r is None else self.choose_in_rack(r)
+
+    def choose_remote_rack(self, datanode_info):
+        r = self.slots[datanode_info.get_id()][0]
+        rack_weight = self.rack_tree.get(r)
+        self.rack_tree.set(r, 0)
+        remote = self.rack_tree.sample()
+        self.rack_tree.set(r, rack_weight)
+        return None if remote is None else self.choose_in_rack(remote)
+
+    def choose_local_rack(self, datanode_info):
+        return self.choose_in_rack(self.slots[datanode_info.get_id()][0])
+
+    def choose_local(self, writer_ip):
+        candidates = [datanode_info for datanode_info in self.ip_to_datanodes.get(writer_ip, ()) if self.get_datanode_weight(datanode_info) > 0]
+        if not candidates:
+            return None
+        return random.choices(candidates, [self.get_datanode_weight(datanode_info) for datanode_info in candidates])[0]
+
+    def choose_next(self, results, writer_ip):
+        target = None
+        if not results:
+            target = self.choose_local(writer_ip) if writer_ip else None
+        elif len(results) == 1:
+            target = self.choose_remote_rack(results[0])
+        elif len(results) == 2:
+            if self.get_rack(results[0]) == self.get_rack(results[1]):
+                target = self.choose_remote_rack(results[1])
+            else:
+                target = self.choose_local_rack(results[1])
+        return target or self.choose_any()
+
+    def choose_targets(self, num, writer_ip=None, chosen=(), excluded=()):
+        # chosen and excluded datanodes are taken out of the trees while choosing
+        results = [datanode_info for datanode_info in chosen if datanode_info.get_id() in self.slots]
+        removed = list(results)
+        for datanode_id in excluded:
+            datanode_info = self.dnm.get_datanode_by_id(datanode_id)
+            if datanode_info is not None and datanode_id in self.slots:
+                removed.append(datanode_info)
+        for datanode_info in removed:
+            self.set_weight(datanode_info, 0)
+
+        targets = []
+        while len(targets) < num:
+            target = self.choose_next(results, writer_ip)
+            if target is None:
+                break
+            targets.append(target)
+            results.append(target)
+            removed.append(target)
+            self.set_weight(target, 0)
+
+        for datanode_info in targets:
+            datanode_info.incr_blocks_scheduled()
+        for datanode_info in removed:
+            self.update_datanode(datanode_info)
+        return targets
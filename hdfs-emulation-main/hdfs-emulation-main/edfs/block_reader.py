@@ -0,0 +1,219 @@
+import asyncio
+import json
+import time
+
+from edfs.config import *
+from edfs.data_checksum import DataChecksum
+from edfs.utils import PacketUtils
+
+# Fetches a block from offset to end into a bounded queue of verified chunks,
+# moving to another replica when one fails or returns corrupt data. Started ahead
+# of the stream, it connects and fills its buffers while earlier blocks are read.
+# Replicas are tried in the order of the replica scorer; when the first one has not
+# responded within HEDGED_READ_THRESHOLD seconds the next one is asked as well and
+# the first to respond is read.
+class BlockReader:
+    def __init__(self, block, offset, replica_scorer, end=None):
+        self.block = block
+        self.replica_scorer = replica_scorer
+        # offset in the block of the next byte to fetch
+        self.block_offset = offset
+        self.end = end if end is not None else block.get("num_bytes")
+        self.reader = None
+        self.writer = None
+        self.target_loc = None
+        # replicas that failed or returned corrupt data
+        self.bad_locs = set()
+        # received bytes not yet verified, starting at recv_offset in the block,
+        # of the chunk-aligned range the datanode sends up to recv_end
+        self.pending = bytearray([])
+        self.recv_offset = 0
+        self.recv_end = 0
+        self.checksums = b""
+        self.bytes_per_checksum = 0
+        # bytes received from the current replica and seconds spent waiting for them
+        self.transfer_bytes = 0
+        self.transfer_time = 0
+        # verified chunks, then b"" at the end of the block or the error that stopped the fetch
+        self.buffers = asyncio.Queue(READ_AHEAD_BUFFERS)
+        self.task = None
+
+    def get_block(self):
+        return self.block
+
+    def start(self):
+        self.task = asyncio.create_task(self.run())
+
+    def close(self):
+        if self.task:
+            self.task.cancel()
+            self.task = None
+        self.close_connection()
+
+    def close_connection(self):
+        if self.writer:
+            self.writer.close()
+            self.writer = None
+
+    async def run(self):
+        try:
+            await self.fetch()
+            await self.buffers.put(b"")
+        except Exception as e:
+            await self.buffers.put(e)
+        finally:
+            self.close_connection()
+
+    # the next verified chunk of the block, b"" once it is all read
+    async def read(self):
+        item = await self.buffers.get()
+        if isinstance(item, Exception):
+            raise item
+        return item
+
+    async def read_all(self):
+        chunks = []
+        data = await self.read()
+        while len(data) > 0:
+            chunks.append(data)
+            data = await self.read()
+        return b"".join(chunks)
+
+    async def fetch(self):
+        block = self.block
+        while self.block_offset < self.end:
+            if not self.writer:
+                await self.connect_block()
+
+            start = time.monotonic()
+            data = await self.reader.read(BUF_LEN)
+            self.transfer_time += time.monotonic() - start
+            self.transfer_bytes += len(data)
+            if not data:
+                print(f'DBG: datanode {self.target_loc.get("name")} closed the connection while reading block {block.get("block_id")}')
+                self.fail_over()
+                continue
+
+            self.pending += data
+            num_bytes = self.get_num_verified_bytes()
+            if num_bytes < 0:
+                print(f'DBG: checksum error in block {block.get("block_id")} from datanode {self.target_loc.get("name")}')
+                self.fail_over()
+                continue
+
+            if num_bytes == 0:
+                continue
+
+            # the datanode starts at a chunk boundary, drop what precedes block_offset
+            skip = self.block_offset - self.recv_offset
+            chunk = bytes(self.pending[skip: min(num_bytes, self.end - self.recv_offset)])
+            del self.pending[:num_bytes]
+            if self.bytes_per_checksum:
+                self.checksums = self.checksums[DataChecksum.get_num_chunks(num_bytes, self.bytes_per_checksum) * DataChecksum.CHECKSUM_SIZE:]
+            self.recv_offset += num_bytes
+            self.block_offset = self.recv_offset
+            if len(chunk) > 0:
+                await self.buffers.put(chunk)
+        self.end_transfer()
+
+    # number of pending bytes that are verified, or -1 on a checksum mismatch;
+    # only whole chunks are verified until the end of the range
+    def get_num_verified_bytes(self):
+        if not self.bytes_per_checksum:
+            return len(self.pending)
+
+        num_bytes = len(self.pending)
+        if self.recv_offset + num_bytes < self.recv_end:
+            num_bytes -= num_bytes % self.bytes_per_checksum
+        if num_bytes == 0:
+            return 0
+
+        num_chunks = DataChecksum.get_num_chunks(num_bytes, self.bytes_per_checksum)
+        checksums = self.checksums[: num_chunks * DataChecksum.CHECKSUM_SIZE]
+        if DataChecksum.verify(memoryview(self.pending)[:num_bytes], checksums, self.bytes_per_checksum) >= 0:
+            return -1
+        return num_bytes
+
+    def end_transfer(self):
+        self.replica_scorer.record_transfer(self.target_loc, self.transfer_bytes, self.transfer_time)
+        self.transfer_bytes = 0
+        self.transfer_time = 0
+
+    def fail_over(self):
+        self.bad_locs.add((self.target_loc.get("ip"), self.target_loc.get("port")))
+        self.replica_scorer.record_failure(self.target_loc)
+        self.end_transfer()
+        self.close_connection()
+
+    async def connect_block(self):
+        block_id = self.block.get("block_id")
+        locs = self.replica_scorer.sort(loc for loc in self.block.get("locs") if (loc.get("ip"), loc.get("port")) not in self.bad_locs)
+        attempts = {}
+        hedge = False
+        try:
+            while True:
+                if locs and (not attempts or hedge):
+                    target_loc = locs.pop(0)
+                    if attempts:
+                        print(f'DBG: no response for block {block_id} after {HEDGED_READ_THRESHOLD}s, also reading it from datanode {target_loc.get("name")}')
+                    attempts[asyncio.create_task(self.open_replica(target_loc))] = target_loc
+                if not attempts:
+                    raise IOError(f'Could not read block {block_id} from any datanode')
+
+                timeout = HEDGED_READ_THRESHOLD if HEDGED_READ_THRESHOLD > 0 and locs else None
+                done, _ = await asyncio.wait(attempts, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                hedge = not done
+                for task in done:
+                    target_loc = attempts.pop(task)
+                    if task.result() is None:
+                        self.bad_locs.add((target_loc.get("ip"), target_loc.get("port")))
+                    elif self.writer:
+                        task.result()[1].close()
+                    else:
+                        self.target_loc = target_loc
+                        self.reader, self.writer, response, self.checksums = task.result()
+                        self.pending = bytearray([])
+                        self.recv_offset = response.get("offset")
+                        self.recv_end = self.recv_offset + response.get("num_bytes")
+                        self.bytes_per_checksum = response.get("bytes_per_checksum")
+                if self.writer:
+                    return
+        finally:
+            for task in attempts:
+                task.cancel()
+
+    # connect to a replica and request the rest of the range, returning the
+    # connection, the response and the checksums, or None if the replica failed
+    async def open_replica(self, target_loc):
+        start = time.monotonic()
+        writer = None
+        try:
+            reader, writer = await asyncio.open_connection(
+                target_loc.get("ip"), target_loc.get("port")
+            )
+            request = {"cmd": CLI_DATANODE_CMD_READ, "block_id": self.block.get("block_id"), "offset": self.block_offset, "num_bytes": self.end - self.block_offset}
+            writer.write(PacketUtils.encode(json.dumps(request).encode()))
+            await writer.drain()
+
+            data = await PacketUtils.read_packet(reader)
+            response = json.loads(data.decode()) if data is not None else {}
+            checksums = b""
+            if response.get("success") and response.get("bytes_per_checksum"):
+                num_chunks = DataChecksum.get_num_chunks(response.get("num_bytes"), response.get("bytes_per_checksum"))
+                checksums = await reader.readexactly(num_chunks * DataChecksum.CHECKSUM_SIZE)
+        except (OSError, asyncio.IncompleteReadError):
+            response = {}
+        except asyncio.CancelledError:
+            # another replica responded first, this one is at least that slow
+            self.replica_scorer.record_latency(target_loc, time.monotonic() - start)
+            if writer:
+                writer.close()
+            raise
+
+        if not response.get("success"):
+            if writer:
+                writer.close()
+            self.replica_scorer.record_failure(target_loc)
+            return None
+        self.replica_scorer.record_latency(target_loc, time.monotonic() - start)
+        return reader, writer, response, checksums
@@ -0,0 +1,115 @@
+import asyncio
+import os
+
+from edfs.block_manager import BlockManager
+from edfs.config import *
+from edfs.data_checksum import DataChecksum
+
+# Verifies every block of a datanode against its .meta checksums in the
+# background. Blocks are scanned in id order under a bytes-per-second budget,
+# and the scanner waits while the datanode is serving reads or writes. The last
+# scanned block id is persisted every BLOCK_SCANNER_CURSOR_SAVE_BLOCKS blocks, so
+# a restart resumes the current pass from about where it stopped.
+class BlockScanner:
+    def __init__(self, datanode):
+        self.datanode = datanode
+        self.data_dir = f'{DATANODE_DATA_DIR}/{datanode.name}'
+        self.cursor_filename = f'{self.data_dir}/{BLOCK_SCANNER_CURSOR_FILENAME}'
+        self.cursor = self.load_cursor()
+        self.task = None
+        self.bytes_scanned = 0
+        self.blocks_scanned = 0
+        self.corrupt_blocks = 0
+        # corrupt blocks the namenode could not be told about yet
+        self.unreported_blocks = set()
+
+    def start(self):
+        self.task = asyncio.create_task(self.run())
+
+    def close(self):
+        if self.task:
+            self.task.cancel()
+            self.task = None
+
+    def get_stats(self):
+        return {"cursor": self.cursor, "bytes_scanned": self.bytes_scanned, "blocks_scanned": self.blocks_scanned, "corrupt_blocks": self.corrupt_blocks}
+
+    def load_cursor(self):
+        if not os.path.exists(self.cursor_filename):
+            return 0
+        with open(self.cursor_filename, 'r') as f:
+            return int(f.read().strip() or 0)
+
+    async def save_cursor(self):
+        await asyncio.get_running_loop().run_in_executor(None, self.write_cursor, self.cursor)
+
+    def write_cursor(self, cursor):
+        with open(f'{self.cursor_filename}{BLOCK_TMP_SUFFIX}', 'w') as f:
+            f.write(str(cursor))
+        os.replace(f'{self.cursor_filename}{BLOCK_TMP_SUFFIX}', self.cursor_filename)
+
+    async def run(self):
+        while True:
+            for block_id in sorted(self.datanode.get_all_block_ids()):
+                if block_id <= self.cursor:
+                    continue
+                if not await self.scan_block(block_id):
+                    self.corrupt_blocks += 1
+                    print(f'DBG: block scanner found corrupt block {block_id}')
+                    self.unreported_blocks.add(block_id)
+                    await self.report_bad_blocks()
+                self.blocks_scanned += 1
+                self.cursor = block_id
+                if self.blocks_scanned % BLOCK_SCANNER_CURSOR_SAVE_BLOCKS == 0:
+                    await self.save_cursor()
+
+            print(f'DBG: block scanner finished a pass, {self.blocks_scanned} blocks and {self.bytes_scanned} bytes scanned so far')
+            self.cursor = 0
+            await self.save_cursor()
+            await self.report_bad_blocks()
+            await asyncio.sleep(BLOCK_SCANNER_PERIOD)
+
+    # blocks that could not be reported, while the namenode is down or restarting,
+    # are kept and reported again with the next corrupt block or at the end of the pass
+    async def report_bad_blocks(self):
+        if not self.unreported_blocks:
+            return
+        try:
+            reported = await self.datanode.report_bad_blocks(sorted(self.unreported_blocks))
+        except ConnectionError:
+            reported = False
+        if reported:
+            self.unreported_blocks.clear()
+        else:
+            print(f'DBG: block scanner could not report corrupt blocks {sorted(self.unreported_blocks)}, retrying later')
+
+    # False only if the block does not match its checksums; blocks without a
+    # meta file or deleted while being scanned are skipped
+    async def scan_block(self, block_id):
+        filename = f'{self.data_dir}/{BlockManager.get_filename_from_block_id(block_id)}'
+        loop = asyncio.get_running_loop()
+        try:
+            with open(filename, 'rb') as f, open(f'{filename}{BLOCK_META_SUFFIX}', 'rb') as meta_f:
+                version, bytes_per_checksum = DataChecksum.META_HEADER.unpack(meta_f.read(DataChecksum.META_HEADER.size))
+                read_size = max(bytes_per_checksum, BLOCK_SCANNER_READ_SIZE - BLOCK_SCANNER_READ_SIZE % bytes_per_checksum)
+                while True:
+                    await self.wait_for_idle()
+                    num_bytes, ok = await loop.run_in_executor(None, BlockScanner.verify_chunk, f, meta_f, read_size, bytes_per_checksum)
+                    if not ok:
+                        return False
+                    if num_bytes == 0:
+                        return True
+                    self.bytes_scanned += num_bytes
+                    await asyncio.sleep(num_bytes / BLOCK_SCANNER_BYTES_PER_SEC)
+        except FileNotFoundError:
+            return True
+
+    @staticmethod
+    def verify_chunk(f, meta_f, read_size, bytes_per_checksum):
+        data = f.read(read_size)
+        checksums = meta_f.read(DataChecksum.get_num_chunks(len(data), bytes_per_checksum) * DataChecksum.CHECKSUM_SIZE)
+        return len(data), DataChecksum.verify(data, checksums, bytes_per_checksum) < 0
+
+    async def wait_for_idle(self):
+        while self.datanode.get_num_active_requests() > 0:
+            await asyncio.sleep(BLOCK_SCANNER_IDLE_WAIT)
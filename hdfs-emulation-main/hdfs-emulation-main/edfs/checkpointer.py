@@ -0,0 +1,62 @@
+import asyncio
+import time
+
+from concurrent.futures import ProcessPoolExecutor
+from edfs.config import *
+from edfs.editlog_manager import EditLogManager
+from edfs.fsimage import FSImage
+
+
+# Periodically folds finalized edit log segments into a new fsimage. The
+# namespace is rebuilt from the current image and the edits in a separate
+# process, so the namenode's event loop never serializes its live namespace.
+class Checkpointer:
+    @staticmethod
+    def checkpoint(txid):
+        im, bm, image_txid = FSImage.load()
+        elm = EditLogManager(im, bm, image_txid)
+        elm.process_edit_logs(txid)
+        FSImage.save(im, bm, elm.get_last_txid())
+        return elm.get_last_txid()
+
+    def __init__(self, edit_log_manager):
+        self.elm = edit_log_manager
+        self.last_checkpoint_txid = edit_log_manager.get_last_txid()
+        self.last_checkpoint_time = time.monotonic()
+        self.executor = None
+        self.task = None
+
+    def start(self):
+        self.executor = ProcessPoolExecutor(max_workers=1)
+        self.task = asyncio.create_task(self.run())
+
+    def close(self):
+        if self.task:
+            self.task.cancel()
+        if self.executor:
+            self.executor.shutdown(wait=False)
+
+    def should_checkpoint(self):
+        num_txns = self.elm.get_last_txid() - self.last_checkpoint_txid
+        if num_txns >= CHECKPOINT_TXNS:
+            return True
+        return num_txns > 0 and time.monotonic() - self.last_checkpoint_time >= CHECKPOINT_PERIOD
+
+    async def run(self):
+        while True:
+            await asyncio.sleep(CHECKPOINT_CHECK_INTERVAL)
+            if self.should_checkpoint():
+                try:
+                    await self.do_checkpoint()
+                except Exception as e:
+                    print(f'DBG: checkpoint failed: {e}')
+
+    async def do_checkpoint(self):
+        txid = await self.elm.roll()
+        start = time.monotonic()
+        loop = asyncio.get_running_loop()
+        checkpoint_txid = await loop.run_in_executor(self.executor, Checkpointer.checkpoint, txid)
+        self.elm.purge_edit_logs(checkpoint_txid)
+        self.last_checkpoint_txid = checkpoint_txid
+        self.last_checkpoint_time = time.monotonic()
+        print(f'DBG: checkpoint up to txid {checkpoint_txid} took {time.monotonic() - start:.2f}s')
@@ -37,14 +37,31 @@ CMD_MV = 114
 CMD_IS_IDENTICAL = 115
 CMD_IS_ROOT_DIR = 116
 CMD_IS_DIR_EMPTY = 117
+CMD_GET_METRICS = 118
+CMD_STAT = 119
+CMD_BATCH = 120
+CMD_COMMIT_BLOCK = 121
 
 # client to datanode commands
 CLI_DATANODE_CMD_SETUP_WRITE = 200
 CLI_DATANODE_CMD_WRITE = 201
 CLI_DATANODE_CMD_READ = 202
 
+# write pipeline ack status
+ACK_SUCCESS = 0
+ACK_ERROR_CHECKSUM = 1
+
 # Datanode to namenode command
 DN_CMD_REGISTER = 300
+DN_CMD_BAD_BLOCKS = 301
+DN_CMD_HEARTBEAT = 302
+DN_CMD_INCREMENTAL_BLOCK_REPORT = 303
+DN_CMD_BLOCK_REPORT = 304
+
+# Namenode to datanode commands, sent in heartbeat replies
+NN_CMD_INVALIDATE = 500
+NN_CMD_REGISTER = 501
+NN_CMD_TRANSFER = 502
 
 # edit log types
 EDIT_TYPE_MKDIR = 400
@@ -53,12 +70,23 @@ EDIT_TYPE_CREATE = 402
 EDIT_TYPE_ADD_BLOCK = 403
 EDIT_TYPE_RM = 404
 EDIT_TYPE_MV = 405
+EDIT_TYPE_ALLOCATE_BLOCK = 406
 
 # Metadata
 NAMENODE_METADATA_DIR = "./tmp/name"
 FSIMAGE_FILENAME = "fsimage.json"
+FSIMAGE_BINARY_FILENAME = "fsimage"
+# "binary" or "json"; json images are still loaded when no binary image exists
+FSIMAGE_FORMAT = "binary"
 
 EDIT_LOG_PREFIX = "edits_"
+EDIT_LOG_SEGMENT_SIZE = 10000
+EDIT_LOG_FSYNC = True
+
+# Checkpoint after this many transactions or seconds, whichever comes first
+CHECKPOINT_TXNS = 100000
+CHECKPOINT_PERIOD = 3600
+CHECKPOINT_CHECK_INTERVAL = 60
 
 #Inode
 DIR_TYPE = "DIRECTORY"
@@ -68,6 +96,13 @@ DEFAULT_BASE_DIR = "/user/ubuntu"
 
 INODE_ID_START = 1000
 
+# Path resolution cache
+PATH_CACHE_SIZE = 4096
+
+# Paginated ls and tree
+LIST_PAGE_SIZE = 1000
+LIST_MAX_PAGE_SIZE = 10000
+
 
 # Block
 DEFAULT_BLOCK_SZIE = 1024
@@ -77,16 +112,86 @@ REPLICATION_FACTOR = 2
 
 # Data Streamer
 MAX_QUEUE_SIZE = 4096
-
-# Packet
-DEFAULT_PACKET_DATA_SIZE = 256
+# packets sent down the pipeline and not acked yet
+MAX_IN_FLIGHT_PACKETS = 512
+# blocks of a file larger than one block uploaded at once, 1 streams them in turn
+PUT_PARALLELISM = 4
+
+# Input stream, block locations are fetched for this many bytes of the file at a time
+READ_PREFETCH_SIZE = 10 * DEFAULT_BLOCK_SZIE
+# blocks fetched ahead of the one being read, 0 fetches one block at a time; each
+# block buffers up to READ_AHEAD_BUFFERS chunks of about BUF_LEN bytes
+READ_AHEAD_BLOCKS = 4
+READ_AHEAD_BUFFERS = 16
+# Replica selection, another replica is asked when the chosen one has not responded
+# after HEDGED_READ_THRESHOLD seconds, 0 waits for it
+HEDGED_READ_THRESHOLD = 0.5
+# weight of a new measurement in the latency and throughput averages of a datanode
+REPLICA_STATS_WEIGHT = 0.3
+# seconds after which the measurements and failures of a datanode are forgotten
+REPLICA_STATS_TTL = 60
+
+# Packet, a multiple of BYTES_PER_CHECKSUM so packets start on a chunk boundary
+DEFAULT_PACKET_DATA_SIZE = 512
+BYTES_PER_CHECKSUM = 512
 PACKET_BUF_SIZE = 512
 
 # DataNode
 DATANODE_DATA_DIR = "./tmp/data"
-
+BLOCK_TMP_SUFFIX = ".tmp"
+BLOCK_META_SUFFIX = ".meta"
+# When a packet is acked: "packet" fsyncs every packet, "block" flushes every
+# packet and fsyncs the block before acking its last packet, "none" only flushes
+DATANODE_SYNC_POLICY = "block"
+
+# Block scanner, verifies every block once per pass and waits BLOCK_SCANNER_PERIOD
+# seconds between passes
+BLOCK_SCANNER_BYTES_PER_SEC = 1024 * 1024
+BLOCK_SCANNER_READ_SIZE = 64 * 1024
+BLOCK_SCANNER_PERIOD = 3600
+BLOCK_SCANNER_IDLE_WAIT = 0.1
+BLOCK_SCANNER_CURSOR_FILENAME = "scanner.cursor"
+# blocks scanned between saves of the cursor, a restart scans up to this many again
+BLOCK_SCANNER_CURSOR_SAVE_BLOCKS = 100
+
+# Heartbeats, block reports and block deletion
+HEARTBEAT_INTERVAL = 3
+HEARTBEAT_CHECK_INTERVAL = 5
+DATANODE_DEAD_INTERVAL = 30
+# full reports are spread over the interval, new and deleted blocks are reported
+# INCREMENTAL_REPORT_DELAY seconds after they happen
+BLOCK_REPORT_INTERVAL = 6 * 3600
+BLOCK_REPORT_CHUNK_SIZE = 10000
+INCREMENTAL_REPORT_DELAY = 0.1
+# blocks scheduled on a datanode but not reported yet count towards its load for
+# up to two of these intervals
+BLOCKS_SCHEDULED_ROLL_INTERVAL = 600
+INVALIDATE_BATCH_SIZE = 1000
+DATANODE_DELETE_THREADS = 4
+DATANODE_DELETES_PER_SEC = 1000
+
+# Replication monitor, schedules up to REPLICATION_WORK_MULTIPLIER transfers per
+# live datanode every REPLICATION_CHECK_INTERVAL seconds
+REPLICATION_CHECK_INTERVAL = 3
+REPLICATION_WORK_MULTIPLIER = 2
+REPLICATION_MAX_STREAMS = 2
+REPLICATION_PENDING_TIMEOUT = 60
+REPLICATION_STARTUP_DELAY = 30
+
+# Block placement, "weighted" picks datanodes by free space and load, "random"
+# uniformly; datanodes missing from DATANODE_RACKS are on DEFAULT_RACK
+BLOCK_PLACEMENT_POLICY = "weighted"
+# e.g. {"A": "/rack1", "B": "/rack1", "C": "/rack2"}
+DATANODE_RACKS = {}
+DEFAULT_RACK = "/default-rack"
 
 # Error code
 ERR_FILE_EXIST = "E0"
 ERR_FILE_NOT_FOUND = "E1"
 ERR_IS_DIR = "E2"
+ERR_NOT_DIR = "E3"
+ERR_DIR_NOT_EMPTY = "E4"
+ERR_IS_ROOT = "E5"
+ERR_IDENTICAL = "E6"
+ERR_SUBDIR = "E7"
+ERR_NO_DATANODES = "E8"
@@ -0,0 +1,42 @@
+import struct
+import sys
+import zlib
+
+from array import array
+from edfs.config import *
+
+# CRC32 of every BYTES_PER_CHECKSUM chunk of a buffer, packed as little-endian
+# uint32s so packets and .meta files can carry them as raw bytes
+class DataChecksum:
+    # version, bytes per checksum
+    META_HEADER = struct.Struct('<HI')
+    META_VERSION = 1
+    CHECKSUM_SIZE = 4
+
+    @staticmethod
+    def get_num_chunks(num_bytes, bytes_per_checksum=BYTES_PER_CHECKSUM):
+        return (num_bytes + bytes_per_checksum - 1) // bytes_per_checksum
+
+    @staticmethod
+    def compute(data, bytes_per_checksum=BYTES_PER_CHECKSUM):
+        view = memoryview(data)
+        crc32 = zlib.crc32
+        checksums = array('I', [crc32(view[i: i + bytes_per_checksum]) for i in range(0, len(view), bytes_per_checksum)])
+        if sys.byteorder != "little":
+            checksums.byteswap()
+        return checksums.tobytes()
+
+    # index of the first chunk that does not match, or -1
+    @staticmethod
+    def verify(data, checksums, bytes_per_checksum=BYTES_PER_CHECKSUM):
+        computed = DataChecksum.compute(data, bytes_per_checksum)
+        if computed == bytes(checksums):
+            return -1
+        for i in range(0, len(computed), DataChecksum.CHECKSUM_SIZE):
+            if computed[i: i + DataChecksum.CHECKSUM_SIZE] != checksums[i: i + DataChecksum.CHECKSUM_SIZE]:
+                return i // DataChecksum.CHECKSUM_SIZE
+        return len(computed) // DataChecksum.CHECKSUM_SIZE
+
+    @staticmethod
+    def get_meta_header(bytes_per_checksum=BYTES_PER_CHECKSUM):
+        return DataChecksum.META_HEADER.pack(DataChecksum.META_VERSION, bytes_per_checksum)
@@ -6,111 +6,188 @@ from edfs.config import *
 from edfs.dfs_packet import DFSPacket
 from edfs.utils import PacketUtils
 
+# Sends packets down the write pipeline as they are queued. The block is
+# allocated and its pipeline set up when its first packet arrives, at most
+# MAX_IN_FLIGHT_PACKETS packets wait for their ack, and the next block is
+# allocated while the acks of the current one drain. The length of a block is
+# committed once it is acked, while the next one is sent. write_block sends a block
+# allocated by the caller instead, for uploads running several pipelines.
 class DataStreamer:
 
-    def __init__(self):
+    def __init__(self, namenode_rpc):
+        self.namenode_rpc = namenode_rpc
         self.des_inode_id = None
         self.task = None
         self.data_queue = asyncio.Queue(MAX_QUEUE_SIZE)
-        self.ack_queue = asyncio.Queue(MAX_QUEUE_SIZE)
+        # packets sent and waiting for their ack
+        self.ack_queue = asyncio.Queue(MAX_IN_FLIGHT_PACKETS)
         self.reader = None
         self.writer = None
+        # {"block_id", "num_bytes"} of the last block once it is fully sent
+        self.last_block = None
+        self.error = None
 
     def setup(self, task, des_inode_id):
         self.task = task
         self.des_inode_id = des_inode_id
 
     async def enqueue(self, item):
+       self.check_failed()
        await self.data_queue.put(item)
 
+    # re-raises the error that stopped the streamer
+    def check_failed(self):
+        if self.error:
+            raise self.error
+
+    def get_last_block(self):
+        return self.last_block
+
+    # after an error, packets are dropped so that nobody waits on the queues
     async def run(self):
-        block_id = None
-        blk_locs_info = None
-        ack_task = None
-        packets_buf = []
-        num_bytes = 0
+        try:
+            await self.stream()
+        except Exception as e:
+            self.error = e
+        self.close()
+        self.discard_acks()
         while True:
-            packet = await self.data_queue.get()
-            num_bytes += packet.get_datalen()
-            packets_buf.append(packet)
-            await self.ack_queue.put(packet)
-            if packet.is_last_packet_in_block():
-                block_id, blk_locs_info = await self.request_new_block(num_bytes)
-                target = blk_locs_info.pop(0)
-                reader, writer = await self.setup_pipeline(block_id, target, blk_locs_info)
-                ack_task = asyncio.create_task(self.recv_acks(reader))
-                await self.writebock(writer, packets_buf, block_id, blk_locs_info)
-                await self.wait_for_all_ack()
-                print(f'DBG: block {block_id} was successfully sent to datanodes {target.get("name")} {" ".join([loc.get("name") for loc in blk_locs_info])}')
-                ack_task.cancel()
-                writer.close()
-                packets_buf = []
-                num_bytes = 0
+            await self.data_queue.get()
             self.data_queue.task_done()
 
+    async def stream(self):
+        next_block, commit = None, None
+        block_id, offset = None, 0
+        try:
+            while True:
+                packet = await self.data_queue.get()
+                try:
+                    if block_id is None:
+                        block_id, blk_locs_info = await (next_block or self.request_new_block())
+                        next_block = None
+                        offset = 0
+                        ack_task = await self.open_pipeline(block_id, blk_locs_info)
+
+                    packet.set_offset(offset)
+                    offset += packet.get_datalen()
+                    await self.send_packet(packet)
+
+                    if packet.is_last_packet_in_block():
+                        block = {"block_id": block_id, "num_bytes": offset}
+                        if not packet.is_last_packet_in_file():
+                            next_block = asyncio.create_task(self.request_new_block())
+                        await self.close_pipeline(ack_task)
+                        print(f'DBG: block {block_id} was successfully sent to datanodes {" ".join([loc.get("name") for loc in blk_locs_info])}')
+                        block_id = None
+                        # a length is only committed once all its bytes are acked, in block order
+                        if commit:
+                            await commit
+                            commit = None
+                        if packet.is_last_packet_in_file():
+                            self.last_block = block
+                        else:
+                            commit = asyncio.create_task(self.commit_block(block))
+                finally:
+                    self.data_queue.task_done()
+        finally:
+            for task in (next_block, commit):
+                if task:
+                    task.cancel()
+                    await asyncio.gather(task, return_exceptions=True)
+
+    # send the packets of an allocated block and return its length once all are acked
+    async def write_block(self, block_id, blk_locs_info, packets):
+        ack_task = await self.open_pipeline(block_id, blk_locs_info)
+        offset = 0
+        try:
+            for packet in packets:
+                packet.set_offset(offset)
+                offset += packet.get_datalen()
+                await self.send_packet(packet)
+            await self.close_pipeline(ack_task)
+        finally:
+            ack_task.cancel()
+            self.close()
+        print(f'DBG: block {block_id} was successfully sent to datanodes {" ".join([loc.get("name") for loc in blk_locs_info])}')
+        return offset
+
+    async def open_pipeline(self, block_id, blk_locs_info):
+        self.reader, self.writer = await self.setup_pipeline(block_id, blk_locs_info[0], blk_locs_info[1:])
+        return asyncio.create_task(self.recv_acks(self.reader))
+
+    async def send_packet(self, packet):
+        await self.ack_queue.put(packet)
+        self.check_failed()
+        await self.write_packet(self.writer, packet)
+
+    async def close_pipeline(self, ack_task):
+        await self.wait_for_all_ack()
+        ack_task.cancel()
+        self.close()
+        self.check_failed()
+
     async def recv_acks(self, nextnode_reader):
-        buf = bytearray([])
         while True:
-            data = await nextnode_reader.read(BUF_LEN)
-            if not data:
-                continue
-            buf += data
-
-            packets, ptr = PacketUtils.create_packets_from_buffer(buf)
-            decoded_packets = [json.loads(packet.decode()) for packet in packets]
-            seqnos = [packet.get("seqno") for packet in decoded_packets]
-            for seqno in seqnos:
-                packet = await self.ack_queue.get()
-                print(f'DBG: received ack {seqno}, packet {packet.get_seqno()} popped from ack queue')
-                self.ack_queue.task_done()
-            buf = buf[ptr:]
-
-    async def writebock(self, writer, packets_buf, block_id, next_datanodes):
-        for packet in packets_buf:
-            buf = {
-                "seqno": packet.get_seqno(),
-                "data": packet.get_data(),
-                "is_last_packet_in_block": packet.is_last_packet_in_block(),
-                "block_id": block_id,
-                "next_datanodes": next_datanodes
-            }
-            writer.write(PacketUtils.encode(json.dumps(buf).encode()))
-            await writer.drain()
-
-    async def request_new_block(self, num_bytes):
-        reader, writer = await asyncio.open_connection(
-            LOCAL_HOST, NAMENODE_PORT
-        )
-        message = json.dumps({"cmd": CMD_ADD_BLOCK, "inode_id": self.des_inode_id, "num_bytes": num_bytes})
-        writer.write(message.encode())
+            ack = await DFSPacket.read_ack(nextnode_reader)
+            if ack is None:
+                if not self.ack_queue.empty():
+                    self.error = IOError(f'pipeline closed with {self.ack_queue.qsize()} packets not acked')
+                    self.discard_acks()
+                break
+
+            seqno, status = ack
+            packet = self.ack_queue.get_nowait()
+            self.ack_queue.task_done()
+            if status != ACK_SUCCESS or seqno != packet.get_seqno():
+                self.error = IOError(f'received error ack {seqno} with status {status} for packet {packet.get_seqno()}')
+                self.discard_acks()
+                break
+
+    def discard_acks(self):
+        while not self.ack_queue.empty():
+            self.ack_queue.get_nowait()
+            self.ack_queue.task_done()
+
+    async def write_packet(self, writer, packet):
+        writer.write(packet.get_header())
+        writer.write(packet.get_checksums())
+        writer.write(packet.get_data())
         await writer.drain()
 
-        data = await reader.read(BUF_LEN)
-        response = json.loads(data.decode())
+    async def request_new_block(self):
+        response = await self.namenode_rpc.call({"cmd": CMD_ADD_BLOCK, "inode_id": self.des_inode_id})
+        if not response.get("success"):
+            raise IOError(f'could not add a block: {response.get("error")}')
         block_id = response.get("block_id")
         blk_locs_info = response.get("blk_locs_info")
-
-        writer.close()
         return block_id, blk_locs_info
 
+    async def commit_block(self, block):
+        response = await self.namenode_rpc.call({"cmd": CMD_COMMIT_BLOCK, "inode_id": self.des_inode_id, "block": block})
+        if not response.get("success"):
+            raise IOError(f'could not commit block {block.get("block_id")}: {response.get("error")}')
+
     async def wait_for_all_ack(self):
         await self.ack_queue.join()
 
     async def finish(self):
-        await self.ack_queue.join()
         await self.data_queue.join()
+        await self.ack_queue.join()
         if self.task:
             self.task.cancel()
+        self.check_failed()
 
     async def setup_pipeline(self, block_id, target, next_datanodes):
         reader, writer = await asyncio.open_connection(
-            target.get("id"), target.get("port")
+            target.get("ip"), target.get("port")
         )
         message = json.dumps({"cmd": CLI_DATANODE_CMD_SETUP_WRITE, "block_id": block_id, "next_datanodes": next_datanodes})
-        writer.write(message.encode())
+        writer.write(PacketUtils.encode(message.encode()))
         await writer.drain()
 
-        data = await reader.read(BUF_LEN)
+        data = await PacketUtils.read_packet(reader)
+        if data is None:
+            raise IOError(f'could not set up the write pipeline of block {block_id}')
         response = json.loads(data.decode())
 
         return reader, writer
@@ -118,3 +195,4 @@ class DataStreamer:
     def close(self):
         if self.writer:
             self.writer.close()
+            self.writer = None
@@ -1,3 +1,8 @@
+import time
+
+from collections import deque
+from edfs.config import *
+
 class DataNodeInfo:
     LAST_DATANODE_ID = 1
     def __init__(self, ip, port, name):
@@ -6,6 +11,21 @@ class DataNodeInfo:
         self.port = port
         self.name = name
         DataNodeInfo.LAST_DATANODE_ID += 1
+        self.alive = True
+        self.last_heartbeat = time.monotonic()
+        self.capacity = 0
+        self.dfs_used = 0
+        self.remaining = 0
+        self.active_transfers = 0
+        # blocks the namenode sent writes for that the datanode has not reported yet,
+        # counted over the current and the previous roll interval like HDFS does
+        self.blocks_scheduled = 0
+        self.prev_blocks_scheduled = 0
+        self.last_blocks_scheduled_roll = time.monotonic()
+        # commands waiting for the next heartbeat reply
+        self.pending_commands = deque([])
+        # block ids received so far in a full block report split over several messages
+        self.block_report = None
 
     def get_id(self):
         return self.id
@@ -22,15 +42,80 @@ class DataNodeInfo:
     def get_info(self):
         return {"ip": self.ip, "port": self.port, "name": self.name}
 
+    def is_alive(self):
+        return self.alive
+
+    def set_alive(self, alive):
+        self.alive = alive
+
+    def get_last_heartbeat(self):
+        return self.last_heartbeat
+
+    def update_heartbeat(self, capacity, dfs_used, remaining, active_transfers):
+        self.last_heartbeat = time.monotonic()
+        self.capacity = capacity
+        self.dfs_used = dfs_used
+        self.remaining = remaining
+        self.active_transfers = active_transfers
+        if self.last_heartbeat - self.last_blocks_scheduled_roll > BLOCKS_SCHEDULED_ROLL_INTERVAL:
+            self.prev_blocks_scheduled = self.blocks_scheduled
+            self.blocks_scheduled = 0
+            self.last_blocks_scheduled_roll = self.last_heartbeat
+
+    def get_remaining(self):
+        return self.remaining
+
+    def get_active_transfers(self):
+        return self.active_transfers
+
+    def get_blocks_scheduled(self):
+        return self.blocks_scheduled + self.prev_blocks_scheduled
+
+    def incr_blocks_scheduled(self):
+        self.blocks_scheduled += 1
+
+    def decr_blocks_scheduled(self):
+        if self.prev_blocks_scheduled > 0:
+            self.prev_blocks_scheduled -= 1
+        elif self.blocks_scheduled > 0:
+            self.blocks_scheduled -= 1
+
+    def get_stats(self):
+        return {"name": self.name, "alive": self.alive, "capacity": self.capacity, "dfs_used": self.dfs_used,
+                "remaining": self.remaining, "active_transfers": self.active_transfers,
+                "blocks_scheduled": self.get_blocks_scheduled(), "pending_commands": len(self.pending_commands)}
+
+    def add_command(self, command):
+        self.pending_commands.append(command)
+
+    def get_commands(self):
+        commands = list(self.pending_commands)
+        self.pending_commands.clear()
+        return commands
+
 class DataNodeManager:
     def __init__(self):
         self.id_to_datanode = {}
+        self.addr_to_datanode = {}
 
     def get_all_datanodes(self):
         return list(self.id_to_datanode.values())
 
+    def get_live_datanodes(self):
+        return [datanode_info for datanode_info in self.id_to_datanode.values() if datanode_info.is_alive()]
+
     def get_datanode_by_id(self, id):
         return self.id_to_datanode.get(id)
 
-    def register(self, datanode_info):
-        self.id_to_datanode[datanode_info.get_id()] = datanode_info
+    def get_datanode_by_addr(self, ip, port):
+        return self.addr_to_datanode.get((ip, port))
+
+    # a datanode keeps its id across restarts, so replica locations stay valid
+    def register(self, ip, port, name):
+        datanode_info = self.get_datanode_by_addr(ip, port)
+        if datanode_info is None:
+            datanode_info = DataNodeInfo(ip, port, name)
+            self.id_to_datanode[datanode_info.get_id()] = datanode_info
+            self.addr_to_datanode[(ip, port)] = datanode_info
+        datanode_info.set_alive(True)
+        return datanode_info
@@ -1,19 +1,31 @@
+import asyncio
+import struct
+
 from edfs.config import *
+from edfs.data_checksum import DataChecksum
 
 class DFSPacket:
     seqno = 0
+    # seqno, offset in block, data length, last packet in block; followed by
+    # the checksum of every chunk of the data and then the data itself
+    HEADER = struct.Struct('<QQI?')
+    # seqno, status
+    ACK = struct.Struct('<QB')
 
     @classmethod
-    def create_packet(cls, data, last_packet_in_block):
-        self = DFSPacket(data, last_packet_in_block)
+    def create_packet(cls, data, last_packet_in_block, last_packet_in_file=False):
+        self = DFSPacket(data, last_packet_in_block, last_packet_in_file)
         DFSPacket.seqno += 1
         self.seqno = DFSPacket.seqno
         return self
 
-    def __init__(self, data, last_packet_in_block):
+    def __init__(self, data, last_packet_in_block, last_packet_in_file=False):
         self.data = data
         self.num_byte = len(data)
+        self.offset = 0
         self.last_packet_in_block = last_packet_in_block
+        # not sent, tells the streamer no block follows this one
+        self.last_packet_in_file = last_packet_in_file
 
     def get_seqno(self):
         return self.seqno
@@ -24,8 +36,43 @@ class DFSPacket:
     def get_datalen(self):
         return len(self.data)
 
+    def get_offset(self):
+        return self.offset
+
+    def set_offset(self, offset):
+        self.offset = offset
+
     def is_last_packet_in_block(self):
         return self.last_packet_in_block
 
     def set_last_packet_in_block(self, last_packet_in_block):
-        self.last_packet_in_block
+        self.last_packet_in_block = last_packet_in_block
+
+    def is_last_packet_in_file(self):
+        return self.last_packet_in_file
+
+    def get_header(self):
+        return DFSPacket.HEADER.pack(self.seqno, self.offset, len(self.data), self.last_packet_in_block)
+
+    def get_checksums(self):
+        return DataChecksum.compute(self.data)
+
+    # return the raw header, checksums and data of the next packet from a stream, or None at EOF
+    @staticmethod
+    async def read_packet(reader):
+        try:
+            header = await reader.readexactly(DFSPacket.HEADER.size)
+            data_len = DFSPacket.HEADER.unpack(header)[2]
+            checksums_len = DataChecksum.get_num_chunks(data_len) * DataChecksum.CHECKSUM_SIZE
+            body = await reader.readexactly(checksums_len + data_len)
+            return header, body[:checksums_len], body[checksums_len:]
+        except asyncio.IncompleteReadError:
+            return None
+
+    # return (seqno, status) of the next ack from a stream, or None at EOF
+    @staticmethod
+    async def read_ack(reader):
+        try:
+            return DFSPacket.ACK.unpack(await reader.readexactly(DFSPacket.ACK.size))
+        except asyncio.IncompleteReadError:
+            return None
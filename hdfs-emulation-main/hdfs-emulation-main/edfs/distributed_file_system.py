@@ -4,193 +4,115 @@ import json
 from edfs.config import *
 from edfs.fs_data_input_stream import FSDataInputStream
 from edfs.fs_data_output_stream import FSDataOutputStream
+from edfs.replica_scorer import ReplicaScorer
+from edfs.rpc_client import RpcClient
 
 class DistributedFileSystem:
     def __init__(self):
-         pass
+        self.rpc = RpcClient(LOCAL_HOST, NAMENODE_PORT)
+        # latency and throughput of the datanodes read by this client
+        self.replica_scorer = ReplicaScorer()
+
+    async def connect(self):
+        await self.rpc.connect()
 
     def close(self):
-        pass
+        self.rpc.close()
+
+    @staticmethod
+    def raise_error(response):
+        error, path = response.get("error"), response.get("path")
+        if error == ERR_FILE_EXIST:
+            raise FileExistsError(error, "File exists", path)
+        elif error == ERR_IS_DIR:
+            raise IsADirectoryError(error, "Is a directory", path)
+        elif error == ERR_NOT_DIR:
+            raise NotADirectoryError(error, "Is not a directory", path)
+        raise FileNotFoundError(error, "No such file or directory", path)
 
     async def open(self, path):
-        reader, writer = await asyncio.open_connection(
-            LOCAL_HOST, NAMENODE_PORT
-        )
-        message = json.dumps({"cmd": CMD_GET_BLOCK_LOCATIONS, "path": path})
-        writer.write(message.encode())
-        await writer.drain()
-
-        data = bytearray([])
-        while True:
-            buf = await reader.read(BUF_LEN)
-            if not buf:
-                break
-            data += buf
-        writer.close()
-
-        response = json.loads(data.decode())
+        response = await self.rpc.call({"cmd": CMD_GET_BLOCK_LOCATIONS, "path": path, "offset": 0, "length": READ_PREFETCH_SIZE})
         success = response.get("success")
-        if success:
-            block_locations = response.get("block_locations")
-            return FSDataInputStream(block_locations)
-
-        return None
-
-    async def mkdir(self, path):
-        reader, writer = await asyncio.open_connection(
-            LOCAL_HOST, NAMENODE_PORT
-        )
-
-        message = json.dumps({"cmd": CMD_MKDIR, "path": path})
-        writer.write(message.encode())
-        await writer.drain()
+        if not success:
+            DistributedFileSystem.raise_error(dict(response, path=path))
 
-        data = await reader.read(BUF_LEN)
-        response = json.loads(data.decode())
-        success = response.get("success")
+        return FSDataInputStream(self.rpc, path, response, self.replica_scorer)
 
-    async def rmdir(self, path):
-        reader, writer = await asyncio.open_connection(
-            LOCAL_HOST, NAMENODE_PORT
-        )
+    async def ls(self, path, start_after=None, limit=None):
+        return await self.rpc.call({"cmd": CMD_LS, "path": path, "start_after": start_after, "limit": limit})
 
-        message = json.dumps({"cmd": CMD_RMDIR, "path": path})
-        writer.write(message.encode())
-        await writer.drain()
+    async def tree(self, path, start_after=None, limit=None):
+        return await self.rpc.call({"cmd": CMD_TREE, "path": path, "start_after": start_after, "limit": limit})
 
-        data = await reader.read(BUF_LEN)
-        response = json.loads(data.decode())
-        success = response.get("success")
-        if not success:
-            print(response.get("msg"))
+    # yield ls responses page by page, resuming after the last name of each page
+    async def ls_pages(self, path):
+        start_after = None
+        while True:
+            response = await self.ls(path, start_after)
+            yield response
+            if not response.get("success") or not response.get("has_more"):
+                break
+            start_after = response.get("entries")[-1].rsplit("/", 1)[-1]
 
-    async def create(self, path):
-        reader, writer = await asyncio.open_connection(
-            LOCAL_HOST, NAMENODE_PORT
-        )
+    # yield tree responses page by page, resuming after the last path of each page
+    async def tree_pages(self, path):
+        start_after = None
+        while True:
+            response = await self.tree(path, start_after)
+            yield response
+            if not response.get("success") or not response.get("has_more"):
+                break
+            start_after = response.get("entries")[-1].get("path")
 
-        message = json.dumps({"cmd": CMD_CREATE, "path": path})
-        writer.write(message.encode())
-        await writer.drain()
+    async def mkdir(self, path):
+        return await self.rpc.call({"cmd": CMD_MKDIR, "path": path})
 
-        data = await reader.read(BUF_LEN)
-        writer.close()
+    async def rmdir(self, path):
+        return await self.rpc.call({"cmd": CMD_RMDIR, "path": path})
 
-        response = json.loads(data.decode())
+    # with default_name, creating at an existing directory creates default_name inside it
+    async def create(self, path, default_name=None):
+        response = await self.rpc.call({"cmd": CMD_CREATE, "path": path, "default_name": default_name})
         success = response.get("success")
-        if success:
-            inode_id = response.get("inode_id")
-            return FSDataOutputStream(inode_id)
-
-        return None
-
-    async def create_complete(self, path):
-        reader, writer = await asyncio.open_connection(
-            LOCAL_HOST, NAMENODE_PORT
-        )
+        if not success:
+            DistributedFileSystem.raise_error(response)
 
-        message = json.dumps({"cmd": CMD_CREATE_COMPLETE, "path": path})
-        writer.write(message.encode())
-        await writer.drain()
+        inode_id = response.get("inode_id")
+        return FSDataOutputStream(inode_id, response.get("path"), self.rpc)
 
-        writer.close()
+    async def create_complete(self, path, last_block=None):
+        await self.rpc.call({"cmd": CMD_CREATE_COMPLETE, "path": path, "last": last_block})
 
     async def rm(self, path):
-        reader, writer = await asyncio.open_connection(
-            LOCAL_HOST, NAMENODE_PORT
-        )
-
-        request = json.dumps({"cmd": CMD_RM, "path": path})
-        writer.write(request.encode())
-        await writer.drain()
-
-        writer.close()
+        return await self.rpc.call({"cmd": CMD_RM, "path": path})
 
     async def mv(self, src, des):
-        reader, writer = await asyncio.open_connection(
-            LOCAL_HOST, NAMENODE_PORT
-        )
-        request = json.dumps({"cmd": CMD_MV, "src": src, "des": des})
-        writer.write(request.encode())
-        await writer.drain()
-
-        writer.close()
+        return await self.rpc.call({"cmd": CMD_MV, "src": src, "des": des})
 
-    async def exists(self, path):
-        reader, writer = await asyncio.open_connection(
-            LOCAL_HOST, NAMENODE_PORT
-        )
-
-        message = json.dumps({"cmd": CMD_FILE_EXISTS, "path": path})
-        writer.write(message.encode())
-        await writer.drain()
+    async def stat(self, paths):
+        response = await self.rpc.call({"cmd": CMD_STAT, "paths": paths})
+        return response.get("stats")
 
-        data = await reader.read(BUF_LEN)
-        response = json.loads(data.decode())
-        exists = response.get("exists")
+    async def batch(self, requests):
+        response = await self.rpc.call({"cmd": CMD_BATCH, "requests": requests})
+        return response.get("responses")
 
-        writer.close()
-        return exists
+    async def exists(self, path):
+        stats = await self.stat([path])
+        return stats[0].get("exists")
 
     async def is_dir(self, path):
-        reader, writer = await asyncio.open_connection(
-            LOCAL_HOST, NAMENODE_PORT
-        )
-
-        message = json.dumps({"cmd": CMD_IS_DIR, "path": path})
-        writer.write(message.encode())
-        await writer.drain()
-
-        data = await reader.read(BUF_LEN)
-        response = json.loads(data.decode())
-        is_dir = response.get("is_dir")
-
-        writer.close()
-        return is_dir
+        stats = await self.stat([path])
+        return stats[0].get("exists") and stats[0].get("is_dir")
 
     async def is_dir_empty(self, path):
-        reader, writer = await asyncio.open_connection(
-            LOCAL_HOST, NAMENODE_PORT
-        )
-
-        message = json.dumps({"cmd": CMD_IS_DIR_EMPTY, "path": path})
-        writer.write(message.encode())
-        await writer.drain()
-
-        data = await reader.read(BUF_LEN)
-        response = json.loads(data.decode())
-        is_dir_empty = response.get("is_dir_empty")
-
-        writer.close()
-        return is_dir_empty
+        stats = await self.stat([path])
+        return stats[0].get("exists") and stats[0].get("is_empty")
 
     async def is_identical(self, path1, path2):
-        reader, writer = await asyncio.open_connection(
-            LOCAL_HOST, NAMENODE_PORT
-        )
-
-        message = json.dumps({"cmd": CMD_IS_IDENTICAL, "path1": path1, "path2": path2})
-        writer.write(message.encode())
-        await writer.drain()
-
-        data = await reader.read(BUF_LEN)
-        response = json.loads(data.decode())
-
-        writer.close()
+        response = await self.rpc.call({"cmd": CMD_IS_IDENTICAL, "path1": path1, "path2": path2})
         return response.get("is_identical")
 
     async def is_root_dir(self, path):
-        reader, writer = await asyncio.open_connection(
-            LOCAL_HOST, NAMENODE_PORT
-        )
-
-        message = json.dumps({"cmd": CMD_IS_ROOT_DIR, "path": path})
-        writer.write(message.encode())
-        await writer.drain()
-
-        data = await reader.read(BUF_LEN)
-        response = json.loads(data.decode())
-        is_root = response.get("is_root")
-
-        writer.close()
-        return is_root
+        stats = await self.stat([path])
+        return stats[0].get("exists") and stats[0].get("is_root")
@@ -12,138 +12,126 @@ class EDFSClient:
     @classmethod
     async def create(cls):
         self = EDFSClient()
-        self.namenode_reader, self.namenode_writer = await asyncio.open_connection(
-            LOCAL_HOST, NAMENODE_PORT
-        )
+        await self.dfs.connect()
         return self
 
     def __init__(self):
         self.dfs = DistributedFileSystem()
 
     def close(self):
-        if self.namenode_writer:
-            self.namenode_writer.close()
         self.dfs.close()
 
     async def ls(self, path):
-        message = json.dumps({"cmd": CMD_LS, "path": path})
-        self.namenode_writer.write(message.encode())
-        await self.namenode_writer.drain()
-
-        data = await  self.namenode_reader.read(BUF_LEN)
-        response = json.loads(data.decode())
-        success = response.get("success")
-        if not success:
-            print(response.get("msg"))
-        else:
+        first_page = True
+        async for response in self.dfs.ls_pages(path):
+            success = response.get("success")
+            if not success:
+                print(response.get("msg"))
+                return
+
             entries = response.get("entries")
             if not entries:
                 return
 
-            print(f'Found {len(entries)} items')
+            if first_page:
+                print(f'Found {response.get("total")} items')
+                first_page = False
             for ent in entries:
                 print(ent)
 
     async def mkdir(self, path):
-        if await self.dfs.exists(path):
+        response = await self.dfs.mkdir(path)
+        error = response.get("error")
+        if error == ERR_FILE_EXIST:
             print(f'mkdir: {path}: File exists')
-            return
-        elif not await self.dfs.exists(os.path.dirname(path.strip(" /"))):
-            print(f'mkdir: {os.path.dirname(path.strip(" /"))}: No such file or directory')
-            return
-
-        await self.dfs.mkdir(path)
-        self.dfs.close()
+        elif error == ERR_FILE_NOT_FOUND:
+            print(f'mkdir: {response.get("path")}: No such file or directory')
+        elif error == ERR_NOT_DIR:
+            print(f'mkdir: {response.get("path")}: Is not a directory')
 
     async def rmdir(self, path):
-        if await self.dfs.is_root_dir(path):
+        response = await self.dfs.rmdir(path)
+        error = response.get("error")
+        if error == ERR_IS_ROOT:
             print(f'rmdir: Can not remvoe the root directory')
-            return
-        elif not await self.dfs.exists(path):
+        elif error == ERR_FILE_NOT_FOUND:
             print(f'rmdir: {path}: No such file or directory')
-            return
-        elif not await self.dfs.is_dir(path):
+        elif error == ERR_NOT_DIR:
             print(f'rmdir: {path}: Is not a directory')
-            return
-        elif not await self.dfs.is_dir_empty(path):
+        elif error == ERR_DIR_NOT_EMPTY:
             print(f'rmdir: {path}: Directory is not empty')
-            return
-
-        await self.dfs.rmdir(path)
-        self.dfs.close()
 
     async def touch(self, path):
-        if not await self.dfs.exists(os.path.dirname(path)):
-            print(f'touch: {os.path.dirname(path)}: No such file or directory')
+        try:
+            out_stream = await self.dfs.create(path)
+        except FileExistsError:
             return
-        elif await self.dfs.is_dir(path):
+        except IsADirectoryError:
             print(f'touch: {path}: Is a directory')
             return
-        elif await self.dfs.exists(path):
+        except (FileNotFoundError, NotADirectoryError) as e:
+            print(f'touch: {e.filename}: No such file or directory')
             return
 
-        out_stream = await self.dfs.create(path)
         await out_stream.close()
-        self.dfs.close()
 
     async def rm(self, path):
-        if not await self.dfs.exists(path):
+        response = await self.dfs.rm(path)
+        error = response.get("error")
+        if error == ERR_FILE_NOT_FOUND:
             print(f'rm: {path}: No such file or directory')
-            return
-        elif await self.dfs.is_dir(path):
+        elif error == ERR_IS_DIR:
             print(f'rm: {path}: Is a directory')
-            return
-        await self.dfs.rm(path)
 
     async def cat(self, path):
-        if not await self.dfs.exists(path):
+        try:
+            in_stream = await self.dfs.open(path)
+        except FileNotFoundError:
             print(f'cat: {path}: No such file or directory')
             return
-        if await self.dfs.is_dir(path):
+        except IsADirectoryError:
             print(f'cat: {path}: Is a directory')
             return
 
-        in_stream = await self.dfs.open(path)
-        if not in_stream:
-            return
         buf = bytearray([])
-        while (await in_stream.read(buf)) >= 0:
-            if len(buf) >= BUF_LEN:
-                print(buf.decode(), end="")
-                buf = bytearray([])
-        print(buf.decode(), end="")
+        try:
+            while (await in_stream.read(buf)) >= 0:
+                if len(buf) >= BUF_LEN:
+                    print(buf.decode(), end="")
+                    buf = bytearray([])
+            print(buf.decode(), end="")
+        except IOError as e:
+            print(f'cat: {e}')
 
         in_stream.close()
-        self.dfs.close()
 
     # TODO: currently only support file types
     # Should implement recursive put all files in a directory in the future
     async def put(self, local_path, remote_path):
-        if os.path.basename(remote_path) == "" or await self.dfs.is_dir(remote_path):
-            target_path = f'{remote_path}/{os.path.basename(local_path)}'
-        else:
-            target_path = remote_path
-
         if not os.path.exists(local_path):
             print(f'put: {local_path}: No such file or directory')
             return False
-        elif await self.dfs.exists(target_path):
-            print(f'put: {target_path}: File exists')
+
+        try:
+            out_stream = await self.dfs.create(remote_path, os.path.basename(local_path))
+        except (FileExistsError, IsADirectoryError) as e:
+            print(f'put: {e.filename}: File exists')
             return False
-        elif not await self.dfs.exists(os.path.dirname(remote_path)):
-            print(f'put: {os.path.dirname(remote_path)}: No such file or directory: hdfs://localhost:9000{os.path.dirname(remote_path)}')
+        except FileNotFoundError as e:
+            print(f'put: {e.filename}: No such file or directory: hdfs://localhost:9000{e.filename}')
             return False
-        elif not await self.dfs.is_dir(os.path.dirname(remote_path)):
-            print(f'put: {os.path.dirname(remote_path)} (is not a directory)')
+        except NotADirectoryError as e:
+            print(f'put: {e.filename} (is not a directory)')
             return False
 
-        out_stream = await self.dfs.create(target_path)
-        if not out_stream:
+        try:
+            await out_stream.write(local_path)
+        except IOError as e:
+            print(f'put: {e}')
             return False
-        await out_stream.write(local_path)
-        await self.dfs.create_complete(target_path)
-        await out_stream.close()
-        self.dfs.close()
+        finally:
+            await out_stream.close()
+        await self.dfs.create_complete(out_stream.get_path(), out_stream.get_last_block())
 
         return True
 
@@ -153,107 +141,83 @@ class EDFSClient:
         if os.path.exists(local_path):
             print(f'get: {local_path}: File exists')
             return
-        if not await self.dfs.exists(remote_path):
+
+        try:
+            in_stream = await self.dfs.open(remote_path)
+        except FileNotFoundError:
             print(f'get: {remote_path}: No such file or directory')
             return
-
-        in_stream = await self.dfs.open(remote_path)
-        if not in_stream:
+        except IsADirectoryError:
+            print(f'get: {remote_path}: Is a directory')
             return
 
-        with open(local_path, 'a') as f:
-            buf = bytearray([])
-            while (await in_stream.read(buf)) > 0:
-                if len(buf) >= BUF_LEN:
-                    f.write(buf.decode())
-                    buf = bytearray([])
-            f.write(buf.decode())
+        try:
+            with open(local_path, 'wb') as f:
+                buf = bytearray([])
+                while (await in_stream.read(buf)) > 0:
+                    if len(buf) >= BUF_LEN:
+                        f.write(buf)
+                        buf = bytearray([])
+                f.write(buf)
+        except IOError as e:
+            print(f'get: {e}')
+            os.remove(local_path)
 
         in_stream.close()
-        self.dfs.close()
 
     async def get_file(self, path):
-        if not await self.dfs.exists(path):
-            return {"success": False}
-        if await self.dfs.is_dir(path):
-            return {"success": False}
-
-        in_stream = await self.dfs.open(path)
-        if not in_stream:
+        try:
+            in_stream = await self.dfs.open(path)
+        except (FileNotFoundError, IsADirectoryError):
             return {"success": False}
 
         buf = bytearray([])
-        while (await in_stream.read(buf)) > 0:
-            continue
-
-        in_stream.close()
-        self.dfs.close()
+        try:
+            while (await in_stream.read(buf)) > 0:
+                continue
+        except IOError:
+            return {"success": False}
+        finally:
+            in_stream.close()
 
         return {"success": True, "file": buf.decode()}
 
     async def mv(self, src, des):
-        if not await self.dfs.exists(src):
+        response = await self.dfs.mv(src, des)
+        error, path = response.get("error"), response.get("path")
+        if error == ERR_FILE_NOT_FOUND and path == src:
             print(f'mv: {src}: No such file or directory')
-            return
+        elif error == ERR_FILE_NOT_FOUND:
+            print(f'mv: {path}: No such file or directory: edfs://localhost:9000{path}')
+        elif error == ERR_IDENTICAL:
+            print(f'mv: {src} to edfs://localhost:9000{path}: are identical')
+        elif error == ERR_FILE_EXIST:
+            print(f'mv: {path}: File exists')
+        elif error == ERR_SUBDIR:
+            print(f'mv: {src} to edfs://localhost:9000{des}: is a subdirectory of itself')
 
-        if not await self.dfs.exists(des):
-            dirname = os.path.dirname(des.rstrip("/"))
-            if not await self.dfs.exists(dirname) or not await self.dfs.is_dir(dirname):
-                print(f'mv: {dirname}: No such file or directory: edfs://localhost:9000{dirname}')
-                return
-            target = des
-        else:
-            if await self.dfs.is_dir(des):
-                target = f'{des}/{os.path.basename(src.rstrip("/"))}'
-                if await self.dfs.is_identical(src, target):
-                    print(f'mv: {src} to edfs://localhost:9000{target}: are identical')
-                    return
-                elif await self.dfs.exists(target):
-                    print(f'mv: {target}: File exists')
-                    return
-                elif await self.dfs.is_identical(src, des):
-                    print(f'mv: {src} to edfs://localhost:9000{des}: is a subdirectory of itself')
-                    return
-            else:
-                print(f'mv: {des}: File exists')
+    async def tree(self, path):
+        async for response in self.dfs.tree_pages(path):
+            success = response.get("success")
+            if not success:
+                print(response.get("msg"))
                 return
 
-        await self.dfs.mv(src, target)
-
-    async def tree(self, path):
-        message = json.dumps({"cmd": CMD_TREE, "path": path})
-        self.namenode_writer.write(message.encode())
-        await self.namenode_writer.drain()
-
-        data = await self.namenode_reader.read(BUF_LEN)
-        response = json.loads(data.decode())
-        success = response.get("success")
-        if not success:
-            print(response.get("msg"))
-        else:
-            root = response.get("files")
             output = []
-            self.tree_helper(root, 0, output)
+            for file in response.get("entries"):
+                self.tree_helper(file, output)
             print("\n".join(output))
 
-    def tree_helper(self, file, level, output):
+    def tree_helper(self, file, output):
         _name = file.get("name")
         _type = file.get("type")
+        level = file.get("depth")
 
         if _type == FILE_TYPE:
             output.append(f'{"    " * level}{_name}')
         else:
             output.append(f'{"    " * level}{_name}:')
-            children = file.get("children")
-            for child in children:
-                self.tree_helper(child, level + 1, output)
-
-    async def get_all_files(self):
-        message = json.dumps({"cmd": CMD_TREE, "path": "/"})
-        self.namenode_writer.write(message.encode())
-        await self.namenode_writer.drain()
-
-        data = await self.namenode_reader.read(BUF_LEN)
-        response = json.loads(data.decode())
-        success = response.get("success")
-        return response.get("files")
+
+    async def get_all_files(self, start_after=None, limit=None):
+        response = await self.dfs.tree("/", start_after, limit)
+        return response
@@ -1,10 +1,16 @@
 import asyncio
 import json
 import os
+import random
+import shutil
 
+from concurrent.futures import ThreadPoolExecutor
 from edfs.block_manager import BlockManager
+from edfs.block_scanner import BlockScanner
 from edfs.config import *
+from edfs.data_checksum import DataChecksum
 from edfs.dfs_packet import DFSPacket
+from edfs.rpc_client import RpcClient
 from edfs.utils import PacketUtils
 
 class EDFSDataNode:
@@ -16,62 +22,224 @@ class EDFSDataNode:
 
         if not os.path.exists(f'{DATANODE_DATA_DIR}/{self.name}'):
             os.makedirs(f'{DATANODE_DATA_DIR}/{self.name}')
+
+        # blocks that were still being written when the datanode stopped
+        for entry in os.scandir(f'{DATANODE_DATA_DIR}/{self.name}'):
+            if entry.name.endswith(BLOCK_TMP_SUFFIX):
+                os.remove(entry.path)
+            elif entry.name.startswith(BLOCK_PREFIX):
+                self.dfs_used += entry.stat().st_size
         return self
 
     def __init__(self, ip, port, name):
         self.ip = ip
         self.port = port
         self.name = name
+        self.namenode_rpc = RpcClient(LOCAL_HOST, NAMENODE_PORT)
+        self.num_active_requests = 0
+        self.dfs_used = 0
+        self.scanner = BlockScanner(self)
+        self.tasks = []
+        self.delete_queue = asyncio.Queue()
+        self.delete_executor = ThreadPoolExecutor(max_workers=DATANODE_DELETE_THREADS)
+        # block ids received and deleted since the last incremental block report
+        self.received_blocks = []
+        self.deleted_blocks = []
+        self.report_event = asyncio.Event()
 
     async def register(self):
-        reader, writer = await asyncio.open_connection(
-            LOCAL_HOST, NAMENODE_PORT
-        )
-        message = json.dumps({
+        response = await self.namenode_rpc.call(dict({
             "cmd": DN_CMD_REGISTER,
             "ip": self.ip,
             "port": self.port,
-            "name": self.name,
-            "blocks": self.get_all_block_ids()
-        })
-        writer.write(message.encode())
-        await writer.drain()
-        data = await reader.read(BUF_LEN)
-        response = json.loads(data.decode())
+            "name": self.name
+        }, **self.get_storage_report()))
         success = response.get("success")
         if success:
-            print(f'DBG: successfully registered and sent the block report to the namenode')
+            print(f'DBG: successfully registered to the namenode')
+            await self.send_block_report()
+
+    async def send_block_report(self):
+        block_ids = self.get_all_block_ids()
+        for i in range(0, max(1, len(block_ids)), BLOCK_REPORT_CHUNK_SIZE):
+            await self.namenode_rpc.call({
+                "cmd": DN_CMD_BLOCK_REPORT,
+                "ip": self.ip,
+                "port": self.port,
+                "blocks": block_ids[i: i + BLOCK_REPORT_CHUNK_SIZE],
+                "first": i == 0,
+                "last": i + BLOCK_REPORT_CHUNK_SIZE >= len(block_ids)
+            })
+        print(f'DBG: sent the block report of {len(block_ids)} blocks to the namenode')
+
+    # returns whether the namenode took the report
+    async def report_bad_blocks(self, block_ids):
+        response = await self.namenode_rpc.call({"cmd": DN_CMD_BAD_BLOCKS, "ip": self.ip, "port": self.port, "blocks": block_ids})
+        return response.get("success")
+
+    def get_num_active_requests(self):
+        return self.num_active_requests
+
+    def get_storage_report(self):
+        usage = shutil.disk_usage(f'{DATANODE_DATA_DIR}/{self.name}')
+        return {"capacity": usage.total, "dfs_used": self.dfs_used, "remaining": usage.free}
+
+    def block_received(self, block_id):
+        self.received_blocks.append(block_id)
+        self.report_event.set()
+
+    def blocks_deleted(self, block_ids):
+        self.deleted_blocks += block_ids
+        self.report_event.set()
+
+    async def send_heartbeats(self):
+        while True:
+            try:
+                response = await self.namenode_rpc.call(dict({
+                    "cmd": DN_CMD_HEARTBEAT,
+                    "ip": self.ip,
+                    "port": self.port,
+                    "active_transfers": self.num_active_requests
+                }, **self.get_storage_report()))
+            except ConnectionError:
+                response = {}
+
+            for command in response.get("commands", []):
+                self.process_command(command)
+            await asyncio.sleep(HEARTBEAT_INTERVAL)
+
+    async def send_incremental_block_reports(self):
+        while True:
+            await self.report_event.wait()
+            await asyncio.sleep(INCREMENTAL_REPORT_DELAY)
+            self.report_event.clear()
+            received, self.received_blocks = self.received_blocks, []
+            deleted, self.deleted_blocks = self.deleted_blocks, []
+            try:
+                await self.namenode_rpc.call({"cmd": DN_CMD_INCREMENTAL_BLOCK_REPORT, "ip": self.ip, "port": self.port, "received": received, "deleted": deleted})
+            except ConnectionError:
+                self.received_blocks = received + self.received_blocks
+                self.deleted_blocks = deleted + self.deleted_blocks
+                self.report_event.set()
+                await asyncio.sleep(HEARTBEAT_INTERVAL)
+
+    # the first periodic report lands at a random point of the interval, so
+    # datanodes started together do not report together
+    async def send_block_reports(self):
+        await asyncio.sleep(random.uniform(0, BLOCK_REPORT_INTERVAL))
+        while True:
+            try:
+                await self.send_block_report()
+            except ConnectionError:
+                pass
+            await asyncio.sleep(BLOCK_REPORT_INTERVAL)
+
+    def process_command(self, command):
+        if command.get("cmd") == NN_CMD_INVALIDATE:
+            for block_id in command.get("blocks"):
+                self.delete_queue.put_nowait(block_id)
+        elif command.get("cmd") == NN_CMD_REGISTER:
+            self.tasks.append(asyncio.create_task(self.register()))
+        elif command.get("cmd") == NN_CMD_TRANSFER:
+            self.tasks.append(asyncio.create_task(self.transfer_block(command.get("block_id"), command.get("targets"))))
+
+    # delete in batches spread over the thread pool, at most DATANODE_DELETES_PER_SEC
+    async def delete_blocks(self):
+        loop = asyncio.get_running_loop()
+        batch_size = max(1, DATANODE_DELETES_PER_SEC // 10)
+        while True:
+            block_ids = [await self.delete_queue.get()]
+            while not self.delete_queue.empty() and len(block_ids) < batch_size:
+                block_ids.append(self.delete_queue.get_nowait())
+
+            freed = await asyncio.gather(*[
+                loop.run_in_executor(self.delete_executor, EDFSDataNode.delete_block_files, self.name, block_ids[i::DATANODE_DELETE_THREADS])
+                for i in range(min(DATANODE_DELETE_THREADS, len(block_ids)))
+            ])
+            print(f'DBG: deleted {len(block_ids)} blocks')
+            self.dfs_used -= sum(freed)
+            self.blocks_deleted(block_ids)
+            await asyncio.sleep(len(block_ids) / DATANODE_DELETES_PER_SEC)
+
+    # return the number of bytes freed
+    @staticmethod
+    def delete_block_files(name, block_ids):
+        freed = 0
+        for block_id in block_ids:
+            filename = f'{DATANODE_DATA_DIR}/{name}/{BlockManager.get_filename_from_block_id(block_id)}'
+            for path in (filename, f'{filename}{BLOCK_META_SUFFIX}'):
+                try:
+                    freed += os.path.getsize(path)
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+        return freed
 
     async def serve(self):
         print(f'DBG: Datanode {self.name} starts serving at {self.ip}:{self.port}')
 
         server = await asyncio.start_server(
         self.handle_client, self.ip, self.port)
+        self.scanner.start()
+        self.tasks.append(asyncio.create_task(self.send_heartbeats()))
+        self.tasks.append(asyncio.create_task(self.send_incremental_block_reports()))
+        self.tasks.append(asyncio.create_task(self.send_block_reports()))
+        self.tasks.append(asyncio.create_task(self.delete_blocks()))
 
         async with server:
             await server.serve_forever()
 
+    def close(self):
+        self.scanner.close()
+        for task in self.tasks:
+            task.cancel()
+        self.tasks = []
+        self.namenode_rpc.close()
+        self.delete_executor.shutdown(wait=False)
+
     async def handle_client(self, reader, writer):
-        data = await reader.read(BUF_LEN)
+        data = await PacketUtils.read_packet(reader)
+        if data is None:
+            writer.close()
+            return
+
         request = json.loads(data.decode())
+        self.num_active_requests += 1
+        try:
+            await self.handle_request(reader, writer, request)
+        finally:
+            self.num_active_requests -= 1
+        writer.close()
+
+    async def handle_request(self, reader, writer, request):
         command = request.get("cmd")
         if command == CLI_DATANODE_CMD_SETUP_WRITE:
             block_id, nextnode_reader, nextnode_writer = await self.setup_write_pipeline(reader, writer, request)
             end_of_pipeline = nextnode_writer is None
+            # (seqno, is_last_packet) of packets written locally, waiting for the downstream ack
+            written = asyncio.Queue()
             tasks = asyncio.gather(
-                self.recv_and_write(reader, writer, nextnode_reader, nextnode_writer, block_id, end_of_pipeline),
-                self.recv_acks(writer, nextnode_reader, end_of_pipeline)
+                self.recv_and_write(reader, writer, nextnode_writer, block_id, end_of_pipeline, written),
+                self.recv_acks(writer, nextnode_reader, end_of_pipeline, written)
             )
-            await tasks
+            finalized, acked = await tasks
+            # a replica is only reported once every datanode after this one has acked it
+            if finalized and acked:
+                self.block_received(block_id)
+            elif finalized:
+                print(f'DBG: dropping block {block_id}, the next datanodes did not ack it')
+                self.dfs_used -= await asyncio.get_running_loop().run_in_executor(None, EDFSDataNode.delete_block_files, self.name, [block_id])
 
             if nextnode_writer:
                 nextnode_writer.close()
 
         elif command == CLI_DATANODE_CMD_READ:
             block_id, offset, num_bytes = request.get("block_id"), request.get("offset"), request.get("num_bytes")
-            await self.read_block(writer, block_id, offset, num_bytes)
-
-        writer.close()
+            # clients hang up on the replicas that lost a hedged read and on blocks read ahead but not needed
+            try:
+                await self.read_block(writer, block_id, offset, num_bytes)
+            except ConnectionError:
+                print(f'DBG: client closed the connection while reading block {block_id}')
 
     async def setup_write_pipeline(self, reader, writer, request):
         block_id = request.get("block_id")
@@ -80,93 +248,205 @@ class EDFSDataNode:
         if next_datanodes:
             target = next_datanodes.pop(0)
             nextnode_reader, nextnode_writer = await asyncio.open_connection(
-                target.get("id"), target.get("port")
+                target.get("ip"), target.get("port")
             )
             message = json.dumps({"cmd": CLI_DATANODE_CMD_SETUP_WRITE, "block_id": block_id, "next_datanodes": next_datanodes})
-            nextnode_writer.write(message.encode())
+            nextnode_writer.write(PacketUtils.encode(message.encode()))
             await nextnode_writer.drain()
 
-            nextnode_data = await nextnode_reader.read(BUF_LEN)
+            nextnode_data = await PacketUtils.read_packet(nextnode_reader)
             nextnode_response = json.loads(nextnode_data.decode())
 
         response = {"success": True}
-        writer.write(json.dumps(response).encode())
+        writer.write(PacketUtils.encode(json.dumps(response).encode()))
         await writer.drain()
         print(f'DBG: successfully setup the write pipeline, waiting for packets')
         return block_id, nextnode_reader, nextnode_writer
 
-    async def recv_and_write(self, prevnode_reader, prevnode_writer, nextnode_reader, nextnode_writer, block_id, end_of_pipeline):
-        buf = bytearray([])
-        block_data = []
-        is_last_packet = False
+    async def recv_and_write(self, prevnode_reader, prevnode_writer, nextnode_writer, block_id, end_of_pipeline, written):
+        filename = f'{DATANODE_DATA_DIR}/{self.name}/{BlockManager.get_filename_from_block_id(block_id)}'
+        meta_filename = f'{filename}{BLOCK_META_SUFFIX}'
+        # the meta file is renamed first, so a finalized block always has its checksums
+        files = [(open(f'{meta_filename}{BLOCK_TMP_SUFFIX}', 'wb'), meta_filename), (open(f'{filename}{BLOCK_TMP_SUFFIX}', 'wb'), filename)]
+        (meta_f, _), (f, _) = files
+        meta_f.write(DataChecksum.get_meta_header())
         while True:
-            data = await prevnode_reader.read(BUF_LEN)
+            packet = await DFSPacket.read_packet(prevnode_reader)
+            if packet is None:
+                print(f'DBG: connection closed before the last packet of block {block_id}')
+                EDFSDataNode.discard_block(files)
+                return False
 
+            header, checksums, data = packet
             if not end_of_pipeline:
+                nextnode_writer.write(header)
+                nextnode_writer.write(checksums)
                 nextnode_writer.write(data)
-                await nextnode_writer.drain()
+                try:
+                    await nextnode_writer.drain()
+                except ConnectionError:
+                    print(f'DBG: next datanode closed the pipeline of block {block_id}')
+                    EDFSDataNode.discard_block(files)
+                    return False
+
+            seqno, offset, data_len, is_last_packet = DFSPacket.HEADER.unpack(header)
+            # only the last datanode verifies, it has seen the same bytes as every other one;
+            # on a mismatch the replica is dropped and the pipeline closed behind the error ack
+            if end_of_pipeline and DataChecksum.verify(data, checksums) >= 0:
+                print(f'DBG: checksum error in packet {seqno} of block {block_id} at offset {offset}')
+                EDFSDataNode.discard_block(files)
+                await self.send_ack(prevnode_writer, seqno, ACK_ERROR_CHECKSUM)
+                return False
 
-            buf += data
+            meta_f.write(checksums)
+            f.write(data)
+            if is_last_packet:
+                self.dfs_used += await asyncio.get_running_loop().run_in_executor(None, EDFSDataNode.finalize_block, files)
+            else:
+                await EDFSDataNode.sync_packet(files)
 
-            packets, ptr = PacketUtils.create_packets_from_buffer(buf)
-            decoded_packets = [json.loads(packet.decode()) for packet in packets]
-            for decoded_packet in decoded_packets:
-                block_data.append(decoded_packet.get("data"))
-                if decoded_packet.get("is_last_packet_in_block"):
-                    is_last_packet = True
             if end_of_pipeline:
-                seqnos = [packet.get("seqno") for packet in decoded_packets]
-                await self.send_acks(prevnode_writer, seqnos)
-            buf = buf[ptr:]
+                await self.send_ack(prevnode_writer, seqno, ACK_SUCCESS)
+            else:
+                written.put_nowait((seqno, is_last_packet))
 
             if is_last_packet:
-                break
+                return True
+
+    @staticmethod
+    async def sync_packet(files):
+        for f, _ in files:
+            f.flush()
+        if DATANODE_SYNC_POLICY == "packet":
+            for f, _ in files:
+                await asyncio.get_running_loop().run_in_executor(None, os.fsync, f.fileno())
 
-        with open(f'{DATANODE_DATA_DIR}/{self.name}/{BlockManager.get_filename_from_block_id(block_id)}', 'w') as f:
-            f.write("".join(block_data))
+    @staticmethod
+    def discard_block(files):
+        for f, _ in files:
+            f.close()
+            os.remove(f.name)
 
-    async def recv_acks(self, prevnode_writer, nextnode_reader, end_of_pipeline):
-        if end_of_pipeline: return
+    # return the number of bytes written
+    @staticmethod
+    def finalize_block(files):
+        num_bytes = 0
+        for f, filename in files:
+            f.flush()
+            if DATANODE_SYNC_POLICY != "none":
+                os.fsync(f.fileno())
+            num_bytes += f.tell()
+            f.close()
+            os.replace(f.name, filename)
+        return num_bytes
 
-        buf = bytearray([])
+    # copy a replica to targets through the write pipeline, as the namenode asked
+    async def transfer_block(self, block_id, targets):
+        filename = f'{DATANODE_DATA_DIR}/{self.name}/{BlockManager.get_filename_from_block_id(block_id)}'
+        self.num_active_requests += 1
+        try:
+            with open(filename, 'rb') as f:
+                meta_f = open(f'{filename}{BLOCK_META_SUFFIX}', 'rb') if os.path.exists(f'{filename}{BLOCK_META_SUFFIX}') else None
+                if meta_f:
+                    meta_f.seek(DataChecksum.META_HEADER.size)
+
+                reader, writer = await asyncio.open_connection(targets[0].get("ip"), targets[0].get("port"))
+                message = json.dumps({"cmd": CLI_DATANODE_CMD_SETUP_WRITE, "block_id": block_id, "next_datanodes": targets[1:]})
+                writer.write(PacketUtils.encode(message.encode()))
+                await writer.drain()
+                await PacketUtils.read_packet(reader)
+
+                num_bytes = os.fstat(f.fileno()).st_size
+                seqno, offset = 0, 0
+                while True:
+                    data = f.read(DEFAULT_PACKET_DATA_SIZE)
+                    checksums = meta_f.read(DataChecksum.get_num_chunks(len(data)) * DataChecksum.CHECKSUM_SIZE) if meta_f else DataChecksum.compute(data)
+                    seqno += 1
+                    is_last_packet = offset + len(data) >= num_bytes
+                    writer.write(DFSPacket.HEADER.pack(seqno, offset, len(data), is_last_packet))
+                    writer.write(checksums)
+                    writer.write(data)
+                    await writer.drain()
+                    offset += len(data)
+                    if is_last_packet:
+                        break
+                if meta_f:
+                    meta_f.close()
+
+                for _ in range(seqno):
+                    ack = await DFSPacket.read_ack(reader)
+                    if ack is None or ack[1] != ACK_SUCCESS:
+                        print(f'DBG: failed to transfer block {block_id}')
+                        break
+                else:
+                    print(f'DBG: transferred block {block_id} to {" ".join([target.get("name") for target in targets])}')
+                writer.close()
+        except OSError as e:
+            print(f'DBG: failed to transfer block {block_id}: {e}')
+        finally:
+            self.num_active_requests -= 1
+
+    # forward each downstream ack once the packet is also written here, and return
+    # whether the last packet was acked by every datanode after this one
+    async def recv_acks(self, prevnode_writer, nextnode_reader, end_of_pipeline, written):
+        if end_of_pipeline: return True
+
+        acked = False
         while True:
-            data = await nextnode_reader.read(BUF_LEN)
-            if not data:
+            ack = await DFSPacket.read_ack(nextnode_reader)
+            if ack is None:
                 break
-            buf += data
-
-            packets, ptr = PacketUtils.create_packets_from_buffer(buf)
-            decoded_packets = [json.loads(packet.decode()) for packet in packets]
-            seqnos = [packet.get("seqno") for packet in decoded_packets]
-            await self.send_acks(prevnode_writer, seqnos)
-            buf = buf[ptr:]
-
-    async def send_acks(self, prevnode_writer, seqnos):
-        for seqno in seqnos:
-            ack = {
-                "type": "ack",
-                "seqno": seqno
-            }
-            prevnode_writer.write(PacketUtils.encode(json.dumps(ack).encode()))
-            await prevnode_writer.drain()
 
+            seqno, status = ack
+            local_seqno, is_last_packet = await written.get()
+            await self.send_ack(prevnode_writer, seqno, status)
+            acked = is_last_packet and status == ACK_SUCCESS
+        return acked
+
+    async def send_ack(self, prevnode_writer, seqno, status):
+        prevnode_writer.write(DFSPacket.ACK.pack(seqno, status))
+        await prevnode_writer.drain()
+
+    # reply with a framed header holding the range that follows, widened to chunk
+    # boundaries so that it can be verified, and its checksums, then send the range
+    # straight from the page cache with sendfile where the loop supports it
     async def read_block(self, writer, block_id, offset, num_bytes):
-        filename = BlockManager.get_filename_from_block_id(block_id)
+        filename = f'{DATANODE_DATA_DIR}/{self.name}/{BlockManager.get_filename_from_block_id(block_id)}'
         print(f'DBG: client requested to read block {block_id} for {num_bytes} bytes from offset {offset}')
-        if not os.path.exists(f'{DATANODE_DATA_DIR}/{self.name}/{filename}'):
+        if not os.path.exists(filename):
             print(f'DBG: block {block_id} does not exist')
+            writer.write(PacketUtils.encode(json.dumps({"success": False, "error": ERR_FILE_NOT_FOUND}).encode()))
+            await writer.drain()
             return
-        with open(f'{DATANODE_DATA_DIR}/{self.name}/{filename}', 'r') as f:
-            f.seek(offset)
-            cur_num_bytes = 0
-            while True:
-                data = f.read(min(DEFAULT_PACKET_DATA_SIZE, num_bytes - cur_num_bytes))
-                if not data:
-                    break
-                writer.write(data.encode())
-                await writer.drain()
-                cur_num_bytes += len(data)
 
+        with open(filename, 'rb') as f:
+            size = os.fstat(f.fileno()).st_size
+            # a range past the end of the replica is read as empty at its end
+            offset = min(offset, size)
+            end = max(offset, min(offset + num_bytes, size))
+            bytes_per_checksum, checksums = EDFSDataNode.read_checksums(f'{filename}{BLOCK_META_SUFFIX}', offset, end)
+            if bytes_per_checksum:
+                offset -= offset % bytes_per_checksum
+                end = min(size, DataChecksum.get_num_chunks(end, bytes_per_checksum) * bytes_per_checksum)
+            response = {"success": True, "offset": offset, "num_bytes": end - offset, "bytes_per_checksum": bytes_per_checksum}
+            writer.write(PacketUtils.encode(json.dumps(response).encode()))
+            writer.write(checksums)
+            await writer.drain()
+            if end > offset:
+                await asyncio.get_running_loop().sendfile(writer.transport, f, offset, end - offset)
+
+    # bytes per checksum and the checksums of the chunks covering [start, end),
+    # or (0, b"") for a block written without a meta file
+    @staticmethod
+    def read_checksums(meta_filename, start, end):
+        if not os.path.exists(meta_filename):
+            return 0, b""
+        with open(meta_filename, 'rb') as f:
+            version, bytes_per_checksum = DataChecksum.META_HEADER.unpack(f.read(DataChecksum.META_HEADER.size))
+            first_chunk = start // bytes_per_checksum
+            num_chunks = DataChecksum.get_num_chunks(end, bytes_per_checksum) - first_chunk
+            f.seek(DataChecksum.META_HEADER.size + first_chunk * DataChecksum.CHECKSUM_SIZE)
+            return bytes_per_checksum, f.read(max(0, num_chunks) * DataChecksum.CHECKSUM_SIZE)
 
     def get_all_block_ids(self):
-        return [BlockManager.get_file_block_id(filename) for filename in os.listdir(f'{DATANODE_DATA_DIR}/{self.name}') if filename.startswith(BLOCK_PREFIX)]
\ No newline at end of file
+        return [BlockManager.get_file_block_id(filename) for filename in os.listdir(f'{DATANODE_DATA_DIR}/{self.name}') if filename.startswith(BLOCK_PREFIX) and filename[len(BLOCK_PREFIX):].isdigit()]
\ No newline at end of file
@@ -1,153 +1,310 @@
 import asyncio
+import bisect
+import itertools
 import json
 import os
-import random
 
 from edfs.block_manager import BlockManager
+from edfs.block_placement_policy import BlockPlacementPolicy
+from edfs.checkpointer import Checkpointer
 from edfs.config import *
-from edfs.datanode_info import DataNodeInfo, DataNodeManager
+from edfs.datanode_info import DataNodeManager
 from edfs.editlog_manager import EditLogManager
+from edfs.fsimage import FSImage
+from edfs.heartbeat_manager import HeartbeatManager
 from edfs.inode_manager import InodeManager
+from edfs.replication_monitor import ReplicationMonitor
+from edfs.utils import PacketUtils
 
 
 class EDFSNameNode:
     def __init__(self):
-        fsimage = self.read_fsimage()
-        self.bm = BlockManager(fsimage)
-        self.im = InodeManager(fsimage, self.bm)
+        self.im, self.bm, txid = FSImage.load()
         self.dnm = DataNodeManager()
-        self.elm = EditLogManager(self.im, self.bm)
+        self.elm = EditLogManager(self.im, self.bm, txid)
         self.take_snapshot()
-
+        self.checkpointer = Checkpointer(self.elm)
+        self.placement_policy = BlockPlacementPolicy.create(BLOCK_PLACEMENT_POLICY, self.dnm)
+        self.heartbeat_manager = HeartbeatManager(self.dnm, self.bm, self.placement_policy)
+        self.replication_monitor = ReplicationMonitor(self.im, self.bm, self.dnm, self.placement_policy)
+
+    async def start(self):
+        self.checkpointer.start()
+        self.heartbeat_manager.start()
+        self.replication_monitor.start()
+
+    async def close(self):
+        self.checkpointer.close()
+        self.heartbeat_manager.close()
+        self.replication_monitor.close()
+        await self.elm.roll()
+
+    # requests on a connection run concurrently and are answered as they finish,
+    # so a call waiting on the edit log does not hold up the ones behind it
     async def handle_client(self, reader, writer):
-        data = await reader.read(BUF_LEN)
-        if not data:
-            writer.close()
+        client_ip = writer.get_extra_info("peername")[0]
+        tasks = set()
+        while True:
+            data = await PacketUtils.read_packet(reader)
+            if data is None:
+                break
+
+            task = asyncio.create_task(self.handle_request(data, client_ip, writer))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+
+        if tasks:
+            await asyncio.wait(tasks)
+        writer.close()
+
+    # a request that fails gets an error response, the connection stays open
+    async def handle_request(self, data, client_ip, writer):
+        req_id = None
+        try:
+            request = json.loads(data.decode())
+            req_id = request.get("req_id")
+            request.setdefault("client_ip", client_ip)
+            response = await self.dispatch(request)
+        except Exception as e:
+            print(f'DBG: request {req_id} from {client_ip} failed: {e!r}')
+            response = {"success": False, "msg": f'{type(e).__name__}: {e}'}
+        response["req_id"] = req_id
+
+        if writer.is_closing():
             return
+        writer.write(PacketUtils.encode(json.dumps(response).encode()))
+        try:
+            await writer.drain()
+        except ConnectionError:
+            pass
 
-        request = json.loads(data.decode())
+    async def dispatch(self, request):
         command = request.get("cmd")
         if command == CMD_LS:
-            await self.ls(writer, request.get("path"))
+            return await self.ls(request)
         elif command == CMD_MKDIR:
-            await self.mkdir(writer, request.get("path"))
+            return await self.mkdir(request.get("path"))
         elif command == CMD_RMDIR:
-            await self.rmdir(writer, request.get("path"))
+            return await self.rmdir(request.get("path"))
         elif command == CMD_CREATE:
-            await self.create(reader, writer, request)
+            return await self.create(request)
         elif command == CMD_RM:
-            await self.rm(request)
+            return await self.rm(request)
         elif command == CMD_MV:
-            await self.mv(request)
+            return await self.mv(request)
         elif command == CMD_TREE:
-            await self.tree(writer,request.get("path"))
+            return await self.tree(request)
         elif command == DN_CMD_REGISTER:
-            await self.register_datanode(writer, request)
+            return await self.register_datanode(request)
+        elif command == DN_CMD_HEARTBEAT:
+            return await self.heartbeat(request)
+        elif command == DN_CMD_INCREMENTAL_BLOCK_REPORT:
+            return await self.incremental_block_report(request)
+        elif command == DN_CMD_BLOCK_REPORT:
+            return await self.block_report(request)
+        elif command == DN_CMD_BAD_BLOCKS:
+            return await self.report_bad_blocks(request)
         elif command == CMD_ADD_BLOCK:
-            await self.add_block(writer, request)
+            return await self.add_block(request)
         elif command == CMD_GET_BLOCK_LOCATIONS:
-            await self.get_block_locations(writer, request)
+            return await self.get_block_locations(request)
+        elif command == CMD_COMMIT_BLOCK:
+            return await self.commit_block(request)
         elif command == CMD_CREATE_COMPLETE:
-            await self.create_complete(request)
+            return await self.create_complete(request)
         elif command == CMD_FILE_EXISTS:
-            await self.exists(writer, request)
+            return await self.exists(request)
         elif command == CMD_IS_DIR:
-            await self.is_dir(writer, request)
+            return await self.is_dir(request)
         elif command == CMD_IS_IDENTICAL:
-            await self.is_identical(writer, request)
+            return await self.is_identical(request)
         elif command == CMD_IS_ROOT_DIR:
-            await self.is_root_dir(writer, request)
+            return await self.is_root_dir(request)
         elif command == CMD_IS_DIR_EMPTY:
-            await self.is_dir_empty(writer, request)
-
-        writer.close()
-
-    async def ls(self, writer, path):
+            return await self.is_dir_empty(request)
+        elif command == CMD_GET_METRICS:
+            return await self.get_metrics()
+        elif command == CMD_STAT:
+            return await self.stat(request)
+        elif command == CMD_BATCH:
+            return await self.batch(request)
+        return {"success": False, "msg": f'Unknown command: {command}'}
+
+    async def ls(self, request):
+        path = request.get("path")
         inode = self.im.get_inode_from_path(path)
         if inode is None:
             response = {"success": False, "msg": f'ls: {path}: No such file or directory'}
-            writer.write(json.dumps(response).encode())
-            return
+            return response
 
-        entries = []
         if inode.is_file():
-            entries.append(inode.get_path())
-        else:
-            for dirent in inode.get_dirents():
-                if dirent.name != "." and dirent.name != "..":
-                    entries.append(dirent.inode.get_path())
+            response = {"success": True, "entries": [inode.get_path()], "total": 1, "has_more": False}
+            return response
+
+        limit = min(request.get("limit") or LIST_PAGE_SIZE, LIST_MAX_PAGE_SIZE)
+        children = self.im.list_dir(inode, request.get("start_after"), limit + 1)
+        dir_path = inode.get_path()
+        entries = [f'{dir_path}/{child.get_name()}' for child in children[:limit]]
 
-        response = {"success": True, "entries": entries}
-        writer.write(json.dumps(response).encode())
-        await writer.drain()
+        response = {"success": True, "entries": entries, "total": inode.get_num_children(), "has_more": len(children) > limit}
+        return response
 
-    async def mkdir(self, writer, path):
+    async def mkdir(self, path):
         base_dir_inode, filename = self.im.get_baseinode_and_filename(path)
+        if filename == "" or self.im.get_inode_from_path(path) is not None:
+            return {"success": False, "error": ERR_FILE_EXIST, "path": path}
+        elif base_dir_inode is None:
+            return {"success": False, "error": ERR_FILE_NOT_FOUND, "path": os.path.dirname(path.rstrip(" /"))}
+        elif base_dir_inode.is_file():
+            return {"success": False, "error": ERR_NOT_DIR, "path": os.path.dirname(path.rstrip(" /"))}
 
         new_dir_inode = self.im.create_dir(base_dir_inode, filename)
         log = {"edit_type": EDIT_TYPE_MKDIR, "parent": base_dir_inode.get_id(), "name": new_dir_inode.get_name()}
-        self.elm.write_log(log)
+        await self.elm.write_log(log)
         response = {"success": True, "msg": f'mkdir: {path}: successfully created with inode number {new_dir_inode.get_id()}'}
 
-        writer.write(json.dumps(response).encode())
-        await writer.drain()
+        return response
 
-    async def rmdir(self, writer, path):
+    async def rmdir(self, path):
         inode = self.im.get_inode_from_path(path)
+        if inode == self.im.root_inode:
+            return {"success": False, "error": ERR_IS_ROOT, "path": path}
+        elif inode is None:
+            return {"success": False, "error": ERR_FILE_NOT_FOUND, "path": path}
+        elif inode.is_file():
+            return {"success": False, "error": ERR_NOT_DIR, "path": path}
+        elif inode.get_num_children() > 0:
+            return {"success": False, "error": ERR_DIR_NOT_EMPTY, "path": path}
+
         parent = inode.get_parent_inode()
         self.im.remove_dir(parent, inode)
         log = {"edit_type": EDIT_TYPE_RMDIR, "parent": parent.get_id(), "remove": inode.get_id(), "name": inode.get_name()}
-        self.elm.write_log(log)
+        await self.elm.write_log(log)
         response = {"success": True, "msg": f'rmdir: {path}: successfully removed the directory'}
 
-        writer.write(json.dumps(response).encode())
-        await writer.drain()
+        return response
+
+    # when the path is an existing directory and default_name is given,
+    # the file is created inside that directory
+    async def create(self, request):
+        path, default_name = request.get("path"), request.get("default_name")
+        inode = self.im.get_inode_from_path(path)
+        if default_name and inode is not None and inode.is_dir():
+            path = f'{path.rstrip("/")}/{default_name}'
+            inode = inode.get_child_inode_by_name(default_name)
 
-    async def create(self, reader, writer, request):
-        path = request.get("path")
         base_dir_inode, filename = self.im.get_baseinode_and_filename(path)
         if base_dir_inode is None:
-            response = {"success": False, "error": ERR_FILE_NOT_FOUND}
-        elif filename == "" or base_dir_inode.get_child_inode_by_name(filename) != None:
-            response = {"success": False, "error": ERR_FILE_EXIST}
+            response = {"success": False, "error": ERR_FILE_NOT_FOUND, "path": os.path.dirname(path.rstrip(" /"))}
+        elif base_dir_inode.is_file():
+            response = {"success": False, "error": ERR_NOT_DIR, "path": os.path.dirname(path.rstrip(" /"))}
+        elif inode is not None and inode.is_dir():
+            response = {"success": False, "error": ERR_IS_DIR, "path": path}
+        elif filename == "" or inode is not None:
+            response = {"success": False, "error": ERR_FILE_EXIST, "path": path}
         else:
             new_file_inode = self.im.create_file(base_dir_inode, filename)
             log = {"edit_type": EDIT_TYPE_CREATE, "parent": base_dir_inode.get_id(), "name": new_file_inode.get_name()}
-            self.elm.write_log(log)
-            response = {"success": True, "inode_id": new_file_inode.get_id()}
-
-        writer.write(json.dumps(response).encode())
-        await writer.drain()
+            await self.elm.write_log(log)
+            response = {"success": True, "inode_id": new_file_inode.get_id(), "path": path}
 
-        return
+        return response
 
     async def create_complete(self, request):
         path = request.get("path")
+        inode = self.im.get_inode_from_path(path)
+        if inode is not None and inode.is_file() and request.get("last"):
+            await self.commit_block_length(inode.get_id(), request.get("last"))
         print(f'DBG: Finish creating {path}')
+        return {"success": True}
 
     async def rm(self, request):
         path = request.get("path")
         inode = self.im.get_inode_from_path(path)
+        if inode is None:
+            return {"success": False, "error": ERR_FILE_NOT_FOUND, "path": path}
+        elif inode.is_dir():
+            return {"success": False, "error": ERR_IS_DIR, "path": path}
+
         self.im.rm(inode)
 
         log = {"edit_type": EDIT_TYPE_RM, "inode_id": inode.get_id()}
-        self.elm.write_log(log)
+        await self.elm.write_log(log)
 
-        print(f'DBG: {inode.get_path()} is successfully removed')
+        print(f'DBG: {path} is successfully removed')
+        return {"success": True}
 
+    # if des is an existing directory, src is moved into it, otherwise src is renamed to des
     async def mv(self, request):
         src, des = request.get("src"), request.get("des")
         src_inode = self.im.get_inode_from_path(src)
-        des_dir_inode, filename = self.im.get_baseinode_and_filename(des)
+        if src_inode is None:
+            return {"success": False, "error": ERR_FILE_NOT_FOUND, "path": src}
+
+        des_inode = self.im.get_inode_from_path(des)
+        if des_inode is None:
+            des_dir_inode, filename = self.im.get_baseinode_and_filename(des)
+            if des_dir_inode is None or des_dir_inode.is_file():
+                return {"success": False, "error": ERR_FILE_NOT_FOUND, "path": os.path.dirname(des.rstrip("/"))}
+            target = des
+        elif des_inode.is_dir():
+            des_dir_inode, filename = des_inode, src_inode.get_name()
+            target = f'{des.rstrip("/")}/{filename}'
+            target_inode = des_dir_inode.get_child_inode_by_name(filename)
+            if target_inode == src_inode:
+                return {"success": False, "error": ERR_IDENTICAL, "path": target}
+            elif target_inode is not None:
+                return {"success": False, "error": ERR_FILE_EXIST, "path": target}
+        else:
+            return {"success": False, "error": ERR_FILE_EXIST, "path": des}
+
+        if src_inode.is_dir() and self.im.is_ancestor(src_inode, des_dir_inode):
+            return {"success": False, "error": ERR_SUBDIR, "path": des}
 
         self.im.move(src_inode, des_dir_inode, filename)
 
         log = {"edit_type": EDIT_TYPE_MV, "src_inode_id": src_inode.get_id(), "des_inode_id": des_dir_inode.get_id(), "name": filename}
-        self.elm.write_log(log)
+        await self.elm.write_log(log)
 
-        print(f'DBG: {src} is successfully moved to {des}')
+        print(f'DBG: {src} is successfully moved to {target}')
+        return {"success": True, "path": target}
 
-    async def is_root_dir(self, writer, request):
+    async def stat(self, request):
+        return {"success": True, "stats": [self.get_stat(path) for path in request.get("paths")]}
+
+    def get_stat(self, path):
+        inode = self.im.get_inode_from_path(path)
+        if inode is None:
+            return {"exists": False}
+
+        size = 0
+        if inode.is_file():
+            size = sum(self.bm.get_block_by_id(block_id).get_num_bytes() for block_id in inode.get_blocks())
+        return {
+            "exists": True,
+            "inode_id": inode.get_id(),
+            "type": inode.get_type(),
+            "is_dir": inode.is_dir(),
+            "is_root": inode == self.im.root_inode,
+            "is_empty": inode.is_dir() and inode.get_num_children() == 0,
+            "size": size
+        }
+
+    # runs the requests in order and returns all their responses in one reply
+    async def batch(self, request):
+        responses = []
+        for sub_request in request.get("requests"):
+            # sub-requests are placed for the client of the batch, and one that fails
+            # does not abort the others
+            sub_request.setdefault("client_ip", request.get("client_ip"))
+            try:
+                responses.append(await self.dispatch(sub_request))
+            except Exception as e:
+                print(f'DBG: batched {sub_request.get("cmd")} request failed: {e!r}')
+                responses.append({"success": False, "error": f'{type(e).__name__}: {e}'})
+        return {"success": True, "responses": responses}
+
+    async def is_root_dir(self, request):
         path = request.get("path")
         inode = self.im.get_inode_from_path(path)
         if inode == self.im.root_inode:
@@ -155,10 +312,9 @@ class EDFSNameNode:
         else:
             response = {"is_root": False}
 
-        writer.write(json.dumps(response).encode())
-        await writer.drain()
+        return response
 
-    async def exists(self, writer, request):
+    async def exists(self, request):
         path = request.get("path")
         inode = self.im.get_inode_from_path(path)
         if inode is None:
@@ -166,10 +322,9 @@ class EDFSNameNode:
         else:
             response = {"exists": True}
 
-        writer.write(json.dumps(response).encode())
-        await writer.drain()
+        return response
 
-    async def is_dir(self, writer, request):
+    async def is_dir(self, request):
         path = request.get("path")
         inode = self.im.get_inode_from_path(path)
         if inode is None or inode.is_file():
@@ -177,21 +332,19 @@ class EDFSNameNode:
         else:
             response = {"is_dir": True}
 
-        writer.write(json.dumps(response).encode())
-        await writer.drain()
+        return response
 
-    async def is_dir_empty(self, writer, request):
+    async def is_dir_empty(self, request):
         path = request.get("path")
         inode = self.im.get_inode_from_path(path)
-        if inode is None or inode.is_file() or len(inode.get_dirents()) > 2:
+        if inode is None or inode.is_file() or inode.get_num_children() > 0:
             response = {"is_dir_empty": False}
         else:
             response = {"is_dir_empty": True}
 
-        writer.write(json.dumps(response).encode())
-        await writer.drain()
+        return response
 
-    async def is_identical(self, writer, request):
+    async def is_identical(self, request):
         path1, path2 = request.get("path1"), request.get("path2")
         inode1 = self.im.get_inode_from_path(path1)
         inode2 = self.im.get_inode_from_path(path2)
@@ -201,119 +354,138 @@ class EDFSNameNode:
         else:
             response = {"is_identical": True}
 
-        writer.write(json.dumps(response).encode())
-        await writer.drain()
+        return response
+
+    async def get_metrics(self):
+        return {"success": True, "path_cache": self.im.get_path_cache_stats(), "corrupt_replicas": self.bm.get_num_corrupt_replicas(), "pending_deletes": self.bm.get_num_pending_deletes(),
+                "replication": self.replication_monitor.get_stats(), "datanodes": [datanode_info.get_stats() for datanode_info in self.dnm.get_all_datanodes()]}
 
-    async def tree(self, writer, path):
+    async def tree(self, request):
+        path = request.get("path")
         inode = self.im.get_inode_from_path(path)
         if inode is None:
             response = {"success": False, "msg": f'tree: {path}: No such file or directory'}
-            writer.write(json.dumps(response).encode())
-            return
-        response = {"success": True, "files": self.get_all_files(inode)}
-        writer.write(json.dumps(response).encode())
-        await writer.drain()
-
-    def get_all_files(self, inode):
-        children = []
-        for dirent in inode.get_dirents():
-            if dirent.name != "." and dirent.name != "..":
-                children.append(self.get_all_files(dirent.inode))
-        return {"name": inode.get_name(), "type": inode.get_type(), "path": inode.get_path(), "children": children}
-
-    def read_fsimage(self):
-        if not os.path.exists(NAMENODE_METADATA_DIR):
-            os.makedirs(NAMENODE_METADATA_DIR)
-
-        if not os.path.exists(f'{NAMENODE_METADATA_DIR}/{FSIMAGE_FILENAME}'):
-            with open(f'{NAMENODE_METADATA_DIR}/{FSIMAGE_FILENAME}', 'w') as f:
-                fsimage = {"inodes": [{"id": INODE_ID_START, "type": "DIRECTORY", "name": ""}], "directories": [], "freeBlocks": []}
-                json.dump(fsimage, f)
-        else:
-            with open(f'{NAMENODE_METADATA_DIR}/{FSIMAGE_FILENAME}', 'r') as f:
-                fsimage = json.load(f)
+            return response
 
-        return fsimage
+        limit = min(request.get("limit") or LIST_PAGE_SIZE, LIST_MAX_PAGE_SIZE)
+        entries = []
+        for child, child_path, depth in itertools.islice(self.im.walk_tree(inode, request.get("start_after")), limit + 1):
+            entries.append({"name": child.get_name(), "type": child.get_type(), "path": child_path, "depth": depth})
+
+        response = {"success": True, "entries": entries[:limit], "has_more": len(entries) > limit}
+        return response
 
     def take_snapshot(self):
         self.elm.process_edit_logs()
-
-        inodes = []
-        directories = []
-        for inode in self.im.get_all_inodes():
-            if inode.is_file():
-                blocks = []
-                for block_id in inode.get_blocks():
-                    blk = self.bm.get_block_by_id(block_id)
-                    blocks.append({"id":  blk.get_id(), "numBytes": blk.get_num_bytes()})
-
-                inodes.append({
-                    "id": inode.get_id(),
-                    "type": inode.get_type(),
-                    "name":  inode.get_name(),
-                    "replication": inode.get_replication(),
-                    "preferredBlockSize": inode.get_preferredBlockSize(),
-                    "blocks": blocks
-                })
-            else:
-                inodes.append({
-                    "id": inode.get_id(),
-                    "type": inode.get_type(),
-                    "name":  inode.get_name(),
-                })
-
-                children_ids = inode.get_children_ids()
-                if children_ids:
-                    directories.append({
-                        "parent": inode.get_id(),
-                        "children": children_ids
-                    })
-        fsimage = {"inodes": inodes, "directories": directories, "freeBlocks": self.bm.get_free_block_ids()}
-        with open(f'{NAMENODE_METADATA_DIR}/{FSIMAGE_FILENAME}', 'w') as f:
-            json.dump(fsimage, f, indent=2)
-
+        FSImage.save(self.im, self.bm, self.elm.get_last_txid())
         self.elm.remove_edit_logs()
 
-    async def register_datanode(self, writer, request):
-        datanode_info = DataNodeInfo(request.get("ip"), request.get("port"), request.get("name"))
-        self.dnm.register(datanode_info)
-        blocks = request.get("blocks")
-        for block_id in blocks:
-            self.bm.add_block_loc(block_id, datanode_info.get_id())
+    async def register_datanode(self, request):
+        datanode_info = self.dnm.register(request.get("ip"), request.get("port"), request.get("name"))
+        datanode_info.update_heartbeat(request.get("capacity"), request.get("dfs_used"), request.get("remaining"), 0)
+        self.placement_policy.update_datanode(datanode_info)
         response = {
             "success": True,
             "msg": f'Datanode {datanode_info.get_id()} ({datanode_info.get_name()}): {datanode_info.get_ip()}:{datanode_info.get_port()}'
         }
-        writer.write(json.dumps(response).encode())
-        await writer.drain()
-
-    async def add_block(self, writer, request):
+        return response
+
+    # reply with queued commands; a datanode the namenode does not know as live registers again
+    async def heartbeat(self, request):
+        datanode_info = self.dnm.get_datanode_by_addr(request.get("ip"), request.get("port"))
+        if datanode_info is None or not datanode_info.is_alive():
+            return {"success": True, "commands": [{"cmd": NN_CMD_REGISTER}]}
+
+        datanode_info.update_heartbeat(request.get("capacity"), request.get("dfs_used"), request.get("remaining"), request.get("active_transfers"))
+        self.placement_policy.update_datanode(datanode_info)
+        commands = datanode_info.get_commands()
+        invalidate = self.bm.get_invalidate_batch(datanode_info.get_id(), INVALIDATE_BATCH_SIZE)
+        if invalidate:
+            commands.append({"cmd": NN_CMD_INVALIDATE, "blocks": invalidate})
+        return {"success": True, "commands": commands}
+
+    async def incremental_block_report(self, request):
+        datanode_info = self.dnm.get_datanode_by_addr(request.get("ip"), request.get("port"))
+        if datanode_info is None or not datanode_info.is_alive():
+            return {"success": False}
+        self.bm.process_block_report(datanode_info.get_id(), request.get("received"))
+        for _ in request.get("received"):
+            datanode_info.decr_blocks_scheduled()
+        self.placement_policy.update_datanode(datanode_info)
+        self.bm.confirm_deleted(datanode_info.get_id(), request.get("deleted"))
+        return {"success": True}
+
+    # a full report may be split over several messages, it is applied once the last one arrives
+    async def block_report(self, request):
+        datanode_info = self.dnm.get_datanode_by_addr(request.get("ip"), request.get("port"))
+        if datanode_info is None or not datanode_info.is_alive():
+            return {"success": False}
+        if request.get("first") or datanode_info.block_report is None:
+            datanode_info.block_report = set()
+        datanode_info.block_report.update(request.get("blocks"))
+        if request.get("last"):
+            self.bm.process_full_block_report(datanode_info.get_id(), datanode_info.block_report)
+            print(f'DBG: processed full block report of {len(datanode_info.block_report)} blocks from datanode {datanode_info.get_name()}')
+            datanode_info.block_report = None
+        return {"success": True}
+
+    # corrupt replicas stop being returned as locations
+    async def report_bad_blocks(self, request):
+        datanode_info = self.dnm.get_datanode_by_addr(request.get("ip"), request.get("port"))
+        if datanode_info is None:
+            return {"success": False}
+        for block_id in request.get("blocks"):
+            self.bm.mark_corrupt(block_id, datanode_info.get_id())
+            print(f'DBG: datanode {datanode_info.get_name()} reported corrupt replica of block {block_id}')
+        return {"success": True}
+
+    # the client streams a block before its length is known, the length is committed
+    # once the block is acked or when the file is complete
+    async def add_block(self, request):
         inode_id = request.get("inode_id")
-        num_bytes = request.get("num_bytes")
-        blk = self.bm.allocate_block_for(inode_id, num_bytes)
+        inode = self.im.get_inode_by_id(inode_id)
+        if inode is None:
+            return {"success": False, "error": ERR_FILE_NOT_FOUND}
+
+        blk_locs = self.placement_policy.choose_targets(inode.get_replication(), request.get("client_ip"))
+        if not blk_locs:
+            return {"success": False, "error": ERR_NO_DATANODES}
+        blk = self.bm.allocate_block_for(inode_id, 0)
         self.im.add_block_to(inode_id, blk.get_id())
-        blk_locs = self.select_block_locs(REPLICATION_FACTOR)
         blk_locs_info = []
         for datanode_info in blk_locs:
             blk_locs_info.append(datanode_info.get_info())
-            blk.add_loc(datanode_info.get_id())
+            self.bm.add_loc(blk, datanode_info.get_id())
+        # logged before any replica is written so that a restart never hands the id out again
+        log = {"edit_type": EDIT_TYPE_ALLOCATE_BLOCK, "inode_id": inode_id, "block_id": blk.get_id()}
+        await self.elm.write_log(log)
 
-        log = {"edit_type": EDIT_TYPE_ADD_BLOCK, "inode_id": inode_id, "block_id": blk.get_id(), "num_bytes": blk.get_num_bytes()}
-        self.elm.write_log(log)
         response = {"success": True, "inode_id": inode_id, "block_id": blk.get_id(), "blk_locs_info": blk_locs_info}
 
-        writer.write(json.dumps(response).encode())
-        await writer.drain()
-
-        print(f'DBG: client request to add block {blk.get_id()} ({blk.get_num_bytes()} bytes)')
-        return
+        print(f'DBG: client request to add block {blk.get_id()}')
+        return response
 
-    # TODO: for simplicity, we randomly choose from all datanodes
-    def select_block_locs(self, num):
-        datanodes = self.dnm.get_all_datanodes()
-        return random.sample(datanodes, num)
+    # the length is logged once it is known, a block of a file removed meanwhile
+    # is not
+    async def commit_block(self, request):
+        inode_id = request.get("inode_id")
+        if self.im.get_inode_by_id(inode_id) is None:
+            return {"success": False, "error": ERR_FILE_NOT_FOUND}
+        await self.commit_block_length(inode_id, request.get("block"))
+        return {"success": True}
+
+    async def commit_block_length(self, inode_id, committed):
+        blk = self.bm.get_block_by_id(committed.get("block_id"))
+        if blk is None or blk.get_inode_id() != inode_id:
+            return
+        self.im.commit_block(inode_id, blk, committed.get("num_bytes"))
+        log = {"edit_type": EDIT_TYPE_ADD_BLOCK, "inode_id": inode_id, "block_id": blk.get_id(), "num_bytes": blk.get_num_bytes()}
+        await self.elm.write_log(log)
+        print(f'DBG: committed block {blk.get_id()} ({blk.get_num_bytes()} bytes)')
 
-    async def get_block_locations(self, writer, request):
+    # the blocks overlapping [offset, offset + length), or all blocks from offset
+    # on if no length is given
+    async def get_block_locations(self, request):
         path = request.get("path")
         inode = self.im.get_inode_from_path(path)
         if inode is None:
@@ -322,16 +494,19 @@ class EDFSNameNode:
             response = {"success": False, "error": ERR_IS_DIR}
         else:
             block_ids = inode.get_blocks()
+            offsets = self.im.get_block_offsets(inode)
+            offset, length = request.get("offset") or 0, request.get("length")
+            start = bisect.bisect_right(offsets, offset)
+            end = len(block_ids) if length is None else min(len(block_ids), bisect.bisect_left(offsets, offset + length) + 1)
             block_locations = []
-            for block_id in block_ids:
+            for i in range(start, end):
                 locs = []
-                blk = self.bm.get_block_by_id(block_id)
+                blk = self.bm.get_block_by_id(block_ids[i])
                 datanode_ids = blk.get_locs()
                 for datanode_id in datanode_ids:
                     datanode_info = self.dnm.get_datanode_by_id(datanode_id)
                     locs.append(datanode_info.get_info())
-                block_locations.append({"block_id": block_id, "num_bytes": blk.get_num_bytes(), "locs": locs})
+                block_locations.append({"block_id": block_ids[i], "offset": offsets[i - 1] if i > 0 else 0, "num_bytes": blk.get_num_bytes(), "locs": locs})
 
-            response = {"success": True, "block_locations": block_locations}
-        writer.write(json.dumps(response).encode())
-        await writer.drain()
+            response = {"success": True, "file_length": offsets[-1] if offsets else 0, "block_locations": block_locations}
+        return response
@@ -1,39 +1,112 @@
+import asyncio
 import json
 import os
 
 from edfs.block import Block
 from edfs.config import *
 
+# Edits are appended as newline-delimited JSON records, each tagged with a
+# transaction id, to segment files named after the first txid they hold.
+# Records logged while a write is in flight are committed together with the
+# next write (and fsync), so concurrent mutations share one sync.
 class EditLogManager:
-    def __init__(self, inode_manager, block_manager):
-        self.last_edit_log_id = 0
+    def __init__(self, inode_manager, block_manager, last_txid=0):
         self.im = inode_manager
         self.bm = block_manager
+        self.last_txid = last_txid
+        self.segment = None
+        self.segment_num_txns = 0
+        self.pending = []
+        self.flush_task = None
 
-    def write_log(self, log):
-        with open(self.get_next_edit_log_filename(), 'w') as output:
-                json.dump(log, output)
+    async def write_log(self, log):
+        self.last_txid += 1
+        record = json.dumps(dict(log, txid=self.last_txid))
+        future = asyncio.get_running_loop().create_future()
+        self.pending.append((self.last_txid, record, future))
+        if self.flush_task is None:
+            self.flush_task = asyncio.create_task(self.flush())
+        await future
 
-    def process_edit_logs(self):
-        edit_log_filenames = [filename for filename in os.listdir(NAMENODE_METADATA_DIR) if filename.startswith(EDIT_LOG_PREFIX)]
-        edit_log_filenames.sort()
-        for filename in edit_log_filenames:
+    async def flush(self):
+        loop = asyncio.get_running_loop()
+        while self.pending:
+            batch, self.pending = self.pending, []
+            try:
+                await loop.run_in_executor(None, self.write_batch, batch[0][0], [record for _, record, _ in batch])
+            except Exception as e:
+                for _, _, future in batch:
+                    future.set_exception(e)
+                continue
+            for _, _, future in batch:
+                future.set_result(None)
+        self.flush_task = None
+
+    def write_batch(self, first_txid, records):
+        if self.segment is None or self.segment_num_txns >= EDIT_LOG_SEGMENT_SIZE:
+            self.roll_segment(first_txid)
+
+        self.segment.write("\n".join(records) + "\n")
+        self.segment.flush()
+        if EDIT_LOG_FSYNC:
+            os.fsync(self.segment.fileno())
+        self.segment_num_txns += len(records)
+
+    def roll_segment(self, first_txid):
+        self.close()
+        self.segment = open(self.get_edit_log_filename(first_txid), 'a')
+
+    # finalize the current segment once every pending record is durable and
+    # return the last txid it holds; the next record starts a new segment
+    async def roll(self):
+        while self.flush_task is not None:
+            await asyncio.shield(self.flush_task)
+        self.close()
+        return self.last_txid
+
+    def close(self):
+        if self.segment is not None:
+            self.segment.close()
+            self.segment = None
+        self.segment_num_txns = 0
+
+    # replay every record after the current txid, up to and including last_txid
+    def process_edit_logs(self, last_txid=None):
+        for filename in self.get_edit_log_filenames():
             with open(f'{NAMENODE_METADATA_DIR}/{filename}', 'r') as f:
-                log = json.load(f)
-
-            edit_type = log.get("edit_type")
-            if edit_type == EDIT_TYPE_MKDIR:
-                self.process_mkdir_editlog(log)
-            elif edit_type == EDIT_TYPE_RMDIR:
-                self.process_rmdir_editlog(log)
-            elif edit_type == EDIT_TYPE_CREATE:
-                self.process_create_editlog(log)
-            elif edit_type == EDIT_TYPE_ADD_BLOCK:
-                self.process_add_block_editlog(log)
-            elif edit_type == EDIT_TYPE_RM:
-                self.process_rm_editlog(log)
-            elif edit_type == EDIT_TYPE_MV:
-                self.process_mv_editlog(log)
+                for line in f:
+                    if not line.strip():
+                        continue
+                    try:
+                        log = json.loads(line)
+                    except ValueError:
+                        print(f'DBG: ignoring torn edit log record at the end of {filename}')
+                        break
+
+                    txid = log.get("txid", self.last_txid + 1)
+                    if txid <= self.last_txid:
+                        continue
+                    if last_txid is not None and txid > last_txid:
+                        return
+                    self.process_edit_log(log)
+                    self.last_txid = txid
+
+    def process_edit_log(self, log):
+        edit_type = log.get("edit_type")
+        if edit_type == EDIT_TYPE_MKDIR:
+            self.process_mkdir_editlog(log)
+        elif edit_type == EDIT_TYPE_RMDIR:
+            self.process_rmdir_editlog(log)
+        elif edit_type == EDIT_TYPE_CREATE:
+            self.process_create_editlog(log)
+        elif edit_type == EDIT_TYPE_ADD_BLOCK:
+            self.process_add_block_editlog(log)
+        elif edit_type == EDIT_TYPE_RM:
+            self.process_rm_editlog(log)
+        elif edit_type == EDIT_TYPE_MV:
+            self.process_mv_editlog(log)
+        elif edit_type == EDIT_TYPE_ALLOCATE_BLOCK:
+            self.process_allocate_block_editlog(log)
 
     def process_mkdir_editlog(self, log):
         parent_id,  name = log.get("parent"), log.get("name")
@@ -51,8 +124,18 @@ class EditLogManager:
         parent_inode = self.im.id_to_inode[parent_id]
         self.im.create_file(parent_inode, name)
 
+    def process_allocate_block_editlog(self, log):
+        inode_id, block_id = log.get("inode_id"), log.get("block_id")
+        self.bm.register_block(Block(block_id, inode_id, 0, []))
+        self.im.add_block_to(inode_id, block_id)
+
+    # commits the length of an allocated block, logs without an allocation add the block
     def process_add_block_editlog(self, log):
         inode_id, block_id, num_bytes = log.get("inode_id"), log.get("block_id"), log.get("num_bytes")
+        blk = self.bm.get_block_by_id(block_id)
+        if blk is not None and blk.get_inode_id() == inode_id:
+            self.im.commit_block(inode_id, blk, num_bytes)
+            return
         blk = Block(block_id, inode_id, num_bytes, [])
         self.bm.register_block(blk)
         self.im.add_block_to(inode_id, block_id)
@@ -67,11 +150,26 @@ class EditLogManager:
         src_inode, des_inode = self.im.get_inode_by_id(src_inode_id), self.im.get_inode_by_id(des_inode_id)
         self.im.move(src_inode, des_inode, name)
 
-    def get_next_edit_log_filename(self):
-        self.last_edit_log_id += 1
-        return f'{NAMENODE_METADATA_DIR}/{EDIT_LOG_PREFIX}{"0" * (8 - len(str(self.last_edit_log_id)))}{self.last_edit_log_id}'
+    def get_last_txid(self):
+        return self.last_txid
 
-    def remove_edit_logs(self):
+    def get_edit_log_filename(self, first_txid):
+        return f'{NAMENODE_METADATA_DIR}/{EDIT_LOG_PREFIX}{"0" * (8 - len(str(first_txid)))}{first_txid}'
+
+    def get_edit_log_filenames(self):
         edit_log_filenames = [filename for filename in os.listdir(NAMENODE_METADATA_DIR) if filename.startswith(EDIT_LOG_PREFIX)]
-        for filename in edit_log_filenames:
+        edit_log_filenames.sort(key=lambda filename: int(filename.replace(EDIT_LOG_PREFIX, "")))
+        return edit_log_filenames
+
+    # remove the segments that only hold records up to txid
+    def purge_edit_logs(self, txid):
+        filenames = self.get_edit_log_filenames()
+        for i, filename in enumerate(filenames):
+            if i + 1 >= len(filenames) or int(filenames[i + 1].replace(EDIT_LOG_PREFIX, "")) > txid + 1:
+                break
+            os.remove(f'{NAMENODE_METADATA_DIR}/{filename}')
+
+    def remove_edit_logs(self):
+        self.close()
+        for filename in self.get_edit_log_filenames():
             os.remove(f'{NAMENODE_METADATA_DIR}/{filename}')
@@ -1,48 +1,106 @@
 import asyncio
-import json
-import random
+import bisect
 
+from collections import deque
+from edfs.block_reader import BlockReader
 from edfs.config import *
 
 class FSDataInputStream:
-    def __init__(self, block_locations):
+    def __init__(self, rpc, path, located_blocks, replica_scorer):
+        self.rpc = rpc
+        self.replica_scorer = replica_scorer
+        self.path = path
+        self.file_length = located_blocks.get("file_length")
+        # locations of a window of blocks, more are fetched when the stream leaves it
+        self.set_block_locations(located_blocks.get("block_locations"))
+        # offset in the file of the next byte to return
+        self.pos = 0
+        # readers of the block at pos and of up to READ_AHEAD_BLOCKS blocks after it
+        self.block_readers = deque()
+
+    def set_block_locations(self, block_locations):
         self.block_locations = block_locations
-        self.block_num = 0
-        self.reader = None
-        self.writer = None
-        self.num_bytes = 0
-        self.cur_num_bytes = 0
-        # print(self.block_locations)
+        self.block_offsets = [block.get("offset") for block in block_locations]
+
+    async def get_block_at(self, pos):
+        idx = bisect.bisect_right(self.block_offsets, pos) - 1
+        if idx < 0 or pos >= self.block_offsets[idx] + self.block_locations[idx].get("num_bytes"):
+            response = await self.rpc.call({"cmd": CMD_GET_BLOCK_LOCATIONS, "path": self.path, "offset": pos, "length": READ_PREFETCH_SIZE})
+            if not response.get("success") or not response.get("block_locations"):
+                raise IOError(f'Could not get the locations of {self.path} at offset {pos}')
+            self.set_block_locations(response.get("block_locations"))
+            idx = 0
+        return self.block_locations[idx]
+
     def close(self):
-        pass
+        for block_reader in self.block_readers:
+            block_reader.close()
+        self.block_readers.clear()
+
+    def tell(self):
+        return self.pos
+
+    # the blocks read ahead of the old position are dropped, the next read starts at pos
+    def seek(self, pos):
+        if pos < 0 or pos > self.file_length:
+            raise IOError(f'Cannot seek to offset {pos} of {self.path}, its length is {self.file_length}')
+        if pos != self.pos:
+            self.close()
+            self.pos = pos
+
+    # up to length bytes at offset, without moving the stream position; the blocks
+    # of the range are fetched concurrently and only for the bytes in the range
+    async def pread(self, offset, length):
+        if offset < 0 or offset > self.file_length:
+            raise IOError(f'Cannot read at offset {offset} of {self.path}, its length is {self.file_length}')
+        end = min(offset + length, self.file_length)
+        block_readers = []
+        try:
+            while offset < end:
+                block = await self.get_block_at(offset)
+                block_end = min(block.get("num_bytes"), end - block.get("offset"))
+                block_reader = BlockReader(block, offset - block.get("offset"), self.replica_scorer, block_end)
+                block_reader.start()
+                block_readers.append(block_reader)
+                offset = block.get("offset") + block_end
+            data = await asyncio.gather(*[block_reader.read_all() for block_reader in block_readers])
+        finally:
+            for block_reader in block_readers:
+                block_reader.close()
+        return b"".join(data)
 
     async def read(self, buf):
-        if self.block_num >= len(self.block_locations):
-            return -1
-
-        if not self.writer:
-            self.cur_num_bytes = 0
-            block_id = self.block_locations[self.block_num].get("block_id")
-            self.num_bytes = self.block_locations[self.block_num].get("num_bytes")
-            locs = self.block_locations[self.block_num].get("locs")
-            target_loc = random.choice(locs)
-            self.reader, self.writer = await asyncio.open_connection(
-                target_loc.get("ip"), target_loc.get("port")
-            )
-
-            await self.read_block(block_id, 0, self.num_bytes)
-
-        data = await self.reader.read(BUF_LEN)
-        self.cur_num_bytes += len(data)
-        if self.cur_num_bytes == self.num_bytes:
-            self.writer.close()
-            self.writer = None
-            self.block_num += 1
-
-        buf += data
-        return len(data)
-
-    async def read_block(self, block_id, offset, num_bytes):
-        request = {"cmd": CLI_DATANODE_CMD_READ, "block_id": block_id, "offset": offset, "num_bytes": num_bytes}
-        self.writer.write(json.dumps(request).encode())
-        await self.writer.drain()
+        while True:
+            if self.pos >= self.file_length:
+                return -1
+
+            await self.read_ahead()
+            block_reader = self.block_readers[0]
+            data = await block_reader.read()
+            if len(data) == 0:
+                block_reader.close()
+                self.block_readers.popleft()
+                continue
+
+            buf += data
+            self.pos += len(data)
+            return len(data)
+
+    # start the readers of the blocks following the one at pos so that their
+    # connections are set up and their first chunks buffered before they are needed
+    async def read_ahead(self):
+        if not self.block_readers:
+            block = await self.get_block_at(self.pos)
+            self.start_block_reader(block, self.pos - block.get("offset"))
+
+        while len(self.block_readers) <= READ_AHEAD_BLOCKS:
+            block = self.block_readers[-1].get_block()
+            next_offset = block.get("offset") + block.get("num_bytes")
+            if next_offset >= self.file_length:
+                break
+            self.start_block_reader(await self.get_block_at(next_offset), 0)
+
+    def start_block_reader(self, block, offset):
+        block_reader = BlockReader(block, offset, self.replica_scorer)
+        block_reader.start()
+        self.block_readers.append(block_reader)
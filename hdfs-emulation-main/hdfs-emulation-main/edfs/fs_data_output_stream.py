@@ -1,4 +1,5 @@
 import asyncio
+import os
 
 from collections import deque
 from edfs.config import *
@@ -6,10 +7,15 @@ from edfs.data_streamer import DataStreamer
 from edfs.dfs_packet import DFSPacket
 
 class FSDataOutputStream:
-    def __init__(self, des_inode_id):
-        self.streamer = DataStreamer()
+    def __init__(self, des_inode_id, path, namenode_rpc):
+        self.namenode_rpc = namenode_rpc
+        self.streamer = DataStreamer(namenode_rpc)
         self.task = None
         self.des_inode_id = des_inode_id
+        self.path = path
+
+    def get_path(self):
+        return self.path
 
     def get_streamer(self):
         return self.streamer
@@ -20,18 +26,25 @@ class FSDataOutputStream:
     async def wait_for_streamer(self):
         await self.get_streamer().finish()
 
+    def get_last_block(self):
+        return self.get_streamer().get_last_block()
+
     async def write(self, src):
+        if PUT_PARALLELISM > 1 and os.path.getsize(src) > DEFAULT_BLOCK_SZIE:
+            await self.write_parallel(src)
+            return
+
         self.task = asyncio.create_task(self.streamer.run())
         self.get_streamer().setup(self.task, self.des_inode_id)
         block_capacity = DEFAULT_BLOCK_SZIE
-        with open(src, 'r') as f:
+        with open(src, 'rb') as f:
             data = f.read(min(DEFAULT_PACKET_DATA_SIZE, block_capacity))
             while len(data) > 0:
                 block_capacity -= len(data)
                 next_block_capacity = DEFAULT_BLOCK_SZIE if block_capacity == 0 else block_capacity
                 next_data = f.read(min(DEFAULT_PACKET_DATA_SIZE, next_block_capacity))
                 if block_capacity == 0 or len(next_data) == 0:
-                    packet = DFSPacket.create_packet(data, True)
+                    packet = DFSPacket.create_packet(data, True, len(next_data) == 0)
                     block_capacity = DEFAULT_BLOCK_SZIE
                 else:
                     packet = DFSPacket.create_packet(data, False)
@@ -41,6 +54,51 @@ class FSDataOutputStream:
 
         await self.wait_for_streamer()
 
+    # blocks are allocated in file order, sent through up to PUT_PARALLELISM
+    # pipelines at once and committed in file order once all their packets are acked
+    async def write_parallel(self, src):
+        num_blocks = -(-os.path.getsize(src) // DEFAULT_BLOCK_SZIE)
+        self.next_block = 0
+        self.num_committed = 0
+        self.alloc_lock = asyncio.Lock()
+        self.committed = asyncio.Condition()
+        workers = [asyncio.create_task(self.upload_blocks(src, num_blocks)) for _ in range(min(PUT_PARALLELISM, num_blocks))]
+        try:
+            await asyncio.gather(*workers)
+        finally:
+            for worker in workers:
+                worker.cancel()
+
+    async def upload_blocks(self, src, num_blocks):
+        streamer = DataStreamer(self.namenode_rpc)
+        streamer.setup(None, self.des_inode_id)
+        with open(src, 'rb') as f:
+            while True:
+                async with self.alloc_lock:
+                    idx = self.next_block
+                    if idx >= num_blocks:
+                        return
+                    self.next_block += 1
+                    block_id, blk_locs_info = await streamer.request_new_block()
+
+                f.seek(idx * DEFAULT_BLOCK_SZIE)
+                num_bytes = await streamer.write_block(block_id, blk_locs_info, FSDataOutputStream.read_block_packets(f))
+                async with self.committed:
+                    await self.committed.wait_for(lambda: self.num_committed == idx)
+                    await streamer.commit_block({"block_id": block_id, "num_bytes": num_bytes})
+                    self.num_committed += 1
+                    self.committed.notify_all()
+
+    # packets of the block starting at the current position of f
+    @staticmethod
+    def read_block_packets(f):
+        remaining = DEFAULT_BLOCK_SZIE
+        data = f.read(min(DEFAULT_PACKET_DATA_SIZE, remaining))
+        while len(data) > 0:
+            remaining -= len(data)
+            next_data = f.read(min(DEFAULT_PACKET_DATA_SIZE, remaining)) if remaining > 0 else b""
+            yield DFSPacket.create_packet(data, len(next_data) == 0)
+            data = next_data
 
     async def close(self):
         self.streamer.close()
@@ -0,0 +1,226 @@
+import gc
+import json
+import mmap
+import os
+import struct
+
+from edfs.block import Block
+from edfs.block_manager import BlockManager
+from edfs.config import *
+from edfs.inode import Inode
+from edfs.inode_manager import InodeManager
+
+
+# The binary image is laid out so it can be loaded in one pass:
+#   header | string table | inodes | directory edges | blocks | free block ranges
+# Every section except the string table is made of fixed-width records, and
+# names are stored once in the string table and referenced by index. Blocks
+# are written in the order of their inode's block list.
+class FSImage:
+    MAGIC = b'EDFSIMG\0'
+    VERSION = 1
+    HEADER = struct.Struct('<8sIQIIIII')
+    STRING_LEN = struct.Struct('<H')
+    INODE = struct.Struct('<QBIHQI')
+    EDGE = struct.Struct('<QQ')
+    BLOCK = struct.Struct('<QQQ')
+    FREE_RANGE = struct.Struct('<QQ')
+    TYPE_CODES = {DIR_TYPE: 0, FILE_TYPE: 1}
+    CODE_TYPES = {0: DIR_TYPE, 1: FILE_TYPE}
+
+    @staticmethod
+    def get_json_path():
+        return f'{NAMENODE_METADATA_DIR}/{FSIMAGE_FILENAME}'
+
+    @staticmethod
+    def get_binary_path():
+        return f'{NAMENODE_METADATA_DIR}/{FSIMAGE_BINARY_FILENAME}'
+
+    @staticmethod
+    def create_empty():
+        return {"txid": 0, "inodes": [{"id": INODE_ID_START, "type": DIR_TYPE, "name": ROOT_DIR_NAME}], "directories": [], "freeBlocks": []}
+
+    # returns (inode manager, block manager, txid) built from whichever image is on disk
+    @staticmethod
+    def load():
+        if not os.path.exists(NAMENODE_METADATA_DIR):
+            os.makedirs(NAMENODE_METADATA_DIR)
+
+        if os.path.exists(FSImage.get_binary_path()):
+            return FSImage.load_binary(FSImage.get_binary_path())
+
+        if os.path.exists(FSImage.get_json_path()):
+            with open(FSImage.get_json_path(), 'r') as f:
+                fsimage = json.load(f)
+        else:
+            fsimage = FSImage.create_empty()
+        bm = BlockManager(fsimage)
+        im = InodeManager(fsimage, bm)
+        return im, bm, fsimage.get("txid", 0)
+
+    # write the image in FSIMAGE_FORMAT and drop an image left over in the other format
+    @staticmethod
+    def save(inode_manager, block_manager, txid):
+        if FSIMAGE_FORMAT == "binary":
+            FSImage.atomic_write(FSImage.get_binary_path(), lambda f: FSImage.write_binary(f, inode_manager, block_manager, txid))
+            stale_path = FSImage.get_json_path()
+        else:
+            fsimage = FSImage.create(inode_manager, block_manager, txid)
+            FSImage.atomic_write(FSImage.get_json_path(), lambda f: f.write(json.dumps(fsimage, indent=2).encode()))
+            stale_path = FSImage.get_binary_path()
+        if os.path.exists(stale_path):
+            os.remove(stale_path)
+
+    # write to a temporary file first so a crash never leaves a partial image behind
+    @staticmethod
+    def atomic_write(path, write_fn):
+        tmp_path = f'{path}.ckpt'
+        with open(tmp_path, 'wb') as f:
+            write_fn(f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+
+    @staticmethod
+    def create(inode_manager, block_manager, txid):
+        inodes = []
+        directories = []
+        for inode in inode_manager.get_all_inodes():
+            if inode.is_file():
+                blocks = []
+                for block_id in inode.get_blocks():
+                    blk = block_manager.get_block_by_id(block_id)
+                    blocks.append({"id":  blk.get_id(), "numBytes": blk.get_num_bytes()})
+
+                inodes.append({
+                    "id": inode.get_id(),
+                    "type": inode.get_type(),
+                    "name":  inode.get_name(),
+                    "replication": inode.get_replication(),
+                    "preferredBlockSize": inode.get_preferredBlockSize(),
+                    "blocks": blocks
+                })
+            else:
+                inodes.append({
+                    "id": inode.get_id(),
+                    "type": inode.get_type(),
+                    "name":  inode.get_name(),
+                })
+
+                children_ids = inode.get_children_ids()
+                if children_ids:
+                    directories.append({
+                        "parent": inode.get_id(),
+                        "children": children_ids
+                    })
+        return {"txid": txid, "inodes": inodes, "directories": directories, "freeBlocks": block_manager.get_free_block_ids()}
+
+    @staticmethod
+    def get_free_block_ranges(free_block_ids):
+        ranges = []
+        for block_id in free_block_ids:
+            if ranges and ranges[-1][0] + ranges[-1][1] == block_id:
+                ranges[-1][1] += 1
+            else:
+                ranges.append([block_id, 1])
+        return ranges
+
+    @staticmethod
+    def write_binary(f, inode_manager, block_manager, txid):
+        inodes = inode_manager.get_all_inodes()
+        string_ids = {}
+        num_edges, num_blocks = 0, 0
+        for inode in inodes:
+            string_ids.setdefault(inode.get_name(), len(string_ids))
+            if inode.is_dir():
+                num_edges += inode.get_num_children()
+            else:
+                num_blocks += len(inode.get_blocks())
+        free_ranges = FSImage.get_free_block_ranges(block_manager.get_free_block_ids())
+
+        f.write(FSImage.HEADER.pack(FSImage.MAGIC, FSImage.VERSION, txid, len(string_ids), len(inodes), num_edges, num_blocks, len(free_ranges)))
+
+        buf = bytearray()
+        for name in string_ids:
+            encoded = name.encode()
+            buf += FSImage.STRING_LEN.pack(len(encoded))
+            buf += encoded
+        f.write(buf)
+
+        f.write(b''.join(FSImage.INODE.pack(
+            inode.get_id(),
+            FSImage.TYPE_CODES[inode.get_type()],
+            string_ids[inode.get_name()],
+            inode.get_replication(),
+            inode.get_preferredBlockSize(),
+            len(inode.get_blocks()) if inode.is_file() else 0
+        ) for inode in inodes))
+
+        f.write(b''.join(
+            FSImage.EDGE.pack(inode.get_id(), child_id)
+            for inode in inodes if inode.is_dir() for child_id in inode.get_children_ids()
+        ))
+
+        f.write(b''.join(
+            FSImage.BLOCK.pack(block_id, inode.get_id(), block_manager.get_block_by_id(block_id).get_num_bytes())
+            for inode in inodes if inode.is_file() for block_id in inode.get_blocks()
+        ))
+
+        f.write(b''.join(FSImage.FREE_RANGE.pack(start, count) for start, count in free_ranges))
+
+    # the cyclic GC is paused while loading since the objects created here all
+    # stay alive and repeated collections would otherwise dominate load time
+    @staticmethod
+    def load_binary(path):
+        gc_enabled = gc.isenabled()
+        gc.disable()
+        try:
+            return FSImage.load_binary_sections(path)
+        finally:
+            if gc_enabled:
+                gc.enable()
+
+    @staticmethod
+    def load_binary_sections(path):
+        bm = BlockManager(None)
+        im = InodeManager(None, bm)
+        # sections are unpacked from slices of a view of the mapping, not copies of it
+        with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buf, memoryview(buf) as view:
+            magic, version, txid, num_strings, num_inodes, num_edges, num_blocks, num_free_ranges = FSImage.HEADER.unpack_from(buf, 0)
+            if magic != FSImage.MAGIC or version != FSImage.VERSION:
+                raise ValueError(f'{path}: unsupported fsimage (magic {magic}, version {version})')
+            ptr = FSImage.HEADER.size
+
+            strings = []
+            for _ in range(num_strings):
+                (str_len,) = FSImage.STRING_LEN.unpack_from(buf, ptr)
+                ptr += FSImage.STRING_LEN.size
+                strings.append(buf[ptr: ptr + str_len].decode())
+                ptr += str_len
+
+            end = ptr + num_inodes * FSImage.INODE.size
+            for inode_id, type_code, name_id, replication, preferred_block_size, _ in FSImage.INODE.iter_unpack(view[ptr: end]):
+                if type_code == FSImage.TYPE_CODES[DIR_TYPE]:
+                    node = Inode(inode_id, DIR_TYPE, strings[name_id])
+                else:
+                    node = Inode(inode_id, FILE_TYPE, strings[name_id], replication, preferred_block_size)
+                im.add_inode(node)
+            ptr = end
+
+            id_to_inode = im.id_to_inode
+            end = ptr + num_edges * FSImage.EDGE.size
+            for parent_id, child_id in FSImage.EDGE.iter_unpack(view[ptr: end]):
+                id_to_inode[parent_id].add_child(id_to_inode[child_id])
+            ptr = end
+
+            end = ptr + num_blocks * FSImage.BLOCK.size
+            for block_id, inode_id, num_bytes in FSImage.BLOCK.iter_unpack(view[ptr: end]):
+                bm.register_block(Block(block_id, inode_id, num_bytes, []))
+                id_to_inode[inode_id].add_block(block_id)
+            ptr = end
+
+            end = ptr + num_free_ranges * FSImage.FREE_RANGE.size
+            for start, count in FSImage.FREE_RANGE.iter_unpack(view[ptr: end]):
+                bm.add_free_block_ids(range(start, start + count))
+
+        return im, bm, txid
@@ -0,0 +1,35 @@
+import asyncio
+import time
+
+from edfs.config import *
+
+# Marks datanodes dead when their heartbeats stop, their replicas are dropped and
+# the replication monitor copies the blocks again from the remaining ones.
+class HeartbeatManager:
+    def __init__(self, datanode_manager, block_manager, placement_policy):
+        self.dnm = datanode_manager
+        self.bm = block_manager
+        self.placement_policy = placement_policy
+        self.task = None
+
+    def start(self):
+        self.task = asyncio.create_task(self.run())
+
+    def close(self):
+        if self.task:
+            self.task.cancel()
+            self.task = None
+
+    async def run(self):
+        while True:
+            await asyncio.sleep(HEARTBEAT_CHECK_INTERVAL)
+            self.check_datanodes()
+
+    def check_datanodes(self):
+        now = time.monotonic()
+        for datanode_info in self.dnm.get_live_datanodes():
+            if now - datanode_info.get_last_heartbeat() > DATANODE_DEAD_INTERVAL:
+                print(f'DBG: datanode {datanode_info.get_name()} is dead, no heartbeat for {int(now - datanode_info.get_last_heartbeat())}s')
+                datanode_info.set_alive(False)
+                self.placement_policy.update_datanode(datanode_info)
+                self.bm.remove_datanode(datanode_info.get_id())
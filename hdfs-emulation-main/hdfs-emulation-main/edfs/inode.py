@@ -1,14 +1,30 @@
+import sys
+
+from array import array
 from edfs.config import *
 
 class Inode:
+    __slots__ = ("id", "type", "name", "replication", "preferredBlockSize", "blocks", "offsets", "parent", "children", "path")
+
     def __init__(self, id, type, name, replication=0, preferredBlockSize=0, blocks=None):
         self.id = id
         self.type = type
-        self.name = name
+        self.name = sys.intern(name)
         self.replication = replication
         self.preferredBlockSize = preferredBlockSize
-        self.blocks = blocks if blocks is not None else []
-        self.dir_entries = [DirEnt(self, ".")]
+        # the root directory is its own parent
+        self.parent = self
+        # full path, computed on demand; a cached path implies a cached parent path
+        self.path = None
+        # end offset in the file of each block, computed on demand
+        self.offsets = None
+        if type == DIR_TYPE:
+            self.blocks = None
+            # name -> child inode, iterated in insertion order
+            self.children = {}
+        else:
+            self.blocks = array('q', blocks if blocks is not None else [])
+            self.children = None
 
     def is_dir(self):
         return self.type == DIR_TYPE
@@ -32,49 +48,65 @@ class Inode:
         return self.preferredBlockSize
 
     def get_blocks(self):
-        return self.blocks
+        return self.blocks if self.blocks is not None else ()
 
-    def get_dirents(self):
-        return self.dir_entries
+    def get_children(self):
+        return list(self.children.values()) if self.children else []
+
+    def get_num_children(self):
+        return len(self.children) if self.children else 0
 
     def set_name(self, name):
-        self.name = name
+        self.clear_path()
+        self.name = sys.intern(name)
+
+    def add_child(self, inode):
+        inode.clear_path()
+        self.children[inode.get_name()] = inode
+        inode.parent = self
 
-    def add_dirent(self, inode, name):
-        self.get_dirents().append(DirEnt(inode, name))
+    def remove_child(self, name):
+        return self.children.pop(name, None)
 
     def add_block(self, block_id):
         self.blocks.append(block_id)
 
+    def get_block_offsets(self):
+        return self.offsets
+
+    def set_block_offsets(self, offsets):
+        self.offsets = offsets
+
     def get_parent_inode(self):
-        for dirent in self.get_dirents():
-            if dirent.name == "..":
-                return dirent.inode
+        return self.parent
 
     def get_child_inode_by_name(self, name):
-        for dirent in self.get_dirents():
-            if dirent.name == name:
-                return dirent.inode
-        return None
+        return self.children.get(name) if self.children else None
 
     def get_children_ids(self):
-        children_ids = []
-        for dirent in self.get_dirents():
-            if  dirent.name != "." and dirent.name != "..":
-                children_ids.append(dirent.inode.get_id())
-        return children_ids
+        return [child.get_id() for child in self.children.values()] if self.children else []
 
     def get_path(self):
+        if self.path is not None:
+            return self.path
+
+        uncached = []
         cur = self
-        parent = cur.get_parent_inode()
-        path = [cur.get_name()]
-        while parent != cur:
-            cur = parent
-            path.append(cur.get_name())
-            parent = cur.get_parent_inode()
-        return "/".join(path[::-1])
-
-class DirEnt:
-    def __init__(self, inode, name):
-        self.inode = inode
-        self.name = name
+        while cur.path is None and cur.parent is not cur:
+            uncached.append(cur)
+            cur = cur.parent
+        path = cur.path if cur.path is not None else cur.get_name()
+        for inode in reversed(uncached):
+            path = f'{path}/{inode.get_name()}'
+            inode.path = path
+        return path
+
+    def clear_path(self):
+        stack = [self]
+        while stack:
+            inode = stack.pop()
+            if inode.path is None:
+                continue
+            inode.path = None
+            if inode.children:
+                stack.extend(inode.children.values())
@@ -1,3 +1,8 @@
+import itertools
+
+from array import array
+from bisect import bisect_left, bisect_right, insort
+from collections import OrderedDict
 from edfs.config import *
 from edfs.inode import Inode
 
@@ -8,7 +13,17 @@ class InodeManager():
         self.last_block_id = BLOCK_ID_START
         self.id_to_inode = {}
         self.root_inode = None
-        self.build_inodes(fsimage)
+        # normalized path -> inode, or None for paths known not to exist
+        self.path_cache = OrderedDict()
+        # normalized path -> keys of its children that are cached or have cached
+        # paths under them, so that invalidating a subtree only visits its cached paths
+        self.cached_children = {}
+        self.path_cache_hits = 0
+        self.path_cache_misses = 0
+        # directory inode id -> sorted child names, kept for large directories only
+        self.sorted_names = {}
+        if fsimage is not None:
+            self.build_inodes(fsimage)
 
     def build_inodes(self, metadata):
         inodes = metadata["inodes"]
@@ -20,10 +35,7 @@ class InodeManager():
             else:
                 blocks = [blk.get("id") for blk in inode.get("blocks")]
                 node = Inode(inode["id"], inode["type"], inode["name"], inode["replication"], inode["preferredBlockSize"], blocks)
-            self.id_to_inode[node.get_id()] = node
-            if node.get_name() == ROOT_DIR_NAME:
-                self.root_inode = node
-            self.last_inode_id = max(self.last_inode_id, node.get_id())
+            self.add_inode(node)
 
         for directory in directories:
             parent_id = directory["parent"]
@@ -31,33 +43,117 @@ class InodeManager():
 
             p_node = self.id_to_inode[parent_id]
             for child_id in children_ids:
-                c_node = self.id_to_inode[child_id]
-                p_node.add_dirent(c_node, c_node.get_name())
-                c_node.add_dirent(p_node, "..")
+                p_node.add_child(self.id_to_inode[child_id])
 
-        self.root_inode.add_dirent(self.root_inode, "..")
+    def add_inode(self, node):
+        self.id_to_inode[node.get_id()] = node
+        if node.get_name() == ROOT_DIR_NAME:
+            self.root_inode = node
+        self.last_inode_id = max(self.last_inode_id, node.get_id())
 
     def get_inode_by_id(self, id):
         return self.id_to_inode.get(id)
 
     def get_inode_from_path(self, path):
-        path = path.strip(' /')
-        path_list = path.split("/")
+        key = self.normalize_path(path)
+        if key in self.path_cache:
+            self.path_cache.move_to_end(key)
+            self.path_cache_hits += 1
+            return self.path_cache[key]
+        self.path_cache_misses += 1
 
         cur_inode = self.root_inode
-        if path_list[0] == "." :
-            cur_inode = self.get_inode_from_path(DEFAULT_BASE_DIR)
-            if cur_inode is None:
-                return None
-            path_list.pop(0)
-
-        for s in path_list:
+        for s in key.split("/"):
             if s == "": continue
             cur_inode = cur_inode.get_child_inode_by_name(s)
             if cur_inode is None:
                 break
+
+        self.path_cache[key] = cur_inode
+        self.index_path(key)
+        if len(self.path_cache) > PATH_CACHE_SIZE:
+            self.unindex_path(self.path_cache.popitem(last=False)[0])
         return cur_inode
 
+    @staticmethod
+    def normalize_path(path):
+        key = path.strip(' /')
+        if "//" not in key and not key.startswith("."):
+            return key
+        path_list = key.split("/")
+        if path_list[0] == ".":
+            path_list[0] = DEFAULT_BASE_DIR.strip("/")
+        if "" in path_list:
+            path_list = [s for s in path_list if s != ""]
+        return "/".join(path_list)
+
+    # inode paths start with "/" and are otherwise normalized
+    @staticmethod
+    def get_cache_key(inode):
+        return inode.get_path()[1:]
+
+    @staticmethod
+    def get_child_cache_key(dir_inode, name):
+        key = InodeManager.get_cache_key(dir_inode)
+        return f'{key}/{name}' if key else name
+
+    def index_path(self, key):
+        while key != "":
+            parent_key = key.rpartition("/")[0]
+            children = self.cached_children.get(parent_key)
+            if children is not None:
+                children.add(key)
+                return
+            self.cached_children[parent_key] = {key}
+            key = parent_key
+
+    # drop key from the index unless it is cached or has cached paths under it,
+    # then the parents left without any
+    def unindex_path(self, key):
+        while key != "" and key not in self.path_cache and key not in self.cached_children:
+            parent_key = key.rpartition("/")[0]
+            children = self.cached_children.get(parent_key)
+            if children is None or key not in children:
+                return
+            children.remove(key)
+            if children:
+                return
+            del self.cached_children[parent_key]
+            key = parent_key
+
+    def invalidate_path(self, key):
+        self.path_cache.pop(key, None)
+        self.unindex_path(key)
+
+    def invalidate_subtree(self, key):
+        if key == "":
+            self.path_cache.clear()
+            self.cached_children.clear()
+            return
+        stack = [key]
+        while stack:
+            cur = stack.pop()
+            self.path_cache.pop(cur, None)
+            stack.extend(self.cached_children.pop(cur, ()))
+        self.unindex_path(key)
+
+    def get_path_cache_stats(self):
+        return {
+            "size": len(self.path_cache),
+            "capacity": PATH_CACHE_SIZE,
+            "hits": self.path_cache_hits,
+            "misses": self.path_cache_misses
+        }
+
+    # whether inode is the same as, or an ancestor of, descendant
+    def is_ancestor(self, inode, descendant):
+        cur = descendant
+        while cur != inode:
+            if cur == self.root_inode:
+                return False
+            cur = cur.get_parent_inode()
+        return True
+
     def get_all_inodes(self):
         return list(self.id_to_inode.values())
 
@@ -73,35 +169,96 @@ class InodeManager():
 
         return (base_dir_inode, filename)
 
+    def get_sorted_names(self, dir_inode):
+        names = self.sorted_names.get(dir_inode.get_id())
+        if names is None:
+            names = sorted(dir_inode.children)
+            if len(names) > LIST_PAGE_SIZE:
+                self.sorted_names[dir_inode.get_id()] = names
+        return names
+
+    def add_sorted_name(self, dir_inode, name):
+        names = self.sorted_names.get(dir_inode.get_id())
+        if names is not None:
+            insort(names, name)
+
+    def remove_sorted_name(self, dir_inode, name):
+        names = self.sorted_names.get(dir_inode.get_id())
+        if names is not None:
+            idx = bisect_left(names, name)
+            if idx < len(names) and names[idx] == name:
+                del names[idx]
+
+    # up to limit children of dir_inode whose names sort after start_after
+    def list_dir(self, dir_inode, start_after=None, limit=LIST_PAGE_SIZE):
+        names = self.get_sorted_names(dir_inode)
+        start = bisect_right(names, start_after) if start_after else 0
+        return [dir_inode.children[name] for name in names[start: start + limit]]
+
+    # (inode, path, depth) in pre-order with children sorted by name, resuming
+    # after the entry at path start_after if it is given
+    def walk_tree(self, inode, start_after=None):
+        path = inode.get_path()
+        stack = []
+        if start_after is None:
+            yield inode, path, 0
+            if inode.is_dir():
+                stack.append([inode, path, self.get_sorted_names(inode), 0, 1])
+        else:
+            cur, cur_path = inode, path
+            names = start_after[len(path):].strip("/").split("/")
+            for depth, name in enumerate(names, 1):
+                cur_names = self.get_sorted_names(cur)
+                stack.append([cur, cur_path, cur_names, bisect_right(cur_names, name), depth])
+                child = cur.get_child_inode_by_name(name)
+                if child is None or not child.is_dir():
+                    break
+                cur, cur_path = child, f'{cur_path}/{name}'
+                if depth == len(names):
+                    stack.append([cur, cur_path, self.get_sorted_names(cur), 0, depth + 1])
+
+        while stack:
+            top = stack[-1]
+            dir_inode, dir_path, names, idx, depth = top
+            if idx >= len(names):
+                stack.pop()
+                continue
+            top[3] += 1
+            child = dir_inode.children[names[idx]]
+            child_path = f'{dir_path}/{names[idx]}'
+            yield child, child_path, depth
+            if child.is_dir():
+                stack.append([child, child_path, self.get_sorted_names(child), 0, depth + 1])
+
     def create_dir(self, base_inode, filename):
         new_dir_inode = Inode(self.last_inode_id + 1, DIR_TYPE, filename)
-        base_inode.add_dirent(new_dir_inode, filename)
-        new_dir_inode.add_dirent(base_inode, "..")
+        base_inode.add_child(new_dir_inode)
+        self.add_sorted_name(base_inode, filename)
+        self.invalidate_path(self.get_child_cache_key(base_inode, filename))
         self.id_to_inode[new_dir_inode.get_id()] = new_dir_inode
         self.last_inode_id += 1
         return new_dir_inode
 
     def remove_dir(self, parent, inode):
-        dirents = parent.get_dirents()
-        for i, dirent in enumerate(dirents):
-            if dirent.name == inode.get_name():
-                dirents.pop(i)
+        self.invalidate_subtree(self.get_cache_key(inode))
+        parent.remove_child(inode.get_name())
+        self.remove_sorted_name(parent, inode.get_name())
+        self.sorted_names.pop(inode.get_id(), None)
         del self.id_to_inode[inode.get_id()]
 
     def create_file(self, base_inode, filename):
-        new_dir_inode = Inode(self.last_inode_id + 1, FILE_TYPE, filename, 3, DEFAULT_BLOCK_SZIE, None)
-        base_inode.add_dirent(new_dir_inode, filename)
-        new_dir_inode.add_dirent(base_inode, "..")
+        new_dir_inode = Inode(self.last_inode_id + 1, FILE_TYPE, filename, REPLICATION_FACTOR, DEFAULT_BLOCK_SZIE, None)
+        base_inode.add_child(new_dir_inode)
+        self.add_sorted_name(base_inode, filename)
+        self.invalidate_path(self.get_child_cache_key(base_inode, filename))
         self.id_to_inode[new_dir_inode.get_id()] = new_dir_inode
         self.last_inode_id += 1
         return new_dir_inode
 
     def rm(self, inode):
-        parent = inode.get_parent_inode()
-        for i, dirent in enumerate(parent.get_dirents()):
-            if dirent.name == inode.name:
-                parent.get_dirents().pop(i)
-                break
+        self.invalidate_path(self.get_child_cache_key(inode.get_parent_inode(), inode.get_name()))
+        inode.get_parent_inode().remove_child(inode.get_name())
+        self.remove_sorted_name(inode.get_parent_inode(), inode.get_name())
         del self.id_to_inode[inode.get_id()]
 
         block_ids = inode.get_blocks()
@@ -109,28 +266,54 @@ class InodeManager():
             self.bm.delete_block(block_id)
 
     def move(self, src_inode, des_inode, name):
-        parent = src_inode.get_parent_inode()
-        for i, dirent in enumerate(parent.get_dirents()):
-            if dirent.name == src_inode.get_name():
-                parent.get_dirents().pop(i)
-                break
-
-        for dirent in src_inode.get_dirents():
-            if dirent.name == "..":
-                dirent.inode = des_inode
-                break
+        # paths under a file are cached as missing and stay so wherever it moves
+        if src_inode.is_dir():
+            self.invalidate_subtree(self.get_cache_key(src_inode))
+            self.invalidate_subtree(self.get_child_cache_key(des_inode, name))
+        else:
+            self.invalidate_path(self.get_cache_key(src_inode))
+            self.invalidate_path(self.get_child_cache_key(des_inode, name))
+        src_inode.get_parent_inode().remove_child(src_inode.get_name())
+        self.remove_sorted_name(src_inode.get_parent_inode(), src_inode.get_name())
         src_inode.set_name(name)
-        des_inode.add_dirent(src_inode, name)
+        des_inode.add_child(src_inode)
+        self.add_sorted_name(des_inode, name)
 
     def add_block_to(self, inode_id, block_id):
         inode = self.get_inode_by_id(inode_id)
         inode.add_block(block_id)
+        offsets = inode.get_block_offsets()
+        if offsets is not None:
+            offsets.append((offsets[-1] if offsets else 0) + self.bm.get_block_by_id(block_id).get_num_bytes())
+
+    def commit_block(self, inode_id, block, num_bytes):
+        inode = self.get_inode_by_id(inode_id)
+        delta = num_bytes - block.get_num_bytes()
+        block.set_num_bytes(num_bytes)
+        offsets = inode.get_block_offsets()
+        if offsets is None or delta == 0:
+            return
+        # the committed block is one of the last ones, shift the offsets from it on
+        blocks = inode.get_blocks()
+        idx = len(blocks) - 1
+        while idx >= 0 and blocks[idx] != block.get_id():
+            idx -= 1
+        for i in range(max(idx, 0), len(offsets)):
+            offsets[i] += delta
+
+    # cumulative end offsets of the blocks of a file, an offset in the file is in
+    # block bisect_right(offsets, offset)
+    def get_block_offsets(self, inode):
+        offsets = inode.get_block_offsets()
+        if offsets is None or len(offsets) != len(inode.get_blocks()):
+            offsets = array('q', itertools.accumulate(self.bm.get_block_by_id(block_id).get_num_bytes() for block_id in inode.get_blocks()))
+            inode.set_block_offsets(offsets)
+        return offsets
 
     def print_entries(self, dir_inode):
         dir_path = dir_inode.get_path()
-        for dirent in  dir_inode.get_dirents():
-            if dirent.name != "." and dirent.name != "..":
-                print(f'{dir_path}/{dirent.name}')
+        for child in dir_inode.get_children():
+            print(f'{dir_path}/{child.get_name()}')
         print()
 
     def print_recursive(self, inode, level):
@@ -139,6 +322,5 @@ class InodeManager():
             return
 
         print(f'{"    " * level}{inode.get_name()}:')
-        for dirent in inode.get_dirents():
-            if dirent.name != "." and dirent.name != "..":
-                self.print_recursive(dirent.inode, level + 1)
+        for child in inode.get_children():
+            self.print_recursive(child, level + 1)
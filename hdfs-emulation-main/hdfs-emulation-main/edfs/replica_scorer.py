@@ -0,0 +1,59 @@
+import random
+import time
+
+from edfs.config import *
+
+# Ranks the replicas of a block by the latency and throughput this client recently
+# observed from their datanodes, kept as moving averages weighted by
+# REPLICA_STATS_WEIGHT. Datanodes not measured in the last REPLICA_STATS_TTL seconds
+# come first so that every one is tried again, and datanodes that failed in that
+# time last.
+class ReplicaScorer:
+    def __init__(self):
+        # (ip, port) -> seconds until the response to a read request
+        self.latency = {}
+        # (ip, port) -> bytes per second while receiving
+        self.throughput = {}
+        # (ip, port) -> time of the last measurement
+        self.updated = {}
+        # (ip, port) -> time of the last failure
+        self.failed = {}
+
+    @staticmethod
+    def get_key(loc):
+        return (loc.get("ip"), loc.get("port"))
+
+    def update(self, stats, key, value):
+        now = time.monotonic()
+        prev = stats.get(key) if not self.is_expired(self.updated, key, now) else None
+        stats[key] = value if prev is None else prev + REPLICA_STATS_WEIGHT * (value - prev)
+        self.updated[key] = now
+
+    @staticmethod
+    def is_expired(times, key, now):
+        return key not in times or now - times[key] >= REPLICA_STATS_TTL
+
+    def record_latency(self, loc, seconds):
+        self.update(self.latency, self.get_key(loc), seconds)
+
+    def record_transfer(self, loc, num_bytes, seconds):
+        if num_bytes > 0 and seconds > 0:
+            self.update(self.throughput, self.get_key(loc), num_bytes / seconds)
+
+    def record_failure(self, loc):
+        self.failed[self.get_key(loc)] = time.monotonic()
+
+    # expected seconds to read a block from the datanode at loc
+    def get_score(self, loc, now):
+        key = self.get_key(loc)
+        if self.is_expired(self.updated, key, now) or key not in self.latency:
+            return 0
+        throughput = self.throughput.get(key)
+        return self.latency[key] + (DEFAULT_BLOCK_SZIE / throughput if throughput else 0)
+
+    # replicas with equal scores are shuffled to spread the reads over them
+    def sort(self, locs):
+        now = time.monotonic()
+        locs = list(locs)
+        random.shuffle(locs)
+        return sorted(locs, key=lambda loc: (not self.is_expired(self.failed, self.get_key(loc), now), self.get_score(loc, now)))
@@ -0,0 +1,140 @@
+import asyncio
+import time
+
+from collections import Counter
+from edfs.config import *
+
+# Compares the live replicas of blocks whose replicas changed with the replication
+# of their file. Under-replicated blocks wait in priority queues, the ones closest
+# to being lost first, and are copied by a datanode holding a replica to the
+# targets the placement policy picks, sent as a command in its heartbeat reply.
+# Excess replicas are invalidated, and corrupt ones once the block has enough live
+# replicas. Nothing is scheduled in the first REPLICATION_STARTUP_DELAY seconds,
+# while datanodes are still reporting their blocks.
+class ReplicationMonitor:
+    # one live replica left
+    QUEUE_HIGHEST_PRIORITY = 0
+    # less than a third of the replicas live
+    QUEUE_VERY_UNDER_REPLICATED = 1
+    QUEUE_UNDER_REPLICATED = 2
+    # no live replica, nothing to copy from until one is reported
+    QUEUE_MISSING = 3
+    QUEUE_NAMES = ["highest_priority", "very_under_replicated", "under_replicated", "missing"]
+
+    def __init__(self, inode_manager, block_manager, datanode_manager, placement_policy):
+        self.im = inode_manager
+        self.bm = block_manager
+        self.dnm = datanode_manager
+        self.placement_policy = placement_policy
+        # dicts used as insertion ordered sets of block ids
+        self.queues = [{} for _ in self.QUEUE_NAMES]
+        self.over_replicated = {}
+        self.start_time = time.monotonic()
+        self.task = None
+
+    def start(self):
+        self.start_time = time.monotonic()
+        self.task = asyncio.create_task(self.run())
+
+    def close(self):
+        if self.task:
+            self.task.cancel()
+            self.task = None
+
+    async def run(self):
+        await asyncio.sleep(REPLICATION_STARTUP_DELAY)
+        while True:
+            self.update_queues()
+            self.schedule_replications()
+            self.remove_excess_replicas()
+            await asyncio.sleep(REPLICATION_CHECK_INTERVAL)
+
+    def get_expected_replication(self, block):
+        inode = self.im.get_inode_by_id(block.get_inode_id())
+        return inode.get_replication() if inode is not None else 0
+
+    @classmethod
+    def get_priority(cls, num_live, expected):
+        if num_live == 0:
+            return cls.QUEUE_MISSING
+        if num_live == 1:
+            return cls.QUEUE_HIGHEST_PRIORITY
+        if num_live * 3 < expected:
+            return cls.QUEUE_VERY_UNDER_REPLICATED
+        return cls.QUEUE_UNDER_REPLICATED
+
+    def update_queues(self):
+        self.bm.requeue_pending_replications(time.monotonic() - REPLICATION_PENDING_TIMEOUT)
+        pending = self.bm.get_pending_replications()
+        for block_id in self.bm.get_replication_checks():
+            for queue in self.queues:
+                queue.pop(block_id, None)
+            self.over_replicated.pop(block_id, None)
+            block = self.bm.get_block_by_id(block_id)
+            if block is None:
+                continue
+
+            num_live, expected = len(block.get_locs()), self.get_expected_replication(block)
+            if num_live < expected and block_id not in pending:
+                self.queues[self.get_priority(num_live, expected)][block_id] = None
+            elif num_live > expected:
+                self.over_replicated[block_id] = None
+            if num_live >= expected:
+                self.bm.invalidate_corrupt_replicas(block_id)
+
+    # at most REPLICATION_WORK_MULTIPLIER blocks per live datanode are scheduled per
+    # iteration and at most REPLICATION_MAX_STREAMS transfers run from one datanode,
+    # so recovery speeds up with the number of datanodes without flooding any of them
+    def schedule_replications(self):
+        now = time.monotonic()
+        live_datanodes = self.dnm.get_live_datanodes()
+        streams = Counter(source_id for _, source_id, _ in self.bm.get_pending_replications().values())
+        work = REPLICATION_WORK_MULTIPLIER * len(live_datanodes)
+        for queue in self.queues[:self.QUEUE_MISSING]:
+            for block_id in list(queue):
+                if work <= 0:
+                    return
+                block = self.bm.get_block_by_id(block_id)
+                if block is None:
+                    del queue[block_id]
+                    continue
+
+                holders = [self.dnm.get_datanode_by_id(datanode_id) for datanode_id in block.get_locs()]
+                num_missing = self.get_expected_replication(block) - len(holders)
+                if num_missing <= 0:
+                    del queue[block_id]
+                    continue
+                # busy holders cannot be the source but must never be a target either
+                sources = [datanode_info for datanode_info in holders if streams[datanode_info.get_id()] < REPLICATION_MAX_STREAMS]
+                if not sources:
+                    continue
+                targets = self.placement_policy.choose_targets(num_missing, chosen=holders, excluded=self.bm.corrupt_replicas.get(block_id, ()))
+                if not targets:
+                    continue
+
+                source = min(sources, key=lambda datanode_info: streams[datanode_info.get_id()])
+                source.add_command({"cmd": NN_CMD_TRANSFER, "block_id": block_id, "targets": [target.get_info() for target in targets]})
+                streams[source.get_id()] += 1
+                self.bm.add_pending_replication(block_id, now, source.get_id(), [target.get_id() for target in targets])
+                del queue[block_id]
+                work -= 1
+                print(f'DBG: scheduled replication of block {block_id} from {source.get_name()} to {" ".join([target.get_name() for target in targets])}')
+
+    def remove_excess_replicas(self):
+        for block_id in list(self.over_replicated):
+            del self.over_replicated[block_id]
+            block = self.bm.get_block_by_id(block_id)
+            if block is None:
+                continue
+            replicas = [self.dnm.get_datanode_by_id(datanode_id) for datanode_id in block.get_locs()]
+            for _ in range(len(replicas) - self.get_expected_replication(block)):
+                datanode_info = self.placement_policy.choose_replica_to_delete(replicas)
+                replicas.remove(datanode_info)
+                self.bm.remove_excess_replica(block_id, datanode_info.get_id())
+                print(f'DBG: removing excess replica of block {block_id} from {datanode_info.get_name()}')
+
+    def get_stats(self):
+        stats = {name: len(queue) for name, queue in zip(self.QUEUE_NAMES, self.queues)}
+        stats["pending"] = len(self.bm.get_pending_replications())
+        stats["over_replicated"] = len(self.over_replicated)
+        return stats
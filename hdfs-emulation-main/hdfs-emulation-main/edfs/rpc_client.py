@@ -0,0 +1,67 @@
+import asyncio
+import json
+
+from edfs.config import *
+from edfs.utils import PacketUtils
+
+
+# A single long-lived connection to the namenode. Requests are framed with
+# PacketUtils and tagged with a req_id, so many calls can be in flight at once
+# and their responses are matched back to the waiting callers.
+class RpcClient:
+    def __init__(self, ip, port):
+        self.ip = ip
+        self.port = port
+        self.reader = None
+        self.writer = None
+        self.recv_task = None
+        self.last_req_id = 0
+        self.pending = {}
+        self.connect_lock = asyncio.Lock()
+
+    async def connect(self):
+        async with self.connect_lock:
+            if self.writer is not None:
+                return
+            self.reader, self.writer = await asyncio.open_connection(self.ip, self.port)
+            self.recv_task = asyncio.create_task(self.recv_responses(self.reader))
+
+    async def call(self, request):
+        await self.connect()
+        self.last_req_id += 1
+        req_id = self.last_req_id
+        future = asyncio.get_running_loop().create_future()
+        self.pending[req_id] = future
+
+        message = dict(request, req_id=req_id)
+        self.writer.write(PacketUtils.encode(json.dumps(message).encode()))
+        await self.writer.drain()
+        return await future
+
+    async def recv_responses(self, reader):
+        while True:
+            data = await PacketUtils.read_packet(reader)
+            if data is None:
+                break
+            response = json.loads(data.decode())
+            future = self.pending.pop(response.get("req_id"), None)
+            if future is not None and not future.done():
+                future.set_result(response)
+
+        self.fail_pending(ConnectionError(f'connection to {self.ip}:{self.port} closed'))
+        self.reader, self.writer = None, None
+
+    def fail_pending(self, exc):
+        for future in self.pending.values():
+            if not future.done():
+                future.set_exception(exc)
+        self.pending = {}
+
+    def close(self):
+        if self.recv_task:
+            self.recv_task.cancel()
+            self.recv_task = None
+        if self.writer:
+            self.writer.close()
+            self.writer = None
+        self.fail_pending(ConnectionError(f'connection to {self.ip}:{self.port} closed'))
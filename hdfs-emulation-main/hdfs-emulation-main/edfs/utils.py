@@ -1,3 +1,6 @@
+import asyncio
+
+
 class PacketUtils:
     @staticmethod
     def get_chunk_header(bytes_len):
@@ -22,6 +25,15 @@ class PacketUtils:
         data_len = PacketUtils.chunk_header_to_len(buf[:4])
         return buf[4: 4 + data_len]
 
+    # return the next length-prefixed packet from a stream, or None at EOF
+    @staticmethod
+    async def read_packet(reader):
+        try:
+            header = await reader.readexactly(4)
+            return await reader.readexactly(PacketUtils.chunk_header_to_len(header))
+        except asyncio.IncompleteReadError:
+            return None
+
     # return a list of packets and the current ptr of the buffer
     @staticmethod
     def create_packets_from_buffer(buf):
@@ -0,0 +1,21 @@
+# Exports the namenode's current fsimage (binary or JSON) as JSON for debugging:
+#   python3 fsimage_to_json.py [output file]
+
+import json
+import sys
+
+from edfs.config import *
+from edfs.fsimage import FSImage
+
+def main():
+    im, bm, txid = FSImage.load()
+    fsimage = FSImage.create(im, bm, txid)
+    if len(sys.argv) > 1:
+        with open(sys.argv[1], 'w') as f:
+            json.dump(fsimage, f, indent=2)
+    else:
+        print(json.dumps(fsimage, indent=2))
+
+
+if __name__ == "__main__":
+    main()
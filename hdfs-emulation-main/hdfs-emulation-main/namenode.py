@@ -5,6 +5,7 @@ from edfs.edfs_namenode import EDFSNameNode
 
 async def main():
     namenode = EDFSNameNode()
+    await namenode.start()
     server = await asyncio.start_server(
         namenode.handle_client, LOCAL_HOST, NAMENODE_PORT)
 
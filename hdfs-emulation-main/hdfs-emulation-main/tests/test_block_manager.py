@@ -0,0 +1,88 @@
+import unittest
+
+from edfs.block_manager import BlockManager
+
+
+class BlockIdRecyclingTest(unittest.TestCase):
+    def setUp(self):
+        self.bm = BlockManager(None)
+
+    def add_block(self, holders):
+        block_id = self.bm.allocate_block_for(1, 0).get_id()
+        for datanode_id in holders:
+            self.bm.add_block_loc(block_id, datanode_id)
+        return block_id
+
+    # confirm every deletion the datanodes were asked for
+    def confirm_all(self):
+        for datanode_id in list(self.bm.invalidate_queues):
+            self.bm.confirm_deleted(datanode_id, self.bm.get_invalidate_batch(datanode_id, 1000))
+
+    def test_id_without_replicas_is_freed_at_once(self):
+        block_id = self.add_block([])
+        self.bm.delete_block(block_id)
+        self.assertEqual(self.bm.get_free_block_ids(), [block_id])
+        self.assertEqual(self.bm.allocate_block_for(1, 0).get_id(), block_id)
+
+    def test_id_freed_once_every_replica_is_deleted(self):
+        block_id = self.add_block([1, 2])
+        self.bm.delete_block(block_id)
+        self.assertEqual(self.bm.get_free_block_ids(), [])
+        self.bm.confirm_deleted(1, [block_id])
+        self.assertEqual(self.bm.get_free_block_ids(), [])
+        # a second confirmation from the same datanode changes nothing
+        self.bm.confirm_deleted(1, [block_id])
+        self.assertEqual(self.bm.get_free_block_ids(), [])
+        self.bm.confirm_deleted(2, [block_id])
+        self.assertEqual(self.bm.get_free_block_ids(), [block_id])
+
+    def test_excess_replica_deleted_after_its_block(self):
+        block_id = self.add_block([1])
+        self.bm.remove_excess_replica(block_id, 1)
+        self.bm.delete_block(block_id)
+        self.assertEqual(self.bm.get_free_block_ids(), [])
+        self.confirm_all()
+        self.assertEqual(self.bm.get_free_block_ids(), [block_id])
+
+        # the recycled id is handed out once
+        ids = [self.bm.allocate_block_for(1, 0).get_id() for _ in range(3)]
+        self.assertEqual(ids[0], block_id)
+        self.assertEqual(len(set(ids)), 3)
+
+    def test_excess_and_live_replicas_deleted_with_block(self):
+        block_id = self.add_block([1, 2])
+        self.bm.remove_excess_replica(block_id, 1)
+        self.bm.delete_block(block_id)
+        self.bm.confirm_deleted(1, [block_id])
+        self.assertEqual(self.bm.get_free_block_ids(), [])
+        self.bm.confirm_deleted(2, [block_id])
+        self.assertEqual(self.bm.get_free_block_ids(), [block_id])
+
+    def test_id_of_removed_datanode_is_not_recycled(self):
+        block_id = self.add_block([1])
+        self.bm.delete_block(block_id)
+        self.bm.remove_datanode(1)
+        self.bm.confirm_deleted(1, [block_id])
+        self.assertEqual(self.bm.get_free_block_ids(), [])
+        self.assertNotEqual(self.bm.allocate_block_for(1, 0).get_id(), block_id)
+
+    def test_ids_are_never_allocated_twice(self):
+        live = set()
+        for i in range(200):
+            block_id = self.add_block([i % 3])
+            self.assertNotIn(block_id, live)
+            live.add(block_id)
+            if i % 4 == 0:
+                self.bm.remove_excess_replica(block_id, i % 3)
+            if i % 2 == 0:
+                self.bm.delete_block(block_id)
+                live.discard(block_id)
+            if i % 5 == 0:
+                self.confirm_all()
+            free = self.bm.get_free_block_ids()
+            self.assertEqual(len(free), len(set(free)))
+            self.assertFalse(live & set(free))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,76 @@
+import asyncio
+import os
+import tempfile
+import unittest
+
+from edfs.block_scanner import BlockScanner
+from edfs.config import *
+
+
+class FakeDataNode:
+    name = "A"
+
+    def __init__(self, block_ids, failures):
+        self.block_ids = block_ids
+        # report_bad_blocks fails this many times before the namenode takes reports
+        self.failures = failures
+        self.reported = []
+
+    def get_all_block_ids(self):
+        return self.block_ids
+
+    def get_num_active_requests(self):
+        return 0
+
+    async def report_bad_blocks(self, block_ids):
+        if self.failures > 0:
+            self.failures -= 1
+            raise ConnectionRefusedError()
+        self.reported.append(block_ids)
+        return True
+
+
+class BlockScannerTest(unittest.TestCase):
+    def setUp(self):
+        self.cwd = os.getcwd()
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        os.chdir(self.tmp_dir.name)
+        os.makedirs(f'{DATANODE_DATA_DIR}/{FakeDataNode.name}')
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+        self.tmp_dir.cleanup()
+
+    def scan(self, datanode, corrupt):
+        async def scan_block(block_id):
+            return block_id not in corrupt
+
+        async def run():
+            scanner = BlockScanner(datanode)
+            scanner.scan_block = scan_block
+            scanner.start()
+            await asyncio.sleep(0.1)
+            scanner.close()
+            return scanner
+
+        return asyncio.run(run())
+
+    def test_corrupt_blocks_reported_after_namenode_comes_back(self):
+        datanode = FakeDataNode([1, 2, 3, 4], failures=1)
+        scanner = self.scan(datanode, corrupt={2, 4})
+        self.assertEqual(datanode.reported, [[2, 4]])
+        self.assertEqual(scanner.unreported_blocks, set())
+        self.assertEqual(scanner.get_stats()["blocks_scanned"], 4)
+
+    def test_missing_meta_file_is_skipped(self):
+        with open(f'{DATANODE_DATA_DIR}/{FakeDataNode.name}/{BLOCK_PREFIX}{"0" * 19}1', 'wb') as f:
+            f.write(b'data')
+
+        async def run():
+            return await BlockScanner(FakeDataNode([1], failures=0)).scan_block(1)
+
+        self.assertTrue(asyncio.run(run()))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,93 @@
+import asyncio
+import json
+import os
+import tempfile
+import unittest
+
+from edfs.block_manager import BlockManager
+from edfs.config import *
+from edfs.data_checksum import DataChecksum
+from edfs.edfs_datanode import EDFSDataNode
+from edfs.utils import PacketUtils
+
+BLOCK_ID = 7
+BYTES_PER_CHUNK = 512
+
+
+class DataNodeReadTest(unittest.TestCase):
+    def setUp(self):
+        self.cwd = os.getcwd()
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        os.chdir(self.tmp_dir.name)
+        os.makedirs(f'{DATANODE_DATA_DIR}/A')
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+        self.tmp_dir.cleanup()
+
+    def write_block(self, data, with_meta=True):
+        filename = f'{DATANODE_DATA_DIR}/A/{BlockManager.get_filename_from_block_id(BLOCK_ID)}'
+        with open(filename, 'wb') as f:
+            f.write(data)
+        if with_meta:
+            with open(f'{filename}{BLOCK_META_SUFFIX}', 'wb') as f:
+                f.write(DataChecksum.get_meta_header(BYTES_PER_CHUNK))
+                f.write(DataChecksum.compute(data, BYTES_PER_CHUNK))
+
+    # the response header, checksums and data sent for a read of [offset, offset + num_bytes)
+    def read(self, offset, num_bytes):
+        async def run():
+            datanode = EDFSDataNode(LOCAL_HOST, 0, "A")
+            server = await asyncio.start_server(datanode.handle_client, LOCAL_HOST, 0)
+            async with server:
+                reader, writer = await asyncio.open_connection(*server.sockets[0].getsockname()[:2])
+                request = {"cmd": CLI_DATANODE_CMD_READ, "block_id": BLOCK_ID, "offset": offset, "num_bytes": num_bytes}
+                writer.write(PacketUtils.encode(json.dumps(request).encode()))
+                await writer.drain()
+                response = json.loads((await PacketUtils.read_packet(reader)).decode())
+                rest = await reader.read()
+                writer.close()
+            num_checksums = DataChecksum.get_num_chunks(response.get("num_bytes"), BYTES_PER_CHUNK) if response.get("bytes_per_checksum") else 0
+            return response, rest[:num_checksums * DataChecksum.CHECKSUM_SIZE], rest[num_checksums * DataChecksum.CHECKSUM_SIZE:]
+
+        return asyncio.run(run())
+
+    def test_range_is_rounded_to_chunks(self):
+        data = os.urandom(2000)
+        self.write_block(data)
+        response, checksums, read = self.read(600, 500)
+        self.assertEqual((response["offset"], response["num_bytes"]), (512, 1024))
+        self.assertEqual(read, data[512:1536])
+        self.assertEqual(checksums, DataChecksum.compute(read, BYTES_PER_CHUNK))
+
+    def test_last_chunk_ends_at_replica_end(self):
+        data = os.urandom(2000)
+        self.write_block(data)
+        response, checksums, read = self.read(1800, 1000)
+        self.assertEqual((response["offset"], response["num_bytes"]), (1536, 464))
+        self.assertEqual(read, data[1536:])
+        self.assertEqual(checksums, DataChecksum.compute(read, BYTES_PER_CHUNK))
+
+    def test_offset_past_replica_end(self):
+        self.write_block(os.urandom(100))
+        response, checksums, read = self.read(1000, 512)
+        self.assertTrue(response["success"])
+        self.assertGreaterEqual(response["num_bytes"], 0)
+        self.assertEqual(len(read), response["num_bytes"])
+        self.assertLessEqual(response["offset"] + response["num_bytes"], 100)
+
+    def test_block_without_meta_is_not_rounded(self):
+        data = os.urandom(2000)
+        self.write_block(data, with_meta=False)
+        response, checksums, read = self.read(600, 500)
+        self.assertEqual((response["offset"], response["num_bytes"], response["bytes_per_checksum"]), (600, 500, 0))
+        self.assertEqual(read, data[600:1100])
+
+    def test_missing_block(self):
+        response, _, read = self.read(0, 100)
+        self.assertEqual(response, {"success": False, "error": ERR_FILE_NOT_FOUND})
+        self.assertEqual(read, b"")
+
+
+if __name__ == "__main__":
+    unittest.main()
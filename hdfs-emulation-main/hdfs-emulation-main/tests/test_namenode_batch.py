@@ -0,0 +1,59 @@
+import asyncio
+import os
+import tempfile
+import unittest
+
+from edfs.config import *
+from edfs.edfs_namenode import EDFSNameNode
+
+WRITER_IP = "10.0.0.9"
+
+
+class NameNodeBatchTest(unittest.TestCase):
+    def setUp(self):
+        self.cwd = os.getcwd()
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        os.chdir(self.tmp_dir.name)
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+        self.tmp_dir.cleanup()
+
+    # the responses to a batch sent from client_ip to a namenode with a datanode
+    # on the writer and two others
+    def batch(self, make_requests, client_ip=WRITER_IP):
+        async def run():
+            namenode = EDFSNameNode()
+            for i, ip in enumerate([WRITER_IP, LOCAL_HOST, LOCAL_HOST]):
+                datanode_info = namenode.dnm.register(ip, 30000 + i, "ABC"[i])
+                datanode_info.update_heartbeat(1 << 40, 0, 1 << 40, 0)
+                namenode.placement_policy.update_datanode(datanode_info)
+            responses = []
+            for requests in make_requests:
+                response = await namenode.dispatch({"cmd": CMD_BATCH, "requests": requests(responses), "client_ip": client_ip})
+                self.assertTrue(response.get("success"))
+                responses += response.get("responses")
+            await namenode.close()
+            return responses
+
+        return asyncio.run(run())
+
+    def test_failed_sub_request_does_not_abort_batch(self):
+        responses = self.batch([lambda _: [
+            {"cmd": CMD_CREATE, "path": "/a"},
+            {"cmd": CMD_CREATE},
+            {"cmd": CMD_CREATE, "path": "/b"},
+        ]])
+        self.assertEqual([response.get("success") for response in responses], [True, False, True])
+        self.assertIn("error", responses[1])
+
+    def test_sub_requests_placed_on_writer(self):
+        responses = self.batch([
+            lambda _: [{"cmd": CMD_CREATE, "path": "/a"}],
+            lambda responses: [{"cmd": CMD_ADD_BLOCK, "inode_id": responses[0].get("inode_id")}],
+        ])
+        self.assertEqual(responses[1].get("blk_locs_info")[0].get("ip"), WRITER_IP)
+
+
+if __name__ == "__main__":
+    unittest.main()
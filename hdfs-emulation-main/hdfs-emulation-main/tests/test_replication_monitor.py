@@ -0,0 +1,89 @@
+import time
+import unittest
+
+from edfs.block_manager import BlockManager
+from edfs.block_placement_policy import BlockPlacementPolicy
+from edfs.config import *
+from edfs.datanode_info import DataNodeManager
+from edfs.fsimage import FSImage
+from edfs.inode_manager import InodeManager
+from edfs.replication_monitor import ReplicationMonitor
+
+
+class ReplicationMonitorTest(unittest.TestCase):
+    def setUp(self):
+        self.dnm = DataNodeManager()
+        self.placement_policy = BlockPlacementPolicy.create("weighted", self.dnm)
+        self.datanodes = {}
+        for i, name in enumerate("ABCD"):
+            datanode_info = self.dnm.register(LOCAL_HOST, 30000 + i, name)
+            datanode_info.update_heartbeat(1 << 40, 0, 1 << 40, 0)
+            self.placement_policy.update_datanode(datanode_info)
+            self.datanodes[name] = datanode_info
+        self.bm = BlockManager(None)
+        self.im = InodeManager(FSImage.create_empty(), self.bm)
+        self.monitor = ReplicationMonitor(self.im, self.bm, self.dnm, self.placement_policy)
+
+    def add_block(self, replication, holders):
+        inode = self.im.create_file(self.im.get_inode_from_path("/"), f'f{len(self.bm.id_to_block)}')
+        inode.replication = replication
+        blk = self.bm.allocate_block_for(inode.get_id(), 0)
+        self.im.add_block_to(inode.get_id(), blk.get_id())
+        for name in holders:
+            self.bm.add_block_loc(blk.get_id(), self.datanodes[name].get_id())
+        return blk.get_id()
+
+    def make_busy(self, name):
+        for _ in range(REPLICATION_MAX_STREAMS):
+            self.bm.add_pending_replication(self.bm.allocate_block_for(0, 0).get_id(), time.monotonic(), self.datanodes[name].get_id(), [])
+
+    # the transfer scheduled for block_id, dropped so that it does not count
+    # against the stream limit of its source in the next round
+    def schedule(self, block_id):
+        self.monitor.update_queues()
+        self.monitor.schedule_replications()
+        return self.bm.get_pending_replications().pop(block_id, None)
+
+    def test_busy_holder_is_never_a_target(self):
+        self.make_busy("A")
+        for _ in range(50):
+            block_id = self.add_block(3, "AB")
+            _, source_id, target_ids = self.schedule(block_id)
+            self.assertEqual(source_id, self.datanodes["B"].get_id())
+            self.assertNotIn(self.datanodes["A"].get_id(), target_ids)
+            self.assertNotIn(self.datanodes["B"].get_id(), target_ids)
+
+    def test_nothing_scheduled_when_every_holder_is_busy(self):
+        self.make_busy("A")
+        block_id = self.add_block(2, "A")
+        self.assertIsNone(self.schedule(block_id))
+        self.assertIn(block_id, self.monitor.queues[ReplicationMonitor.QUEUE_HIGHEST_PRIORITY])
+
+    def test_corrupt_holder_is_not_a_target(self):
+        for _ in range(50):
+            block_id = self.add_block(3, "AB")
+            self.bm.mark_corrupt(block_id, self.datanodes["C"].get_id())
+            _, _, target_ids = self.schedule(block_id)
+            self.assertEqual(target_ids, {self.datanodes["D"].get_id()})
+
+    def test_corrupt_replica_deleted_once_block_is_replicated(self):
+        corrupt_id = self.datanodes["A"].get_id()
+        block_id = self.add_block(2, "AB")
+        self.bm.mark_corrupt(block_id, corrupt_id)
+        self.assertIsNotNone(self.schedule(block_id))
+        # the only other replica is kept while the block is under-replicated
+        self.assertEqual(self.bm.get_invalidate_batch(corrupt_id, 10), [])
+
+        self.bm.add_block_loc(block_id, self.datanodes["C"].get_id())
+        self.schedule(block_id)
+        self.schedule(block_id)
+        self.assertEqual(self.bm.get_invalidate_batch(corrupt_id, 10), [block_id])
+
+        self.bm.confirm_deleted(corrupt_id, [block_id])
+        self.assertNotIn(block_id, self.bm.corrupt_replicas)
+        self.assertEqual(self.bm.get_num_pending_deletes(), 0)
+        self.assertEqual(self.bm.get_free_block_ids(), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
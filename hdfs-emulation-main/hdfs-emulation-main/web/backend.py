@@ -16,8 +16,11 @@ def root():
 
 @app.route("/files",  methods=["GET"])
 async def get_all_files():
+    start_after = request.args.get("start_after")
+    limit = request.args.get("limit", type=int)
     edfs_client = await EDFSClient.create()
-    files = await edfs_client.get_all_files()
+    files = await edfs_client.get_all_files(start_after, limit)
+    edfs_client.close()
     return files
 
 @app.route("/file/<path:filepath>",  methods=["GET"])
@@ -25,6 +28,7 @@ async def get_file(filepath):
     print(filepath)
     edfs_client = await EDFSClient.create()
     data = await edfs_client.get_file(filepath)
+    edfs_client.close()
     if not data.get("success"):
          response = make_response("", 404)
     else:
@@ -49,6 +53,7 @@ async def upload_file(des=""):
         response = make_response({"success": True}, 200)
     else:
         response = make_response({"success": False}, 200)
+    edfs_client.close()
 
     os.remove(src)
 
@@ -1,32 +1,60 @@
 const tree = document.getElementById('tree');
 
-async function getFiles() {
-  const response = await fetch('http://127.0.0.1:8080/files');
-  console.log(response);
-  const data = await response.json();
+// path -> element of a directory already rendered, "" is the root
+const dirs = {};
 
-  return data.children;
+async function getFiles(startAfter) {
+  let url = 'http://127.0.0.1:8080/files';
+  if (startAfter !== undefined) {
+    url += `?start_after=${encodeURIComponent(startAfter)}`;
+  }
+  const response = await fetch(url);
+  return await response.json();
 }
 
-function createTree(parent, children) {
-  const ul = document.createElement('ul');
-  children.forEach(child => {
+function getChildList(parent) {
+  let ul = parent.querySelector(':scope > ul');
+  if (ul === null) {
+    ul = document.createElement('ul');
+    if (parent !== tree) {
+      parent.classList.add('parent_li');
+    }
+    parent.appendChild(ul);
+  }
+  return ul;
+}
+
+function addEntries(entries) {
+  entries.forEach(entry => {
+    if (entry.depth === 0) {
+      dirs[entry.path] = tree;
+      return;
+    }
+    const parentPath = entry.path.substring(0, entry.path.lastIndexOf('/'));
     const li = document.createElement('li');
     const span = document.createElement('span');
-    span.textContent = child.name;
+    span.textContent = entry.name;
     li.appendChild(span);
-    ul.appendChild(li);
-    if (child.children.length > 0) {
-      li.classList.add('parent_li');
-      createTree(li, child.children);
+    getChildList(dirs[parentPath]).appendChild(li);
+    if (entry.type === 'DIRECTORY') {
+      dirs[entry.path] = li;
     }
   });
-  parent.appendChild(ul);
 }
 
-getFiles().then(children => {
-    createTree(tree, children);
-});
+// render each page as it arrives, resuming after the last path of the previous one
+async function loadTree() {
+  let startAfter;
+  while (true) {
+    const data = await getFiles(startAfter);
+    if (!data.success) break;
+    addEntries(data.entries);
+    if (!data.has_more) break;
+    startAfter = data.entries[data.entries.length - 1].path;
+  }
+}
+
+loadTree();
 
 // async function getFile() {
 //   const response = await fetch("http://127.0.0.1:8080/file/user/edfs.py");